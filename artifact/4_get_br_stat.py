@@ -5,7 +5,7 @@ sys.path.append("../superSymbolizer")
 from SuperSymbolizer import SuperSymbolizer
 from consts import *
 
-ExpTask = namedtuple('ExpTask', ['dataset', 'input_dir', 'output_dir', 'prefix', 'bin_name'])
+ExpTask = namedtuple('ExpTask', ['dataset', 'input_dir', 'output_dir', 'prefix', 'bin_name', 'opt_level'])
 
 def parse_arguments():
     parser = argparse.ArgumentParser(description='manager')
@@ -17,6 +17,7 @@ def parse_arguments():
     parser.add_argument('--target', type=str)
     parser.add_argument('--blacklist', nargs='+')
     parser.add_argument('--whitelist', nargs='+')
+    parser.add_argument('--optimization', type=int, default=0, help='Optimization level of the instrumentation (0-4)')
     args = parser.parse_args()
 
     # Sanitizing arguments
@@ -51,7 +52,7 @@ def prepare_tasks(args, package):
 
                     bin_dir = os.path.join(input_base, 'bin')
                     out_dir = os.path.join(output_base, filename)
-                    tasks.append(ExpTask(args.dataset, bin_dir, out_dir, prefix, filename))
+                    tasks.append(ExpTask(args.dataset, bin_dir, out_dir, prefix, filename, args.optimization))
 
     return tasks
 
@@ -71,7 +72,7 @@ def run_task(task):
         return
     print(out_path)
 
-    sym = SuperSymbolizer(bin_path, b2r2_func_path, 0, 'intel')
+    sym = SuperSymbolizer(bin_path, b2r2_func_path, task.opt_level, 'intel')
     sym.symbolize(True)
     sym.report_statistics(out_path)
 
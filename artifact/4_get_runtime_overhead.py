@@ -1,4 +1,4 @@
-import argparse, os, glob
+import argparse, os, glob, sys
 from collections import namedtuple
 from consts import *
 
@@ -7,6 +7,7 @@ ExpTask = namedtuple('ExpTask', ['dataset', 'package', 'compiler', 'data_dir', '
 def parse_arguments():
     parser = argparse.ArgumentParser(description='manager')
     parser.add_argument('dataset', type=str, default='setA', help='Select dataset (setA, setB, setC)')
+    parser.add_argument('--asan', action='store_true', help='Also run the binaries hardened by suri.py --asan')
     args = parser.parse_args()
 
     # Sanitizing arguments
@@ -47,7 +48,13 @@ def get_script_name(task):
     else:
         return 'run2017_%s.sh' % task.bin_name
 
-def prepare_script(task, script_dir, script_name):
+def get_artifact_image(dataset):
+    if dataset in ['setA', 'setC']:
+        return 'suri_artifact:v1.0'
+    else:
+        return 'suri_artifact_ubuntu18.04:v1.0'
+
+def prepare_script(task, script_dir, script_name, tool_name):
     script_path = os.path.join(script_dir, script_name)
 
     with open(script_path, 'w') as f:
@@ -59,6 +66,9 @@ def prepare_script(task, script_dir, script_name):
         f.write('cd /%s/\n' % task.package)
         f.write('source shrc\n')
         f.write('ulimit -s unlimited\n')
+        if tool_name == 'suri_asan':
+            # SPEC programs do not free everything before they exit
+            f.write('export ASAN_OPTIONS=detect_leaks=0\n')
         f.write('sleep 30\n')
         f.write('echo %s' % task.bin_name)
 
@@ -85,7 +95,7 @@ def run_test_suite(task, image, script_name, tool_name):
     data_dir = os.path.join(task.data_dir, tool_name)
     script_dir = os.path.join(task.script_dir, tool_name)
     os.system('mkdir -p %s' % script_dir)
-    prepare_script(task, script_dir, script_name)
+    prepare_script(task, script_dir, script_name, tool_name)
     log_dir = os.path.join(task.log_dir, tool_name)
     os.system('mkdir -p %s' % log_dir)
     log_path = os.path.join(log_dir, '%s.txt' % task.bin_name)
@@ -96,6 +106,30 @@ def run_test_suite(task, image, script_name, tool_name):
 
     run_in_docker(image, data_dir, script_dir, log_dir, cmd)
 
+def build_suri_asan(task):
+    # rewrite the original binary with suri.py --asan into <data_dir>/suri_asan
+    asan_dir = os.path.join(task.data_dir, 'suri_asan')
+    asan_path = os.path.join(asan_dir, task.bin_name)
+    if os.path.exists(asan_path):
+        return
+    orig_dir = os.path.join('.', task.data_dir, 'original')
+    build_dir = os.path.join('.', 'stat', 'runtime', 'asan_build', task.dataset, task.package, task.bin_name)
+    os.system('mkdir -p %s %s' % (asan_dir, build_dir))
+    cmd = 'python3 /project/SURI/suri.py /input/%s --ofolder /output/ --asan > /output/log.txt 2>&1' % task.bin_name
+    docker_cmd = 'docker run --rm -v %s:/input -v %s:/output %s sh -c "%s"' % (orig_dir, build_dir, get_artifact_image(task.dataset), cmd)
+    print(docker_cmd)
+    sys.stdout.flush()
+    os.system(docker_cmd)
+    my_path = os.path.join(build_dir, 'my_%s' % task.bin_name)
+    if os.path.exists(my_path):
+        os.system('cp %s %s' % (my_path, asan_path))
+
+def run_asan_task(task):
+    image = get_docker_image(task.dataset)
+    script_name = get_script_name(task)
+    build_suri_asan(task)
+    run_test_suite(task, image, script_name, 'suri_asan')
+
 def run_task(task):
     image = get_docker_image(task.dataset)
     script_name = get_script_name(task)
@@ -121,6 +155,8 @@ def run_package(args, package):
     tasks = prepare_tasks(args, package)
     for task in tasks:
         run_task(task)
+        if args.asan:
+            run_asan_task(task)
 
 def run(args):
     for package in PACKAGES_SPEC:
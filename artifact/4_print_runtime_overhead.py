@@ -7,6 +7,7 @@ ExpTask = namedtuple('ExpTask', ['dataset', 'bin_name'])
 def parse_arguments():
     parser = argparse.ArgumentParser()
     parser.add_argument('dataset', type=str, default='setA', help='Select dataset (setA, setB, setC)')
+    parser.add_argument('--asan', action='store_true', help='Compare SURI with the binaries hardened by suri.py --asan')
     args = parser.parse_args()
 
     # Sanitizing arguments
@@ -137,8 +138,33 @@ def collect_setC(args):
 
     return data
 
+def collect_asan(args):
+    data = {}
+    for package in PACKAGES_SPEC:
+        tasks = prepare_tasks(args, package)
+
+        num_bins = 0
+        suri_overhead = 0.0
+        target_overhead = 0.0
+        for task in tasks:
+            d_original = get_data(task, package, 'original')
+            d_suri = get_data(task, package, 'suri')
+            d_target = get_data(task, package, 'suri_asan') # Comparison target is SURI with ASan
+            if d_original is None or d_suri is None or d_target is None:
+                continue
+
+            num_bins += 1
+            suri_overhead += (d_suri - d_original) / d_original
+            target_overhead += (d_target - d_original) / d_original
+
+        data[package] = num_bins, suri_overhead, target_overhead
+
+    return data
+
 # Collect data generated by 4_get_runtime_overhead.py.
 def collect(args):
+    if args.asan:
+        return collect_asan(args)
     if args.dataset == 'setA':
         return collect_setA(args)
     elif args.dataset == 'setB':
@@ -148,8 +174,11 @@ def collect(args):
 
 ################################
 
-def print_header(dataset):
-    if dataset == 'setA':
+def print_header(args):
+    dataset = args.dataset
+    if args.asan:
+        print(FMT_RUNTIME_HEADER_C % ('', 'suri', 'suri(asan)'))
+    elif dataset == 'setA':
         print(FMT_RUNTIME_HEADER_AB % ('', 'suri', 'ddisasm'))
     elif dataset == 'setB':
         print(FMT_RUNTIME_HEADER_AB % ('', 'suri', 'egalito'))
@@ -158,7 +187,7 @@ def print_header(dataset):
 
 # Report the percentage of average runtime overheads for Table 4 of our paper.
 def report(args, data):
-    print_header(args.dataset)
+    print_header(args)
     print(FMT_LINE)
 
     total_num_bins = 0
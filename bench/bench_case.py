@@ -0,0 +1,43 @@
+'''
+Runs the symbolizer on one benchmark case and writes the time of each step
+as JSON with its peak RSS (KiB). run_bench.py runs it in a fresh process
+per run so that the peak memory of every run can be measured.
+'''
+import json
+import resource
+import time
+
+from superSymbolizer.SuperSymbolizer import SuperSymbolizer
+
+
+import argparse
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Symbolize one benchmark case')
+    parser.add_argument('bin_file', type=str)
+    parser.add_argument('meta_file', type=str)
+    parser.add_argument('reassembly_file', type=str)
+    parser.add_argument('timing_file', type=str)
+    parser.add_argument('--optimization', type=int, default=3)
+    parser.add_argument('--jobs', type=int, default=1)
+    parser.add_argument('--stream-meta', dest='stream_meta', action='store_true')
+    parser.add_argument('--profile', type=int, default=0)
+
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    sym = SuperSymbolizer(args.bin_file, args.meta_file, args.optimization, 'intel', args.stream_meta, args.profile)
+    load_end = time.perf_counter()
+    sym.symbolize(True, jobs=args.jobs)
+    symbolize_end = time.perf_counter()
+    sym.create_reassem_file(args.reassembly_file)
+    end = time.perf_counter()
+
+    # this process, or one of the --jobs workers
+    peak_rss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                   resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+    with open(args.timing_file, 'w') as fd:
+        json.dump({'load':load_end - start,
+                   'symbolize':symbolize_end - load_end,
+                   'create_reassem_file':end - symbolize_end,
+                   'peak_rss':peak_rss}, fd)
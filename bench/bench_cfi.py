@@ -0,0 +1,113 @@
+'''
+Benchmark of the CFI extraction (CFIInfo) on an exception-heavy C++
+program: the program of the `exceptions` case, where every function has a
+try/catch and so an LSDA. CFIInfo is timed as it is and with the former
+work per FDE: .eh_frame and .gcc_except_table looked up and read again,
+the CIE header and the LSDA parsed again. Both must give the same tables.
+'''
+import multiprocessing
+import os
+import subprocess
+import time
+
+from superSymbolizer.lib.CFIInfo import CFIInfo, CIEHeader
+from superSymbolizer.lib.ExceptTable import GCCExceptTable
+
+from cases import CFLAGS, gen_exceptions
+
+BENCH_DIR = os.path.dirname(os.path.realpath(__file__))
+
+
+class FormerExceptTable(GCCExceptTable):
+    def get_gcc_except_table(self):
+        for section in self.elf.elffile.iter_sections():
+            if section.name == '.gcc_except_table':
+                return section.data(), section.header.sh_addr
+        return '', 0
+
+    def parse(self, addr):
+        offset = addr - self.sec_addr
+        if offset > len(self.section):
+            offset = offset & 0xffffffff
+        lsda, _ = self.parse_LSDA(self.section[offset:])
+        return lsda
+
+
+class FormerCFIInfo(CFIInfo):
+
+    def get_eh_frame(self):
+        section = self.get_eh_frame_section()
+        return section.data(), section.header.sh_addr
+
+    def get_cie_header(self, c_offset):
+        data, _ = self.get_eh_frame()
+        return CIEHeader(data[c_offset:])
+
+    def get_lsda(self, addr):
+        return FormerExceptTable(self.elf).parse(addr)
+
+
+def build(work_dir, count):
+    bin_file = os.path.join(work_dir, 'cfi-%d'%(count))
+    if os.path.exists(bin_file):
+        return bin_file
+    os.makedirs(work_dir, exist_ok=True)
+    src_file = bin_file + '.cpp'
+    with open(src_file, 'w') as fd:
+        fd.write(gen_exceptions(count))
+    subprocess.run(['/usr/bin/g++-11'] + CFLAGS + [src_file, '-o', bin_file], check=True)
+    return bin_file
+
+def get_fields(obj):
+    return None if obj is None else sorted(vars(obj).items())
+
+def summarize(cfi):
+    # what the symbolizer uses of every FDE
+    fdes = []
+    for fde in cfi.get_fde_tbl():
+        tbl = fde.except_tbl
+        if tbl:
+            tbl = (tbl['entry_point'], tbl['gcc_except_table_addr'], tbl['f_addr'],
+                   get_fields(tbl['header']), get_fields(tbl['csHeader']),
+                   [get_fields(region) for region in tbl['region_tbl']],
+                   [get_fields(action) for action in tbl['action'].tbl] if tbl['action'] else None,
+                   [get_fields(entry) for entry in tbl['type_tbl'].tbl] if tbl['type_tbl'] else None)
+        fdes.append((fde.start_proc, fde.end_proc, fde.desc_list, sorted(fde.cfi_dict.items()), tbl))
+    return fdes
+
+def run(cls, bin_file, repeat):
+    # in a fresh process, so that the tables of the other run do not slow
+    # down the garbage collector
+    with multiprocessing.get_context('fork').Pool(1) as pool:
+        return pool.apply(run_child, (cls, bin_file, repeat))
+
+def run_child(cls, bin_file, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        cfi = cls(bin_file)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, summarize(cfi)
+
+
+import argparse
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the CFI extraction')
+    parser.add_argument('--functions', type=int, default=10000)
+    parser.add_argument('--bin', type=str, help='benchmark this binary instead of a generated one')
+    parser.add_argument('--repeat', type=int, default=1, help='report the best of N runs')
+    parser.add_argument('--work-dir', type=str, default=os.path.join(BENCH_DIR, 'work'))
+
+    args = parser.parse_args()
+
+    bin_file = args.bin or build(args.work_dir, args.functions)
+
+    former, former_fdes = run(FormerCFIInfo, bin_file, args.repeat)
+    cached, fdes = run(CFIInfo, bin_file, args.repeat)
+    assert former_fdes == fdes, 'the CFI tables differ'
+
+    print('[+] %s: %d FDEs, %d with an LSDA'%(bin_file, len(fdes), len([fde for fde in fdes if fde[4]])))
+    print('%10s %10s %9s'%('former(s)', 'cached(s)', 'speedup'))
+    print('%10.3f %10.3f %8.2fx'%(former, cached, former / cached))
@@ -0,0 +1,113 @@
+'''
+Micro-benchmark of construct_CFG on synthetic superset CFGs of growing
+size. It checks that the result matches the former list-based version and
+shows how both scale with the number of blocks.
+'''
+import random
+import time
+
+from superSymbolizer.lib.CFGSerializer import construct_CFG
+from superSymbolizer.lib.Misc import is_unsupported_instruction
+
+
+def construct_CFG_lists(root, BBLs, syntax, visit_log):
+    # the list-based version construct_CFG replaced
+    leaders = []
+    pred_dict = {}
+    droppedBBLs = []
+    queue = [("", root)]
+
+    history = set()
+    while queue:
+        (pred, cur) = queue.pop()
+
+        if cur not in pred_dict:
+            pred_dict[cur] = []
+        if pred not in pred_dict[cur]:
+            pred_dict[cur].append(pred)
+
+        if cur in leaders:
+            continue
+
+        bValid = True
+        if cur not in visit_log:
+            for inst in BBLs[cur]['Code']:
+                if is_unsupported_instruction(inst['Disassem'], syntax):
+                    bValid = False
+            if bValid:
+                visit_log[cur] = True
+            else:
+                visit_log[cur] = False
+        bValid = visit_log[cur]
+        if bValid:
+            leaders.append(cur)
+        else:
+            droppedBBLs.append(cur)
+
+        if cur not in BBLs:
+            continue
+
+        for edge in BBLs[cur]['Edges']:
+            if edge['EdgeType'] in ['IntraCJmpTrueEdge', 'IntraCJmpFalseEdge', 'IntraJmpEdge', 'CallEdge']:
+                continue
+
+            if (edge['From'], edge['To']) not in history:
+                queue.append((edge['From'], edge['To']))
+                history.add((edge['From'], edge['To']))
+
+    if root not in leaders:
+        return [], droppedBBLs + leaders
+    return leaders, droppedBBLs
+
+
+def gen_superset(n_blocks, seed):
+    '''
+    A chain of fall-through blocks with random conditional jumps, a few
+    blocks of unsupported instructions and many predecessors per block, as
+    in the superset CFG of obfuscated or data-in-code heavy functions.
+    '''
+    rand = random.Random(seed)
+    addrs = [hex(0x1000 + idx * 4) for idx in range(n_blocks)]
+    BBLs = dict()
+    for idx, addr in enumerate(addrs):
+        if rand.random() < 0.02:
+            code = [{'Addr':addr, 'Disassem':'lock neg qword ptr [RAX]'}]
+        else:
+            code = [{'Addr':addr, 'Disassem':'add RAX, 0x1'}, {'Addr':addr, 'Disassem':'cmp RAX, RBX'}]
+        edges = []
+        if idx + 1 < n_blocks:
+            edges.append({'From':addr, 'To':addrs[idx+1], 'EdgeType':'InterCJmpFalseEdge'})
+        for _ in range(3):
+            edges.append({'From':addr, 'To':addrs[rand.randrange(n_blocks)], 'EdgeType':'InterCJmpTrueEdge'})
+        if rand.random() < 0.1:
+            edges.append({'From':addr, 'To':'0x10', 'EdgeType':'CallEdge'})
+        BBLs[addr] = {'Addr':addr, 'Code':code, 'Edges':edges}
+    return addrs[0], BBLs
+
+def measure(fn, root, BBLs, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(root, BBLs, 'intel', dict())
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+
+import argparse
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark construct_CFG')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 2000, 4000, 8000, 16000])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+
+    args = parser.parse_args()
+
+    print('%8s %12s %12s %9s'%('blocks', 'lists(s)', 'sets(s)', 'speedup'))
+    for size in args.sizes:
+        root, BBLs = gen_superset(size, args.seed)
+        old_time, old_result = measure(construct_CFG_lists, root, BBLs, args.repeat)
+        new_time, new_result = measure(construct_CFG, root, BBLs, args.repeat)
+        assert old_result == new_result, 'construct_CFG differs from the list-based version on %d blocks'%(size)
+        print('%8d %12.4f %12.4f %8.1fx'%(size, old_time, new_time, old_time / new_time))
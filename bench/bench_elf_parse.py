@@ -0,0 +1,102 @@
+'''
+Benchmark of the ELF decoding of ElfBricks on a large binary: the
+zero-copy decoding (a read-only map of the file, structures decoded at an
+offset) against the former one, which read the whole file and copied the
+rest of the buffer into a ctypes string buffer on every Unpack. The binary
+is a generated program with many functions and a large .rodata blob, and
+both decodings are checked to give the same sections and symbols.
+'''
+import gc
+import os
+import subprocess
+import time
+import tracemalloc
+from ctypes import create_string_buffer, cast, pointer, sizeof, POINTER
+
+from superSymbolizer import ElfBricks
+from superSymbolizer.lib.ElfDef import ELFHeader, Elf64_Sym, Elf64_VernIdx, Elf64_Verneed, Elf64_Vernaux
+
+BENCH_DIR = os.path.dirname(os.path.realpath(__file__))
+
+
+def gen_program(n_funs, blob_mib):
+    lines = ['#include <stdio.h>']
+    for idx in range(n_funs):
+        lines.append('int f_%d(int x) { return x * %d + %d; }'%(idx, idx, idx % 7))
+    # the blob goes to .rodata without making gcc parse a huge initializer
+    lines += ['asm(".section .rodata\\n.globl g_blob\\ng_blob: .fill %d, 1, 7\\n.text\\n");'%(blob_mib << 20),
+              'extern const char g_blob[];',
+              'int main(int argc, char **argv) {',
+              '    printf("%%d\\n", f_0(argc) + f_%d(argc) + g_blob[argc]);'%(n_funs - 1),
+              '    return 0;',
+              '}']
+    return '\n'.join(lines) + '\n'
+
+def build(work_dir, n_funs, blob_mib):
+    bin_file = os.path.join(work_dir, 'elf_%d_%d'%(n_funs, blob_mib))
+    if os.path.exists(bin_file):
+        return bin_file
+    os.makedirs(work_dir, exist_ok=True)
+    src_file = bin_file + '.c'
+    with open(src_file, 'w') as fd:
+        fd.write(gen_program(n_funs, blob_mib))
+    subprocess.run(['gcc-11', '-O0', '-fPIE', '-pie', src_file, '-o', bin_file], check=True)
+    return bin_file
+
+
+# the former call sites passed the whole file for the ELF header and the
+# rest of the table for these entries, and a slice of one entry otherwise
+REST_OF_BUFFER = [ELFHeader, Elf64_Sym, Elf64_VernIdx, Elf64_Verneed, Elf64_Vernaux]
+
+def copy_unpack(ctype, buf, offset=0):
+    # the former Unpack on the slice of the former call site
+    if ctype in REST_OF_BUFFER:
+        cstring = create_string_buffer(buf[offset:])
+    else:
+        cstring = create_string_buffer(buf[offset:offset + sizeof(ctype)])
+    return cast(pointer(cstring), POINTER(ctype)).contents
+
+def copy_cstr(strtab, offset):
+    return strtab[offset:].decode('utf-8').split('\x00')[0]
+
+def read_file(filename):
+    with open(filename, 'rb') as f:
+        return f.read()
+
+DECODERS = [('copy', (copy_unpack, copy_cstr, read_file)),
+            ('zero-copy', (ElfBricks.Unpack, ElfBricks.get_cstr, ElfBricks.map_file))]
+
+def parse(bin_file, decoder):
+    ElfBricks.Unpack, ElfBricks.get_cstr, ElfBricks.map_file = decoder
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    elf = ElfBricks.ElfBricks(bin_file)
+    elapsed = time.perf_counter() - start
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    summary = ([(sec.name, sec.OffsetRange, bytes(sec.header)) for sec in elf._sec_list],
+               {name: [bytes(entry) for entry in entries] for name, entries in elf._symtab_dict.items()},
+               elf._dt_needed_list, bytes(elf._rodata_sec[:4096]))
+    return elapsed, peak, retained, summary
+
+
+import argparse
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the ELF decoding of ElfBricks')
+    parser.add_argument('--functions', type=int, default=2000)
+    parser.add_argument('--blob', type=int, default=100, help='size of the .rodata blob in MiB')
+    parser.add_argument('--bin', type=str, help='benchmark this binary instead of a generated one')
+    parser.add_argument('--work-dir', type=str, default=os.path.join(BENCH_DIR, 'work'))
+
+    args = parser.parse_args()
+
+    bin_file = args.bin or build(args.work_dir, args.functions, args.blob)
+    print('[+] %s: %.1f MiB'%(bin_file, os.path.getsize(bin_file) / (1 << 20)))
+
+    results = [(name, parse(bin_file, decoder)) for name, decoder in DECODERS]
+    assert results[0][1][3] == results[1][1][3], 'the decodings differ'
+
+    print('%-10s %10s %12s %14s'%('decoding', 'time(s)', 'peak(MiB)', 'retained(MiB)'))
+    for name, (elapsed, peak, retained, _) in results:
+        print('%-10s %10.3f %12.1f %14.1f'%(name, elapsed, peak / (1 << 20), retained / (1 << 20)))
@@ -0,0 +1,166 @@
+'''
+Benchmark of the profile-guided layout (--layout). The program has many
+large functions and its hot loop only calls every STRIDE-th of them, so the
+hot code of the original binary, and of a reassembly in address order, is
+spread over many pages. The program is rewritten without and with the
+layout, and both binaries are run: the best time of --repeat runs, and the
+iTLB and i-cache misses when perf is installed.
+
+The profile lists the hot functions at their addresses in the original
+binary with their number of calls, which the program makes by construction.
+A profile recorded with perf is used the same way (see load_exec_profile).
+'''
+import json
+import os
+import shutil
+import subprocess
+import time
+
+from superSymbolizer import CustomCompiler
+from superSymbolizer.SuperSymbolizer import SuperSymbolizer
+
+from cases import Case
+
+BENCH_DIR = os.path.dirname(os.path.realpath(__file__))
+# statements in the body of every function
+BODY_OPS = 40
+# every STRIDE-th function is hot
+STRIDE = 16
+PERF_EVENTS = ['iTLB-load-misses', 'L1-icache-load-misses']
+
+
+def gen_layout(count):
+    '''
+    count large functions of which the hot loop of main calls every
+    STRIDE-th one, iterations times (the first argument).
+    '''
+    lines = ['#include <stdio.h>',
+             '#include <stdlib.h>',
+             'volatile long g_data[256];',
+             '']
+    for idx in range(count):
+        lines += ['__attribute__((noinline)) long big_%d(long x) {'%(idx),
+                  '    long s = x;']
+        for op in range(BODY_OPS):
+            lines += ['    s = s * %d + g_data[(s + %d) & 255];'%(op * 2 + 1, idx + op)]
+        lines += ['    return s;',
+                  '}']
+    lines += ['long (*g_funs[])(long) = {%s};'%(', '.join('big_%d'%(idx) for idx in range(count))),
+              'int main(int argc, char **argv) {',
+              '    long iterations = argc > 1 ? atol(argv[1]) : 1;',
+              '    long s = 0;',
+              '    for (long i = 0; i < iterations; i++)',
+              '        for (unsigned long f = 0; f < sizeof(g_funs) / sizeof(g_funs[0]); f += %d)'%(STRIDE),
+              '            s += g_funs[f](s + i);',
+              '    printf("%ld\\n", s);',
+              '    return 0;',
+              '}']
+    return '\n'.join(lines) + '\n'
+
+def write_profile(bin_file, profile_file, iterations):
+    '''
+    The entry of main and of every hot function with its number of calls.
+    '''
+    result = subprocess.run(['nm', '--defined-only', bin_file], stdout=subprocess.PIPE, check=True)
+    lines = []
+    for line in result.stdout.decode('utf-8').split('\n'):
+        fields = line.split()
+        if len(fields) != 3:
+            continue
+        addr, name = fields[0], fields[2]
+        if name == 'main' or (name.startswith('big_') and int(name[4:]) % STRIDE == 0):
+            lines.append('%s %d'%(addr, iterations))
+    with open(profile_file, 'w') as fd:
+        fd.write('\n'.join(lines) + '\n')
+
+def rewrite(bin_file, meta_file, out_dir, name, layout=None):
+    '''
+    Symbolize, assemble and fix up the binary; returns the path of the
+    rewritten binary.
+    '''
+    asm_file = os.path.join(out_dir, '%s.s'%(name))
+    sym = SuperSymbolizer(bin_file, meta_file, 3, 'intel', lean=True, layout=layout)
+    sym.symbolize(True)
+    sym.create_reassem_file(asm_file)
+    CustomCompiler.emitter(bin_file, asm_file, os.path.join(out_dir, name))
+    return os.path.join(out_dir, 'my_%s'%(name))
+
+def perf_stat(binary, iterations, stat_file):
+    '''
+    The counts of PERF_EVENTS in one run, or None for the events perf
+    cannot count here.
+    '''
+    cmd = ['perf', 'stat', '-x', ',', '-o', stat_file, '-e', ','.join(PERF_EVENTS), binary, str(iterations)]
+    subprocess.run(cmd, stdout=subprocess.DEVNULL, check=True)
+    counters = {event:None for event in PERF_EVENTS}
+    with open(stat_file) as fd:
+        for line in fd:
+            fields = line.strip().split(',')
+            if len(fields) > 2 and fields[2] in counters and fields[0].isdigit():
+                counters[fields[2]] = int(fields[0])
+    return counters
+
+def measure(binary, iterations, repeat, use_perf, stat_file):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([binary, str(iterations)], stdout=subprocess.DEVNULL, check=True)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    result = {'time':best}
+    if use_perf:
+        result.update(perf_stat(binary, iterations, stat_file))
+    return result
+
+def get_output(binary, iterations):
+    return subprocess.run([binary, str(iterations)], stdout=subprocess.PIPE, check=True).stdout
+
+def print_results(results):
+    print('%-10s %10s %9s'%('binary', 'time(s)', 'speedup') + ''.join(' %22s'%(event) for event in PERF_EVENTS))
+    base = results[0]['time']
+    for result in results:
+        counters = ''
+        for event in PERF_EVENTS:
+            value = result.get(event)
+            counters += ' %22s'%('-' if value is None else value)
+        print('%-10s %10.3f %8.2fx'%(result['binary'], result['time'], base / result['time']) + counters)
+
+
+import argparse
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the profile-guided layout')
+    parser.add_argument('--functions', type=int, default=2000)
+    parser.add_argument('--iterations', type=int, default=20000, help='iterations of the hot loop')
+    parser.add_argument('--repeat', type=int, default=5, help='report the best of N runs')
+    parser.add_argument('--no-perf', dest='perf', action='store_false', help='do not count the misses with perf')
+    parser.add_argument('--work-dir', type=str, default=os.path.join(BENCH_DIR, 'work'))
+    parser.add_argument('--output', type=str, help='write the results to this JSON file')
+
+    args = parser.parse_args()
+
+    case = Case('layout', gen_layout, args.functions)
+    bin_file, meta_file, _ = case.build(args.work_dir, 1.0)
+    case_dir = os.path.dirname(bin_file)
+    profile_file = os.path.join(case_dir, 'layout.profile')
+    stat_file = os.path.join(case_dir, 'perf.stat')
+    write_profile(bin_file, profile_file, args.iterations)
+
+    binaries = [('original', bin_file),
+                ('address', rewrite(bin_file, meta_file, case_dir, 'address')),
+                ('profile', rewrite(bin_file, meta_file, case_dir, 'profile', profile_file))]
+
+    use_perf = args.perf and shutil.which('perf') is not None
+    expected = get_output(bin_file, 1)
+    results = []
+    for name, binary in binaries:
+        assert get_output(binary, 1) == expected, 'the %s binary prints a different result'%(name)
+        result = measure(binary, args.iterations, args.repeat, use_perf, stat_file)
+        result['binary'] = name
+        results.append(result)
+
+    print_results(results)
+
+    if args.output:
+        with open(args.output, 'w') as fd:
+            json.dump({'functions':args.functions, 'iterations':args.iterations, 'results':results}, fd, indent=2)
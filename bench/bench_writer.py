@@ -0,0 +1,129 @@
+'''
+Benchmark of the printing of the reassembly file: the buffered AsmWriter
+against one print() call per line, as create_reassem_file did before. The
+program is symbolized once, then the reassembly is printed to a file, to a
+pipe and to an in-memory buffer, and every output is checked to be the same.
+'''
+import filecmp
+import io
+import os
+import subprocess
+import time
+
+from superSymbolizer.SuperSymbolizer import SuperSymbolizer
+from superSymbolizer.lib.AsmWriter import AsmWriter
+
+from cases import CASES
+
+BENCH_DIR = os.path.dirname(os.path.realpath(__file__))
+
+
+class PrintWriter:
+    # the per-line print() of the former write_code
+    def __init__(self, fd):
+        self.fd = fd
+
+    # the interface of ShardWriter, as in AsmWriter
+    n_shards = 1
+
+    def next_shard(self):
+        pass
+
+    def write_all(self, lines):
+        self.writelines(lines)
+
+    def write(self, line=''):
+        print(line, file=self.fd)
+
+    def writelines(self, lines):
+        for line in lines:
+            print(line, file=self.fd)
+
+    def close(self):
+        self.fd.flush()
+
+
+def print_reassem(sym, writer):
+    start = time.perf_counter()
+    sym.writer = writer
+    sym.print_reassem_code()
+    writer.close()
+    sym.writer = None
+    return time.perf_counter() - start
+
+def run_to_file(sym, filename, buffered):
+    with open(filename, 'w') as fd:
+        if buffered:
+            return print_reassem(sym, AsmWriter(fd))
+        return print_reassem(sym, PrintWriter(fd))
+
+def run_to_pipe(sym, filename, buffered):
+    # the other end of the pipe copies the assembly to filename
+    with open(filename, 'wb') as out:
+        proc = subprocess.Popen(['cat'], stdin=subprocess.PIPE, stdout=out)
+        if buffered:
+            elapsed = print_reassem(sym, AsmWriter(proc.stdin))
+        else:
+            elapsed = print_reassem(sym, PrintWriter(io.TextIOWrapper(proc.stdin)))
+        proc.stdin.close()
+        proc.wait()
+    return elapsed
+
+def run_to_buffer(sym, filename, buffered):
+    buf = io.StringIO()
+    if buffered:
+        elapsed = print_reassem(sym, AsmWriter(buf))
+    else:
+        elapsed = print_reassem(sym, PrintWriter(buf))
+    with open(filename, 'w') as fd:
+        fd.write(buf.getvalue())
+    return elapsed
+
+TARGETS = [('file', run_to_file), ('pipe', run_to_pipe), ('buffer', run_to_buffer)]
+
+
+import argparse
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the reassembly writer')
+    parser.add_argument('--case', choices=[case.name for case in CASES], default='functions')
+    parser.add_argument('--scale', type=float, default=1.0)
+    parser.add_argument('--bin', type=str, help='benchmark this binary instead of a generated case')
+    parser.add_argument('--meta', type=str, help='superset CFG metadata of --bin')
+    parser.add_argument('--repeat', type=int, default=3, help='report the best of N runs')
+    parser.add_argument('--work-dir', type=str, default=os.path.join(BENCH_DIR, 'work'))
+
+    args = parser.parse_args()
+
+    if args.bin:
+        bin_file, meta_file = args.bin, args.meta
+        out_dir = os.path.dirname(os.path.abspath(args.bin))
+    else:
+        case = [case for case in CASES if case.name == args.case][0]
+        bin_file, meta_file, _ = case.build(args.work_dir, args.scale)
+        out_dir = os.path.dirname(bin_file)
+
+    sym = SuperSymbolizer(bin_file, meta_file, 3, 'intel')
+    sym.symbolize(True)
+
+    reference = os.path.join(out_dir, 'writer_ref.s')
+    output = os.path.join(out_dir, 'writer_out.s')
+    run_to_file(sym, reference, False)
+    size = os.path.getsize(reference)
+
+    print('%-8s %10s %10s %9s %12s'%('target', 'print(s)', 'chunked(s)', 'speedup', 'MiB/s'))
+    for name, run in TARGETS:
+        times = []
+        for buffered in [False, True]:
+            best = None
+            for _ in range(args.repeat):
+                elapsed = run(sym, output, buffered)
+                assert filecmp.cmp(reference, output, shallow=False), \
+                    'the %s output differs from the reference'%(name)
+                if best is None or elapsed < best:
+                    best = elapsed
+            times.append(best)
+        print('%-8s %10.3f %10.3f %8.2fx %12.1f'%(name, times[0], times[1], times[0] / times[1],
+                                                 size / times[1] / (1 << 20)))
+
+    os.remove(output)
+    os.remove(reference)
@@ -0,0 +1,171 @@
+'''
+Benchmark cases. Each case is a generated C or C++ program, compiled with
+gcc-11, whose metadata is generated by meta_gen.py. The number of
+functions of a case is scaled by --scale.
+'''
+import json
+import os
+import subprocess
+
+from meta_gen import MetaGen, count_insts
+
+# the metadata generator does not model the .cold parts of functions
+CFLAGS = ['-O2', '-fcf-protection=full', '-pie', '-fPIE', '-fno-reorder-blocks-and-partition']
+
+
+def gen_functions(count):
+    '''
+    Many small functions with loops, calls and RIP-relative data accesses.
+    '''
+    lines = ['#include <stdio.h>',
+             'long g_data[256];',
+             'static const char *g_names[] = {"alpha", "beta", "gamma", "delta"};',
+             '']
+    for idx in range(count):
+        lines += ['__attribute__((noinline)) long f_%d(long x) {'%(idx),
+                  '    long s = x ^ %d;'%(idx * 2654435761 % 65536),
+                  '    for (long i = 0; i < (x & 7); i++)',
+                  '        s += g_data[(x + i + %d) & 255] * %d;'%(idx, idx % 13 + 1),
+                  '    if (s & 1) s += g_names[(s >> 1) & 3][0];']
+        if idx:
+            lines += ['    if (x > %d) s += f_%d(x - 1);'%(idx % 97, idx - 1)]
+        lines += ['    g_data[s & 255] = s;',
+                  '    return s;',
+                  '}']
+    lines += ['long (*g_funs[])(long) = {%s};'%(', '.join('f_%d'%(idx) for idx in range(count))),
+              'int main(int argc, char **argv) {',
+              '    long s = 0;',
+              '    for (unsigned long i = 0; i < sizeof(g_funs) / sizeof(g_funs[0]); i++)',
+              '        s += g_funs[i](argc + i);',
+              '    printf("%ld\\n", s);',
+              '    return 0;',
+              '}']
+    return '\n'.join(lines) + '\n'
+
+def gen_jump_tables(count):
+    '''
+    Functions with dense switch statements whose cases have side effects,
+    so that gcc emits jump tables instead of lookup tables.
+    '''
+    ops = ['y += g_data[%d];', 'y *= %d;', 'y ^= g_data[y & 255] + %d;', 'g_data[%d & 255] = y;',
+           'y = (y << 3) - %d;', 'y -= g_data[(y + %d) & 255];', 'y |= %d; g_data[y & 255]++;',
+           'y = y / (%d + 1);', 'y += puts("case") + %d;', 'y = ~y + %d;', 'g_data[y & 255] -= %d;',
+           'y >>= (%d & 7);']
+    lines = ['#include <stdio.h>',
+             'long g_data[256];',
+             '']
+    for idx in range(count):
+        lines += ['__attribute__((noinline)) long sw_%d(long x, long y) {'%(idx),
+                  '    switch ((x + %d) %% %d) {'%(idx, len(ops))]
+        for case, op in enumerate(ops):
+            lines += ['    case %d: %s break;'%(case, op%(idx + case))]
+        lines += ['    }',
+                  '    return y;',
+                  '}']
+    lines += ['long (*g_funs[])(long, long) = {%s};'%(', '.join('sw_%d'%(idx) for idx in range(count))),
+              'int main(int argc, char **argv) {',
+              '    long s = 0;',
+              '    for (unsigned long i = 0; i < sizeof(g_funs) / sizeof(g_funs[0]); i++)',
+              '        s += g_funs[i](argc + i, s);',
+              '    printf("%ld\\n", s);',
+              '    return 0;',
+              '}']
+    return '\n'.join(lines) + '\n'
+
+def gen_exceptions(count):
+    '''
+    C++ functions with try/catch and objects with destructors, which give
+    every function an LSDA with call sites, landing pads and actions.
+    '''
+    lines = ['#include <cstdio>',
+             '#include <stdexcept>',
+             '#include <string>',
+             'long g_count;',
+             'struct Guard {',
+             '    long *p;',
+             '    Guard(long *p) : p(p) { ++*p; }',
+             '    ~Guard() { --*p; }',
+             '};',
+             '__attribute__((noinline)) long thrower(long x) {',
+             '    if (x % 7 == 0) throw std::runtime_error("seven");',
+             '    if (x % 11 == 0) throw std::string("eleven");',
+             '    return x + 1;',
+             '}',
+             '']
+    for idx in range(count):
+        lines += ['__attribute__((noinline)) long eh_%d(long x) {'%(idx),
+                  '    Guard g(&g_count);',
+                  '    try {',
+                  '        Guard h(&g_count);',
+                  '        return thrower(x + %d) * 2;'%(idx),
+                  '    } catch (const std::runtime_error &e) {',
+                  '        return %d + e.what()[0];'%(idx),
+                  '    } catch (const std::string &s) {',
+                  '        return s.size() + %d;'%(idx),
+                  '    }',
+                  '}']
+    lines += ['long (*g_funs[])(long) = {%s};'%(', '.join('eh_%d'%(idx) for idx in range(count))),
+              'int main(int argc, char **argv) {',
+              '    long s = 0;',
+              '    for (unsigned long i = 0; i < sizeof(g_funs) / sizeof(g_funs[0]); i++)',
+              '        s += g_funs[i](argc + i);',
+              '    std::printf("%ld\\n", s);',
+              '    return 0;',
+              '}']
+    return '\n'.join(lines) + '\n'
+
+
+class Case:
+    def __init__(self, name, gen_source, count, lang='c', overlap=0):
+        self.name = name
+        self.gen_source = gen_source
+        self.count = count
+        self.lang = lang
+        self.overlap = overlap
+
+    def get_dir(self, work_dir, scale):
+        return os.path.join(work_dir, '%s-%d'%(self.name, self.get_count(scale)))
+
+    def get_count(self, scale):
+        return max(1, int(self.count * scale))
+
+    def build(self, work_dir, scale):
+        '''
+        Compile the program and generate its metadata unless a previous run
+        already did. Returns (binary, metadata, info).
+        '''
+        case_dir = self.get_dir(work_dir, scale)
+        bin_file = os.path.join(case_dir, self.name)
+        meta_file = os.path.join(case_dir, '%s.json'%(self.name))
+        info_file = os.path.join(case_dir, 'info.json')
+        if os.path.exists(info_file):
+            with open(info_file) as fd:
+                return bin_file, meta_file, json.load(fd)
+
+        os.makedirs(case_dir, exist_ok=True)
+        if self.lang == 'c':
+            src_file = bin_file + '.c'
+            compiler = '/usr/bin/gcc-11'
+        else:
+            src_file = bin_file + '.cpp'
+            compiler = '/usr/bin/g++-11'
+        with open(src_file, 'w') as fd:
+            fd.write(self.gen_source(self.get_count(scale)))
+        subprocess.run([compiler] + CFLAGS + [src_file, '-o', bin_file], check=True)
+
+        meta = MetaGen(bin_file).generate(self.overlap)
+        with open(meta_file, 'w') as fd:
+            json.dump(meta, fd)
+
+        info = {'functions':len(meta['FunDict']), 'instructions':count_insts(meta),
+                'jump_tables':sum(len(fun_info['JmpTables']) for fun_info in meta['FunDict'].values()),
+                'meta_size':os.path.getsize(meta_file)}
+        with open(info_file, 'w') as fd:
+            json.dump(info, fd)
+        return bin_file, meta_file, info
+
+
+CASES = [Case('functions', gen_functions, 2000),
+         Case('overlap', gen_functions, 2000, overlap=4),
+         Case('jump_tables', gen_jump_tables, 1000),
+         Case('exceptions', gen_exceptions, 1000, lang='c++')]
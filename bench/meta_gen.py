@@ -0,0 +1,347 @@
+'''
+Generates superCFGBuilder-style metadata (the b2r2_meta JSON) for the
+benchmark binaries from objdump, so that the symbolizer can be benchmarked
+without .NET and B2R2. Only what the symbolizer reads is produced: the
+basic blocks of every function in .symtab, their edges, the jump tables of
+the usual PIE switch pattern and the landing pads of the C++ exception
+tables. With overlap > 0, superset blocks that start inside an instruction
+are added as well.
+'''
+import json
+import re
+import struct
+import subprocess
+import tempfile
+
+from elftools.elf.elffile import ELFFile
+from elftools.elf.sections import SymbolTableSection
+
+from superSymbolizer.lib.CFIInfo import CFIInfo
+
+REG = re.compile(r'\b(r[a-d]x|r[sd]i|r[sb]p|r\d+[dwb]?|e[a-d]x|e[sd]i|e[sb]p|[a-d][xlh]|[sd]il?|[sb]pl?|rip|[xyz]mm\d+|[cdefgs]s|st\(?\d\)?)\b')
+PTR_SIZES = ['QWORD', 'DWORD', 'WORD', 'BYTE', 'XMMWORD', 'YMMWORD', 'TBYTE', 'FWORD']
+PREFIXES = ['notrack', 'bnd', 'rep', 'repz', 'repnz', 'lock']
+BRANCHES = ['call', 'ret', 'loop', 'loope', 'loopne']
+
+OBJDUMP_FUN = re.compile(r'^([0-9a-f]+) <(.*)>:')
+OBJDUMP_INST = re.compile(r'^\s+([0-9a-f]+):\t([0-9a-f ]+)\t(.*)$')
+OBJDUMP_TARGET = re.compile(r'^([0-9a-f]+) <.*>$')
+
+
+def convert_operands(ops):
+    # objdump's Intel syntax to the one of B2R2
+    ops = re.sub(r'\s*#.*$', '', ops).strip()
+    ops = re.sub(r'\s*<[^>]*>', '', ops)
+    ops = ops.replace('PTR', 'ptr')
+    for size in PTR_SIZES:
+        ops = ops.replace(size + ' ptr', size.lower() + ' ptr')
+
+    def fix_rip(m):
+        disp = int(m.group(1), 16)
+        if disp >= 1 << 63:
+            disp -= 1 << 64
+        return '[RIP%s0x%x]'%('-' if disp < 0 else '+', abs(disp))
+    ops = re.sub(r'\[rip\+0x([0-9a-f]+)\]', fix_rip, ops)
+    ops = REG.sub(lambda m: m.group(0).upper(), ops)
+    return [op.strip() for op in ops.split(',')] if ops else []
+
+def make_inst(addr, byte_string, text):
+    '''
+    Returns the instruction in the metadata format with the branch target
+    and the mnemonic in the private _t and _mn fields.
+    '''
+    toks = text.split(None, 1)
+    mnemonic = toks[0]
+    ops = toks[1] if len(toks) > 1 else ''
+    prefix = ''
+    if mnemonic in PREFIXES and ops:
+        toks = ops.split(None, 1)
+        prefix = mnemonic + ' '
+        mnemonic = toks[0]
+        ops = toks[1] if len(toks) > 1 else ''
+
+    is_branch = mnemonic.startswith('j') or mnemonic in BRANCHES
+    target = None
+    m = OBJDUMP_TARGET.match(ops.strip())
+    if is_branch and m:
+        target = int(m.group(1), 16)
+        offset = target - addr
+        operands = ['%s0x%x'%('+' if offset >= 0 else '-', abs(offset))]
+    else:
+        operands = convert_operands(ops)
+
+    disassem = prefix + mnemonic
+    if operands:
+        disassem += ' ' + ', '.join(operands)
+    return {'Addr':hex(addr), 'Length':len(byte_string)//2, 'ByteString':byte_string.upper(),
+            'Disassem':disassem, 'RIPAddressing':['RIP' in op for op in operands],
+            'IsBranch':is_branch, '_t':target, '_mn':mnemonic}
+
+def objdump(args):
+    return subprocess.run(['objdump', '-w', '-M', 'intel'] + args, stdout=subprocess.PIPE,
+                          universal_newlines=True, check=True).stdout
+
+def disassemble(bin_file):
+    insts = dict()
+    plt_dict = dict()
+    for line in objdump(['-d', bin_file]).split('\n'):
+        m = OBJDUMP_FUN.match(line)
+        if m:
+            if m.group(2).endswith('@plt'):
+                plt_dict[hex(int(m.group(1), 16))] = m.group(2)[:-4]
+            continue
+        m = OBJDUMP_INST.match(line)
+        if m:
+            addr = int(m.group(1), 16)
+            insts[addr] = (m.group(2).replace(' ', ''), m.group(3).strip())
+    return insts, plt_dict
+
+
+class MetaGen:
+    def __init__(self, bin_file):
+        self.bin_file = bin_file
+        with open(bin_file, 'rb') as fd:
+            elf = ELFFile(fd)
+            text = elf.get_section_by_name('.text')
+            text_range = range(text['sh_addr'], text['sh_addr'] + text['sh_size'])
+            self.functions = dict()
+            for sec in elf.iter_sections():
+                if isinstance(sec, SymbolTableSection) and sec.name == '.symtab':
+                    for sym in sec.iter_symbols():
+                        if sym['st_info']['type'] == 'STT_FUNC' and sym['st_size'] > 0 and sym['st_value'] in text_range:
+                            self.functions[sym['st_value']] = sym['st_value'] + sym['st_size']
+            rodata = elf.get_section_by_name('.rodata')
+            self.rodata_base = rodata['sh_addr']
+            self.rodata = rodata.data()
+            self.fde_ranges = []
+            for entry in elf.get_dwarf_info().EH_CFI_entries():
+                if hasattr(entry, 'header') and 'initial_location' in entry.header:
+                    start = entry.header['initial_location']
+                    self.fde_ranges.append((start, start + entry.header['address_range']))
+
+        self.landing_pads = dict()
+        for fde in CFIInfo(bin_file).get_fde_tbl():
+            if fde.except_tbl:
+                for region in fde.except_tbl['region_tbl']:
+                    if region.landing_pad:
+                        self.landing_pads.setdefault(fde.start_proc, set()).add(fde.start_proc + region.landing_pad)
+
+        self.insts, self.plt_dict = disassemble(bin_file)
+
+    def find_jump_table(self, code, idx, start, end):
+        # lea REG, [RIP+tbl]; movsxd REG, dword ptr [REG+IDX*4]; add REG, REG; jmp REG
+        lea = mem_acc = add = None
+        pos = idx
+        while pos > 0 and idx - pos < 8:
+            pos -= 1
+            disassem = code[pos]['Disassem']
+            if add is None and disassem.startswith('add '):
+                add = code[pos]
+            elif mem_acc is None and disassem.startswith('movsxd ') and '*4]' in disassem:
+                mem_acc = code[pos]
+            elif disassem.startswith('lea ') and '[RIP' in disassem:
+                lea = code[pos]
+                break
+        if not (lea and mem_acc and add):
+            return None
+
+        disp = re.search(r'\[RIP([+-]0x[0-9a-f]+)\]', lea['Disassem']).group(1)
+        base = int(lea['Addr'], 16) + lea['Length'] + int(disp, 16)
+        reg = lea['Disassem'].split()[1].rstrip(',')
+        entries = []
+        addr = base
+        while self.rodata_base <= addr < self.rodata_base + len(self.rodata) - 3 and len(entries) < 1024:
+            offset = struct.unpack_from('<i', self.rodata, addr - self.rodata_base)[0]
+            if not (start <= base + offset < end):
+                break
+            entries.append(base + offset)
+            addr += 4
+        if not entries:
+            return None
+
+        jmp_site = code[idx]['Addr']
+        table = {'JmpSite':jmp_site, 'BaseAddr':hex(base), 'Size':len(entries), 'Entries':[hex(entry) for entry in entries]}
+        info = {'JmpSite':{'Addr':jmp_site, 'Regs':[], 'OpType':'JMP'},
+                'AddSite':{'Addr':add['Addr'], 'Regs':[], 'OpType':'ADD'},
+                'MemAccSite':{'Addr':mem_acc['Addr'], 'Regs':[], 'OpType':'MEM_ACCESS'},
+                'TblRefSite':[{'SiteInfo':{'Addr':lea['Addr'], 'Regs':[reg], 'OpType':'REF'}, 'IsDeterminate':False}],
+                'TblAddr':base}
+        return entries, table, info
+
+    def make_fun_info(self, start, end):
+        code = []
+        addr = start
+        while addr < end and addr in self.insts:
+            byte_string, text = self.insts[addr]
+            code.append(make_inst(addr, byte_string, text))
+            addr += len(byte_string) // 2
+
+        leaders = {start}
+        for idx, inst in enumerate(code):
+            if inst['IsBranch']:
+                if inst['_t'] is not None and start <= inst['_t'] < end:
+                    leaders.add(inst['_t'])
+                if idx + 1 < len(code):
+                    leaders.add(int(code[idx+1]['Addr'], 16))
+        for landing_pad in self.landing_pads.get(start, ()):
+            if start <= landing_pad < end:
+                leaders.add(landing_pad)
+
+        jmp_tables = []
+        jmp_info = dict()
+        for idx, inst in enumerate(code):
+            if inst['_mn'] == 'jmp' and inst['_t'] is None and 'ptr' not in inst['Disassem']:
+                found = self.find_jump_table(code, idx, start, end)
+                if found:
+                    entries, table, info = found
+                    leaders.update(entries)
+                    inst['_jt'] = entries
+                    jmp_tables.append(table)
+                    jmp_info[inst['Addr']] = [info]
+
+        bbls = dict()
+        bbl = None
+        for inst in code:
+            if int(inst['Addr'], 16) in leaders or bbl is None:
+                bbl = {'Addr':inst['Addr'], 'Size':0, 'Code':[], 'Edges':[]}
+                bbls[inst['Addr']] = bbl
+            bbl['Code'].append(inst)
+            bbl['Size'] += inst['Length']
+
+        for bbl in bbls.values():
+            self.add_edges(bbl, bbls)
+        for landing_pad in sorted(self.landing_pads.get(start, ())):
+            if hex(landing_pad) in bbls:
+                bbls[hex(start)]['Edges'].append({'From':hex(start), 'To':hex(landing_pad), 'EdgeType':'ExceptionFallThroughEdge'})
+
+        fde_ranges = [{'Start':hex(fde_start), 'End':hex(fde_end)} for fde_start, fde_end in self.fde_ranges
+                      if fde_start <= start < fde_end]
+        if not fde_ranges:
+            fde_ranges = [{'Start':hex(start), 'End':hex(end)}]
+        return {'Addr':hex(start), 'InstAddrs':[inst['Addr'] for inst in code],
+                'JmpTables':jmp_tables, 'JmpInfo':jmp_info, 'FDERanges':fde_ranges,
+                'BBLs':bbls, 'AbsorbingFun':[], 'FalseBBLs':[]}
+
+    def add_edges(self, bbl, bbls):
+        last = bbl['Code'][-1]
+        fallthrough = hex(int(bbl['Addr'], 16) + bbl['Size'])
+
+        def add_edge(to, edge_type):
+            if to in bbls:
+                bbl['Edges'].append({'From':bbl['Addr'], 'To':to, 'EdgeType':edge_type})
+
+        mnemonic = last['_mn']
+        if mnemonic in ['ret', 'hlt']:
+            pass
+        elif mnemonic == 'jmp':
+            if last['_t'] is not None:
+                add_edge(hex(last['_t']), 'InterJmpEdge')
+            for entry in last.get('_jt', []):
+                add_edge(hex(entry), 'IndirectJmpEdge')
+        elif mnemonic.startswith('j') or mnemonic.startswith('loop'):
+            if last['_t'] is not None:
+                add_edge(hex(last['_t']), 'InterCJmpTrueEdge')
+            add_edge(fallthrough, 'InterCJmpFalseEdge')
+        elif mnemonic == 'call':
+            add_edge(fallthrough, 'CallFallThroughEdge')
+        else:
+            add_edge(fallthrough, 'FallThroughEdge')
+
+    def add_overlap(self, fun_dict, per_function):
+        '''
+        Add superset blocks that start one byte into a REX-prefixed
+        instruction. Without the prefix the bytes still decode to a valid
+        instruction of the same end, after which the block follows the
+        original one; the entry block gets an edge to it so that it is
+        reachable.
+        '''
+        candidates = []
+        for fun_info in fun_dict.values():
+            picked = 0
+            for bbl in fun_info['BBLs'].values():
+                for idx, inst in enumerate(bbl['Code']):
+                    byte_string = inst['ByteString']
+                    # skip imm64 moves, whose length changes without REX.W
+                    if inst['IsBranch'] or not ('40' <= byte_string[:2] <= '4F') or \
+                       ('B8' <= byte_string[2:4] <= 'BF') or inst['Length'] < 3:
+                        continue
+                    candidates.append((fun_info, bbl, idx))
+                    picked += 1
+                    break
+                if picked >= per_function:
+                    break
+
+        # decode all the REX-less instructions with a single objdump run;
+        # each one is followed by int3 padding so that a bad decode does not
+        # desynchronize the next one
+        blob = bytearray()
+        offsets = []
+        for _, bbl, idx in candidates:
+            offsets.append(len(blob))
+            blob += bytes.fromhex(bbl['Code'][idx]['ByteString'][2:])
+            blob += b'\xcc' * 16
+        decoded = dict()
+        if blob:
+            with tempfile.NamedTemporaryFile(suffix='.bin') as fd:
+                fd.write(blob)
+                fd.flush()
+                lines = objdump(['-D', '-b', 'binary', '-m', 'i386:x86-64', fd.name]).split('\n')
+            for line in lines:
+                m = OBJDUMP_INST.match(line)
+                if m:
+                    decoded[int(m.group(1), 16)] = (m.group(2).replace(' ', ''), m.group(3).strip())
+
+        added = 0
+        for (fun_info, bbl, idx), offset in zip(candidates, offsets):
+            inst = bbl['Code'][idx]
+            if offset not in decoded:
+                continue
+            byte_string, text = decoded[offset]
+            if len(byte_string) // 2 != inst['Length'] - 1 or '(bad)' in text:
+                continue
+            addr = int(inst['Addr'], 16) + 1
+            new_inst = make_inst(addr, byte_string, text)
+            if new_inst['IsBranch']:
+                continue
+            code = [new_inst] + bbl['Code'][idx+1:]
+            size = int(bbl['Addr'], 16) + bbl['Size'] - addr
+            edges = [{'From':hex(addr), 'To':edge['To'], 'EdgeType':edge['EdgeType']} for edge in bbl['Edges']]
+            fun_info['BBLs'][hex(addr)] = {'Addr':hex(addr), 'Size':size, 'Code':code, 'Edges':edges}
+            fun_info['InstAddrs'].append(hex(addr))
+            entry = fun_info['BBLs'][fun_info['Addr']]
+            entry['Edges'].append({'From':entry['Addr'], 'To':hex(addr), 'EdgeType':'InterCJmpTrueEdge'})
+            added += 1
+        return added
+
+    def generate(self, overlap=0):
+        fun_dict = dict()
+        for start, end in sorted(self.functions.items()):
+            fun_dict[hex(start)] = self.make_fun_info(start, end)
+        if overlap:
+            self.add_overlap(fun_dict, overlap)
+
+        for fun_info in fun_dict.values():
+            for bbl in fun_info['BBLs'].values():
+                for inst in bbl['Code']:
+                    for key in ['_t', '_mn', '_jt']:
+                        inst.pop(key, None)
+        return {'FunDict':fun_dict, 'PLTDict':self.plt_dict, 'FalseFunList':[], 'SuspiciousFunList':[]}
+
+
+def count_insts(meta):
+    return sum(len(bbl['Code']) for fun_info in meta['FunDict'].values() for bbl in fun_info['BBLs'].values())
+
+
+import argparse
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate superset CFG metadata with objdump')
+    parser.add_argument('bin_file', type=str)
+    parser.add_argument('meta_file', type=str)
+    parser.add_argument('--overlap', type=int, default=0, metavar='N', help='add up to N overlapping blocks per function')
+
+    args = parser.parse_args()
+
+    meta = MetaGen(args.bin_file).generate(args.overlap)
+    with open(args.meta_file, 'w') as fd:
+        json.dump(meta, fd)
+    print('[+] %d functions, %d instructions'%(len(meta['FunDict']), count_insts(meta)))
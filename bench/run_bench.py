@@ -0,0 +1,139 @@
+'''
+Benchmark of the symbolizer (SuperSymbolizer.symbolize and
+create_reassem_file) on generated binaries and metadata. For every case it
+reports the throughput in instructions per second, the peak memory and the
+time of the symbolization phases, and it can compare the results with a
+previous run to catch regressions.
+'''
+import json
+import os
+import subprocess
+import sys
+
+from superSymbolizer.StageRunner import StageRunner
+
+from cases import CASES
+
+BENCH_DIR = os.path.dirname(os.path.realpath(__file__))
+# phases shown in the summary; the JSON output has all of them
+SUMMARY_PHASES = ['load_meta', 'get_cfi_dict', 'ElfBricks', 'construct_CFG', 'examine_br',
+                  'serialize', 'emit_symbolized_asm', 'create_reassem_file']
+
+
+def run_case(case, args, runner):
+    bin_file, meta_file, info = case.build(args.work_dir, args.scale)
+    case_dir = os.path.dirname(bin_file)
+    asm_file = os.path.join(case_dir, '%s.s'%(case.name))
+    timing_file = os.path.join(case_dir, 'timing.json')
+
+    cmd = [sys.executable, os.path.join(BENCH_DIR, 'bench_case.py'), bin_file, meta_file, asm_file, timing_file,
+           '--jobs', str(args.jobs)]
+    if args.stream_meta:
+        cmd.append('--stream-meta')
+
+    runs = []
+    for _ in range(args.repeat):
+        if runner.run(case.name, cmd, stdin=subprocess.DEVNULL) != 0:
+            return None
+        # bench_case.py measures its own peak, which does not include the
+        # memory this process used to build the case
+        with open(timing_file) as fd:
+            runs.append(json.load(fd))
+
+    # the best run, by the time of the benchmarked steps
+    best = min(runs, key=lambda timing: timing['symbolize'] + timing['create_reassem_file'])
+    result = dict(info)
+    result['case'] = case.name
+    result.update(best)
+    result['peak_rss'] = min(timing['peak_rss'] for timing in runs)
+    result['throughput'] = info['instructions'] / (best['symbolize'] + best['create_reassem_file'])
+
+    if args.profile:
+        # a separate run since the profiling wrappers slow the hot paths down
+        if runner.run(case.name + ':profile', cmd + ['--profile', '20'], stdin=subprocess.DEVNULL) != 0:
+            return None
+        with open(os.path.splitext(asm_file)[0] + '.profile.json') as fd:
+            profile = json.load(fd)
+        result['phases'] = {phase:item['time'] for phase, item in profile['aggregate'].items()}
+        result['slowest'] = profile['slowest'][:5]
+    return result
+
+def print_results(results):
+    print('%-12s %8s %10s %8s %10s %8s %12s %10s'%('case', 'funcs', 'insts', 'load(s)', 'symbol(s)', 'print(s)', 'insts/s', 'peak(MiB)'))
+    for result in results:
+        print('%-12s %8d %10d %8.2f %10.2f %8.2f %12.0f %10.1f'%(
+            result['case'], result['functions'], result['instructions'], result['load'], result['symbolize'],
+            result['create_reassem_file'], result['throughput'], result['peak_rss'] / 1024))
+
+    if any('phases' in result for result in results):
+        print('')
+        print('%-12s'%('phase (s)') + ''.join(' %10s'%(result['case'][:10]) for result in results))
+        for phase in SUMMARY_PHASES:
+            print('%-12s'%(phase[:12]) + ''.join(' %10.3f'%(result.get('phases', {}).get(phase, 0.0)) for result in results))
+
+def compare(results, baseline, threshold):
+    '''
+    Returns the regressions of the throughput and the peak memory beyond
+    threshold percent against the results of a previous run.
+    '''
+    old_results = {(result['case'], result['instructions']):result for result in baseline['results']}
+    regressions = []
+    for result in results:
+        old = old_results.get((result['case'], result['instructions']))
+        if old is None:
+            print('[-] %s: no baseline result of the same size'%(result['case']))
+            continue
+        speed = (result['throughput'] / old['throughput'] - 1) * 100
+        memory = (result['peak_rss'] / old['peak_rss'] - 1) * 100
+        print('[*] %s: throughput %+.1f%%, peak memory %+.1f%%'%(result['case'], speed, memory))
+        if speed < -threshold:
+            regressions.append('%s: throughput %+.1f%%'%(result['case'], speed))
+        if memory > threshold:
+            regressions.append('%s: peak memory %+.1f%%'%(result['case'], memory))
+    return regressions
+
+
+import argparse
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the symbolizer')
+    parser.add_argument('--cases', nargs='+', choices=[case.name for case in CASES],
+                        default=[case.name for case in CASES])
+    parser.add_argument('--scale', type=float, default=1.0, help='scale the number of functions of every case')
+    parser.add_argument('--repeat', type=int, default=3, help='report the best of N runs')
+    parser.add_argument('--jobs', type=int, default=1)
+    parser.add_argument('--stream-meta', dest='stream_meta', action='store_true')
+    parser.add_argument('--no-profile', dest='profile', action='store_false', help='skip the per-phase profile run')
+    parser.add_argument('--work-dir', type=str, default=os.path.join(BENCH_DIR, 'work'),
+                        help='where the generated binaries and metadata are kept')
+    parser.add_argument('--output', type=str, help='write the results to this JSON file')
+    parser.add_argument('--baseline', type=str, help='compare with the results of a previous run')
+    parser.add_argument('--threshold', type=float, default=10.0, help='regression threshold in percent')
+
+    args = parser.parse_args()
+
+    runner = StageRunner()
+    results = []
+    for case in CASES:
+        if case.name not in args.cases:
+            continue
+        result = run_case(case, args, runner)
+        if result is None:
+            print('[-] %s failed'%(case.name))
+            sys.exit(1)
+        results.append(result)
+
+    print_results(results)
+
+    if args.output:
+        with open(args.output, 'w') as fd:
+            json.dump({'scale':args.scale, 'jobs':args.jobs, 'stream_meta':args.stream_meta,
+                       'results':results}, fd, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as fd:
+            baseline = json.load(fd)
+        regressions = compare(results, baseline, args.threshold)
+        for regression in regressions:
+            print('[-] Regression %s'%(regression))
+        if regressions:
+            sys.exit(1)
@@ -1,5 +1,6 @@
 import os
-from superSymbolizer import SuperSymbolizer, CustomCompiler, SuperAsan
+import subprocess
+from superSymbolizer import SuperSymbolizer, CustomCompiler, SuperAsan, StageRunner
 
 
 class Emitter:
@@ -14,6 +15,7 @@ class Emitter:
         self.filename = os.path.basename(target)
         self.use_docker = use_docker
         self.verbose = verbose
+        self.runner = StageRunner.StageRunner(verbose)
 
         if asan:
             self.asan = '%s_asan.json'%(self.filename)
@@ -23,13 +25,15 @@ class Emitter:
         self.tmp = 'tmp_%s'%(self.filename)
         self.myfile = 'my_%s'%(self.filename)
 
-    def run_docker(self, cmd):
+    def run_docker(self, stage, cmd):
         if self.verbose:
             print(cmd)
-            docker_cmd = 'docker run --rm -v %s:/input -v %s:/output suri:v1.0 sh -c " %s; "'%(self.input_dir, self.output_dir, cmd )
+            stderr = None
         else:
-            docker_cmd = 'docker run --rm -v %s:/input -v %s:/output suri:v1.0 sh -c " %s 2> /dev/null "'%(self.input_dir, self.output_dir, cmd )
-        os.system(docker_cmd)
+            stderr = subprocess.DEVNULL
+        docker_cmd = ['docker', 'run', '--rm', '-v', '%s:/input'%(self.input_dir), '-v', '%s:/output'%(self.output_dir),
+                      'suri:v1.0', 'sh', '-c', cmd]
+        return self.runner.run(stage, docker_cmd, stderr=stderr)
 
 
     def compile_suri(self):
@@ -43,19 +47,16 @@ class Emitter:
             else:
                 cmd = 'python3 /project/SURI/superSymbolizer/CustomCompiler.py %s %s %s'%(input_path, asm_path, output_path)
 
-            if self.verbose:
-                print(cmd)
-
-            self.run_docker(cmd)
+            self.run_docker('compile', cmd)
         else:
             input_path = '%s/%s'%(self.input_dir, self.filename)
             asm_path =   self.asm
             output_path = '%s/%s'%(self.output_dir, self.filename)
 
             if self.asan:
-                CustomCompiler.emitter(input_path, asm_path, output_path, asan=True)
+                CustomCompiler.emitter(input_path, asm_path, output_path, asan=True, runner=self.runner)
             else:
-                CustomCompiler.emitter(input_path, asm_path, output_path)
+                CustomCompiler.emitter(input_path, asm_path, output_path, runner=self.runner)
 
 
     def run(self):
@@ -78,6 +79,7 @@ if __name__ == '__main__':
     parser.add_argument('--asan', action='store_true')
     parser.add_argument('--usedocker', action='store_true')
     parser.add_argument('--verbose', action='store_true')
+    parser.add_argument('--report', type=str, help='Write the status, time and memory use of every stage to this JSON file')
 
     args = parser.parse_args()
 
@@ -85,3 +87,5 @@ if __name__ == '__main__':
 
     emitter = Emitter(target, args.assembly, args.ofolder, args.asan, args.usedocker, args.verbose)
     emitter.run()
+    if args.report:
+        emitter.runner.write_report(args.report, target=target)
@@ -78,29 +78,33 @@ let memAccCheck hdl lu funCodeMgr (vertex: Vertex<DisasmBasicBlock>) =
   else
     None
 
+let makeASanInfo (ess: BinEssence) hdl (fn: RegularFunction)
+                 (funCodeMgr: FunCodeManager)
+                 (allVertices: (DisasmVertex * Edge list) list) =
+  let instList
+      = allVertices
+        |> List.fold(fun acc (v, edges) ->
+                      match memAccCheck hdl ess.LiftingUnit funCodeMgr v with
+                      | Some code -> code@acc
+                      | _ -> acc
+                      ) List.Empty
+  {Addr = $"0x%x{fn.EntryPoint}"; InstList = instList}
+
 let ASanMetaGen (ess: BinEssence) hdl =
   let fnList =
-    ess.CodeManager.FunctionMaintainer.RegularFunctions
-    |> List.ofArray
-    |> List.filter (fun fn ->
-        if ess.CodeManager.HasFunCodeMgr fn.EntryPoint then true
-        else
-           printf "Unresolved Entry point: %x" fn.EntryPoint
-           false )
+    getRegularFunctions ess
     |> List.map(fun fn ->
-        let funCodeMgr = ess.CodeManager.GetFunCodeMgr fn.EntryPoint
-        let cfg, root = BinEssence.getFunctionCFG ess fn.EntryPoint
-                        |> Result.get
-        let disasmcfg, root2 = DisasmLens.filter2 funCodeMgr cfg root
-        let allVertices = CollectVertices disasmcfg root2
-        let instList
-            = allVertices
-              |> List.fold(fun acc (v, edges) ->
-                            match memAccCheck hdl ess.LiftingUnit funCodeMgr v with
-                            | Some code -> code@acc
-                            | _ -> acc
-                            ) List.Empty
-        {Addr = $"0x%x{fn.EntryPoint}"; InstList = instList} )
+        let funCodeMgr, allVertices = collectFunVertices ess fn
+        makeASanInfo ess hdl fn funCodeMgr allVertices)
 
-  ()
   fnList
+
+/// Builds the superset CFG metadata and the ASan metadata in one pass, so
+/// that the CFG of each function is recovered only once.
+let MetaASanGen (ess: BinEssence) hdl =
+  getRegularFunctions ess
+  |> List.map(fun fn ->
+      let funCodeMgr, allVertices = collectFunVertices ess fn
+      makeFnInfo ess hdl fn funCodeMgr allVertices,
+      makeASanInfo ess hdl fn funCodeMgr allVertices)
+  |> List.unzip
@@ -153,85 +153,96 @@ let rec readTables (hdl: BinHandle) (bAddr: Addr) (idx: uint64) acc =
   if idx = uint64 1 then entry::acc
   else readTables hdl bAddr (idx-(uint64 1)) (entry::acc)
 
+let getRegularFunctions (ess: BinEssence) =
+  ess.CodeManager.FunctionMaintainer.RegularFunctions
+  |> List.ofArray
+  |> List.filter (fun fn ->
+      if ess.CodeManager.HasFunCodeMgr fn.EntryPoint then true
+      else
+         printf "Unresolved Entry point: %x" fn.EntryPoint
+         false )
+
+let collectFunVertices (ess: BinEssence) (fn: RegularFunction) =
+  let funCodeMgr = ess.CodeManager.GetFunCodeMgr fn.EntryPoint
+  let cfg, root = BinEssence.getFunctionCFG ess fn.EntryPoint
+                  |> Result.get
+  let disasmcfg, root2 = DisasmLens.filter2 funCodeMgr cfg root
+  funCodeMgr, CollectVertices disasmcfg root2
+
+let makeFnInfo (ess: BinEssence) hdl (fn: RegularFunction)
+               (funCodeMgr: FunCodeManager)
+               (allVertices: (DisasmVertex * Edge list) list) =
+  let bblList
+      = allVertices
+        |> List.fold(fun acc (v, edges) ->
+                      match disassem hdl ess.LiftingUnit v with
+                      | Some code ->  let addr = v.VData.PPoint.Address
+                                      { Addr = $"0x%x{addr}" ;
+                                        Size = v.VData.Range.Count;
+                                        Code = code; Edges = edges}::acc
+                      | _ -> acc
+                      ) List.Empty
+  let jmpInfo = funCodeMgr.BrInfoDict
+                |> Seq.map(fun (KeyValue(k, v)) -> $"0x%x{k}" , v)
+                |> dict
+
+  let jmpList
+      = fn.IndirectJumps
+        |> Seq.fold(fun acc (KeyValue(k,v)) ->
+                    let jmpAddr = $"0x%x{k}"
+                    v |> Seq.fold(fun acc j ->
+                        match j with
+                        | JmpTbl tAddr ->
+                          let tblAddr = $"0x%x{tAddr}"
+                          if fn.JmpTblDict.ContainsKey tAddr then
+                            let tblSize = fn.JmpTblDict[tAddr]
+                            let entries =
+                              readTables hdl tAddr tblSize List.Empty
+                              |> List.map(fun x -> $"0x%x{x}")
+                            {JmpSite=jmpAddr; BaseAddr=tblAddr
+                             Size=tblSize; Entries=entries}::acc
+                          // part block may contain empty jump table
+                          // since we decided the first was entry invalid
+                          else {JmpSite=jmpAddr; BaseAddr=tblAddr
+                                Size=uint64 0; Entries=List.Empty}::acc
+                        | _ -> acc ) acc
+                    ) List.Empty
+  let addrList
+    = bblList
+      |> List.fold(fun ess bbl ->
+          (bbl.Code
+           |> List.map(fun inst -> inst.Addr))@ess) []
+  //let (fdeStart, fdeEnd) = fn.FDERanges[0]
+  let fdeRanges
+      = fn.FDERanges
+        |> Seq.distinct
+        |> Seq.map(fun (a, b) ->
+          {Start = ($"0x%x{a}"); End = ($"0x%x{b}")})
+        |> List.ofSeq
+  let bblDict = bblList
+                |> List.map(fun bbl -> bbl.Addr, bbl )
+                |> Seq.ofList |> dict
+
+  let absorbers = fn.AbsorbingFuns
+                  |> Seq.map(fun x -> $"0x%x{x}")
+                  |> Seq.distinct |> List.ofSeq
+
+  let falseBBLs = funCodeMgr.FalseBlocks
+                  |> Seq.map(fun x -> $"0x%x{x}")
+                  |> List.ofSeq
+
+  {Addr = $"0x%x{fn.EntryPoint}";
+   InstAddrs = addrList; BBLs = bblDict;
+   JmpTables = jmpList; JmpInfo = jmpInfo;
+   FDERanges = fdeRanges;
+   AbsorbingFun = absorbers
+   FalseBBLs = falseBBLs}
+
 let MetaGen (ess: BinEssence) hdl =
   let fnList =
-    ess.CodeManager.FunctionMaintainer.RegularFunctions
-    |> List.ofArray
-    |> List.filter (fun fn ->
-        if ess.CodeManager.HasFunCodeMgr fn.EntryPoint then true
-        else
-           printf "Unresolved Entry point: %x" fn.EntryPoint
-           false )
+    getRegularFunctions ess
     |> List.map(fun fn ->
-        let funCodeMgr = ess.CodeManager.GetFunCodeMgr fn.EntryPoint
-        let cfg, root = BinEssence.getFunctionCFG ess fn.EntryPoint
-                        |> Result.get
-        let disasmcfg, root2 = DisasmLens.filter2 funCodeMgr cfg root
-        let allVertices = CollectVertices disasmcfg root2
-        let bblList
-            = allVertices
-              |> List.fold(fun acc (v, edges) ->
-                            match disassem hdl ess.LiftingUnit v with
-                            | Some code ->  let addr = v.VData.PPoint.Address
-                                            { Addr = $"0x%x{addr}" ;
-                                              Size = v.VData.Range.Count;
-                                              Code = code; Edges = edges}::acc
-                            | _ -> acc
-                            ) List.Empty
-        let jmpInfo = funCodeMgr.BrInfoDict
-                      |> Seq.map(fun (KeyValue(k, v)) -> $"0x%x{k}" , v)
-                      |> dict
-
-        let jmpList
-            = fn.IndirectJumps
-              |> Seq.fold(fun acc (KeyValue(k,v)) ->
-                          let jmpAddr = $"0x%x{k}"
-                          v |> Seq.fold(fun acc j ->
-                              match j with
-                              | JmpTbl tAddr ->
-                                let tblAddr = $"0x%x{tAddr}"
-                                if fn.JmpTblDict.ContainsKey tAddr then
-                                  let tblSize = fn.JmpTblDict[tAddr]
-                                  let entries =
-                                    readTables hdl tAddr tblSize List.Empty
-                                    |> List.map(fun x -> $"0x%x{x}")
-                                  {JmpSite=jmpAddr; BaseAddr=tblAddr
-                                   Size=tblSize; Entries=entries}::acc
-                                // part block may contain empty jump table
-                                // since we decided the first was entry invalid
-                                else {JmpSite=jmpAddr; BaseAddr=tblAddr
-                                      Size=uint64 0; Entries=List.Empty}::acc
-                              | _ -> acc ) acc
-                          ) List.Empty
-        let addrList
-          = bblList
-            |> List.fold(fun ess bbl ->
-                (bbl.Code
-                 |> List.map(fun inst -> inst.Addr))@ess) []
-        //let (fdeStart, fdeEnd) = fn.FDERanges[0]
-        let fdeRanges
-            = fn.FDERanges
-              |> Seq.distinct
-              |> Seq.map(fun (a, b) ->
-                {Start = ($"0x%x{a}"); End = ($"0x%x{b}")})
-              |> List.ofSeq
-        let bblDict = bblList
-                      |> List.map(fun bbl -> bbl.Addr, bbl )
-                      |> Seq.ofList |> dict
-
-        let absorbers = fn.AbsorbingFuns
-                        |> Seq.map(fun x -> $"0x%x{x}")
-                        |> Seq.distinct |> List.ofSeq
-
-        let falseBBLs = funCodeMgr.FalseBlocks
-                        |> Seq.map(fun x -> $"0x%x{x}")
-                        |> List.ofSeq
-
-        {Addr = $"0x%x{fn.EntryPoint}";
-         InstAddrs = addrList; BBLs = bblDict;
-         JmpTables = jmpList; JmpInfo = jmpInfo;
-         FDERanges = fdeRanges;
-         AbsorbingFun = absorbers
-         FalseBBLs = falseBBLs} )
+        let funCodeMgr, allVertices = collectFunVertices ess fn
+        makeFnInfo ess hdl fn funCodeMgr allVertices)
 
   fnList
@@ -0,0 +1,163 @@
+module SupersetCFG.MetaPack
+
+open System
+open System.IO
+open System.Text
+open SuperCFG.ControlFlowAnalysis
+open SupersetCFG.MetaGen
+open SupersetCFG.ASanGen
+
+(*
+  Compact metadata format. The file is a sequence of MessagePack objects:
+
+    ["SURI-META", version, "cfg"]
+    [[pltAddr, name], ...]
+    [falseFunAddr, ...]
+    [suspiciousFunAddr, ...]
+    number of functions
+    function, ...
+
+  Records are written as arrays in the field order of their JSON counterpart,
+  addresses as integers and byte strings as raw bytes. An ASan metadata file
+  starts with ["SURI-META", version, "asan"] followed by the number of
+  functions and the functions. superSymbolizer/lib/MetaPack.py decodes it.
+*)
+
+let PackVersion = 1UL
+
+type MetaPacker (stream: Stream) =
+  let writeBE (v: uint64) nBytes =
+    for i in nBytes - 1 .. -1 .. 0 do
+      stream.WriteByte (byte (v >>> (8 * i)))
+
+  let writeTag (tag: byte) (v: uint64) nBytes =
+    stream.WriteByte tag
+    writeBE v nBytes
+
+  member __.UInt (v: uint64) =
+    if v < 0x80UL then stream.WriteByte (byte v)
+    elif v <= 0xffUL then writeTag 0xccuy v 1
+    elif v <= 0xffffUL then writeTag 0xcduy v 2
+    elif v <= 0xffffffffUL then writeTag 0xceuy v 4
+    else writeTag 0xcfuy v 8
+
+  member __.Bool (b: bool) =
+    stream.WriteByte (if b then 0xc3uy else 0xc2uy)
+
+  member __.Str (s: string) =
+    let bytes = Encoding.UTF8.GetBytes s
+    let n = uint64 bytes.Length
+    if n < 32UL then stream.WriteByte (0xa0uy ||| byte n)
+    elif n <= 0xffUL then writeTag 0xd9uy n 1
+    elif n <= 0xffffUL then writeTag 0xdauy n 2
+    else writeTag 0xdbuy n 4
+    stream.Write (bytes, 0, bytes.Length)
+
+  member __.Bin (bytes: byte[]) =
+    let n = uint64 bytes.Length
+    if n <= 0xffUL then writeTag 0xc4uy n 1
+    elif n <= 0xffffUL then writeTag 0xc5uy n 2
+    else writeTag 0xc6uy n 4
+    stream.Write (bytes, 0, bytes.Length)
+
+  member __.Array (n: int) =
+    let n = uint64 n
+    if n < 16UL then stream.WriteByte (0x90uy ||| byte n)
+    elif n <= 0xffffUL then writeTag 0xdcuy n 2
+    else writeTag 0xdduy n 4
+
+  member __.Addr (addr: string) =
+    __.UInt (Convert.ToUInt64 (addr, 16))
+
+  member __.AddrList (addrs: string list) =
+    __.Array addrs.Length
+    addrs |> List.iter __.Addr
+
+let PackHeader (p: MetaPacker) kind =
+  p.Array 3
+  p.Str "SURI-META"
+  p.UInt PackVersion
+  p.Str kind
+
+let PackInst (p: MetaPacker) (inst: InstInfo) =
+  p.Array 6
+  p.Addr inst.Addr
+  p.UInt (uint64 inst.Length)
+  p.Bin (Convert.FromHexString inst.ByteString)
+  p.Str inst.Disassem
+  p.Array inst.RIPAddressing.Length
+  inst.RIPAddressing |> List.iter p.Bool
+  p.Bool inst.IsBranch
+
+let PackBBL (p: MetaPacker) (bbl: BlockInfo) =
+  p.Array 4
+  p.Addr bbl.Addr
+  p.UInt bbl.Size
+  p.Array bbl.Code.Length
+  bbl.Code |> List.iter (PackInst p)
+  p.Array bbl.Edges.Length
+  bbl.Edges |> List.iter (fun edge ->
+    p.Array 3
+    p.Addr edge.From
+    p.Addr edge.To
+    p.Str edge.EdgeType)
+
+let PackSiteInfo (p: MetaPacker) (site: SiteInfo) =
+  p.Array 3
+  p.Str site.Addr
+  p.Array site.Regs.Length
+  site.Regs |> List.iter p.Str
+  p.Str site.OpType
+
+let PackBranchInfo (p: MetaPacker) (info: BranchInfo) =
+  p.Array 5
+  PackSiteInfo p info.JmpSite
+  PackSiteInfo p info.AddSite
+  PackSiteInfo p info.MemAccSite
+  p.Array info.TblRefSite.Length
+  info.TblRefSite |> List.iter (fun refSite ->
+    p.Array 2
+    PackSiteInfo p refSite.SiteInfo
+    p.Bool refSite.IsDeterminate)
+  p.UInt info.TblAddr
+
+let PackFnInfo (p: MetaPacker) (fn: FnInfo) =
+  p.Array 8
+  p.Addr fn.Addr
+  p.AddrList fn.InstAddrs
+  p.Array fn.JmpTables.Length
+  fn.JmpTables |> List.iter (fun tbl ->
+    p.Array 4
+    p.Addr tbl.JmpSite
+    p.Addr tbl.BaseAddr
+    p.UInt tbl.Size
+    p.AddrList tbl.Entries)
+  p.Array fn.JmpInfo.Count
+  fn.JmpInfo |> Seq.iter (fun (KeyValue (site, infos)) ->
+    p.Array 2
+    p.Addr site
+    p.Array infos.Length
+    infos |> List.iter (PackBranchInfo p))
+  p.Array fn.FDERanges.Length
+  fn.FDERanges |> List.iter (fun range ->
+    p.Array 2
+    p.Addr range.Start
+    p.Addr range.End)
+  p.Array fn.BBLs.Count
+  fn.BBLs.Values |> Seq.iter (PackBBL p)
+  p.AddrList fn.AbsorbingFun
+  p.AddrList fn.FalseBBLs
+
+let PackASanInfo (p: MetaPacker) (fn: ASanInfo) =
+  p.Array 2
+  p.Addr fn.Addr
+  p.Array fn.InstList.Length
+  fn.InstList |> List.iter (fun inst ->
+    p.Array 3
+    p.Addr inst.Addr
+    p.Str inst.MemAccType
+    p.Array inst.MemAccSize.Length
+    inst.MemAccSize |> List.iter (uint64 >> p.UInt))
+
+let IsPackedMetaFile (fileName: string) =
+  fileName.EndsWith ".msgpack"
@@ -6,7 +6,10 @@ open B2R2.FrontEnd
 open B2R2.FrontEnd.BinLifter
 open B2R2.FrontEnd.BinLifter.Intel
 open SuperCFG.BinEssence
+open System
 open System.IO
+open System.Net.Sockets
+open System.Threading
 #if DEBUG_META_FILE
 open System.Text.Json
 #else
@@ -14,6 +17,7 @@ open Newtonsoft.Json
 #endif
 open SupersetCFG.MetaGen
 open SupersetCFG.ASanGen
+open SupersetCFG.MetaPack
 
 type SupersetRecord = {
   FunDict: IDictionary<string, FnInfo>
@@ -46,6 +50,18 @@ let CreateASanMeta ess hdl =
 #endif
     fnList
 
+let CreateMetaWithASan ess hdl =
+#if DEBUG
+    let startTime = System.DateTime.Now
+#endif
+    let fnList, asanList = MetaASanGen ess hdl
+#if DEBUG
+    let endTime = System.DateTime.Now
+    endTime.Subtract(startTime).TotalSeconds
+      |> printfn "[*] Construct CFG and ASan meta %f sec."
+#endif
+    fnList, asanList
+
 let MakeB2R2Meta ess (fnList: FnInfo list) =
 #if DEBUG
     let startTime = System.DateTime.Now
@@ -102,8 +118,52 @@ let SaveJSON fileName data =
       |> printfn "[*] JsonSerializer %f sec."
 #endif
 
-[<EntryPoint>]
-let main args =
+let SavePacked fileName (pack: MetaPacker -> unit) =
+#if DEBUG
+    let startTime = System.DateTime.Now
+#endif
+
+    use fileStream = new FileStream(fileName, FileMode.Create, FileAccess.Write,
+                                    FileShare.None, 1 <<< 20)
+    pack (MetaPacker fileStream)
+
+#if DEBUG
+    let endTime = System.DateTime.Now
+    endTime.Subtract(startTime).TotalSeconds
+      |> printfn "[*] MetaPacker %f sec."
+#endif
+
+let SaveB2R2Meta fileName (data: SupersetRecord) =
+  if IsPackedMetaFile fileName then
+    SavePacked fileName (fun p ->
+      PackHeader p "cfg"
+      p.Array data.PLTDict.Count
+      data.PLTDict |> Seq.iter (fun (KeyValue (addr, name)) ->
+        p.Array 2
+        p.Addr addr
+        p.Str name)
+      p.AddrList data.FalseFunList
+      p.AddrList data.SuspiciousFunList
+      p.UInt (uint64 data.FunDict.Count)
+      data.FunDict.Values |> Seq.iter (PackFnInfo p))
+  else SaveJSON fileName data
+
+let SaveASanMeta fileName (fnList: ASanInfo list) =
+  if IsPackedMetaFile fileName then
+    SavePacked fileName (fun p ->
+      PackHeader p "asan"
+      p.UInt (uint64 fnList.Length)
+      fnList |> List.iter (PackASanInfo p))
+  else SaveJSON fileName fnList
+
+let IsATT (args: string[]) = args.Length > 2 && args[2] = "att"
+
+// the syntax is a global setting, so it is set once per process
+let SetFlavor (args: string[]) =
+  if IsATT args then Disasm.setDisassemblyFlavor ATTSyntax
+  else Disasm.setDisassemblyFlavor DefaultSyntax
+
+let Build (args: string[]) =
   let path =  args[0]
   if File.Exists(path) then
     let isa = ISA.DefaultISA
@@ -113,14 +173,91 @@ let main args =
     if args.Length = 2 then
       let fnList = ConstructCFG ess hdl
       let data = MakeB2R2Meta ess fnList
-      SaveJSON fileName data
+      SaveB2R2Meta fileName data
     elif args.Length > 2 && args[2] = "att" then
-      Disasm.setDisassemblyFlavor ATTSyntax
       let fnList = ConstructCFG ess hdl
       let data = MakeB2R2Meta ess fnList
-      SaveJSON fileName data
+      SaveB2R2Meta fileName data
+    elif args.Length > 3 && args[2] = "with-asan" then
+      let fnList, asanList = CreateMetaWithASan ess hdl
+      let data = MakeB2R2Meta ess fnList
+      SaveB2R2Meta fileName data
+      SaveASanMeta args[3] asanList
     elif args.Length > 2 && args[2] = "asan" then
       let fnList = CreateASanMeta ess hdl
-      SaveJSON fileName fnList
+      SaveASanMeta fileName fnList
     0
   else 1
+
+(*
+  Server mode. Each request is a line holding the command line arguments of a
+  single run separated by tabs, and is answered by a line "ok" or
+  "error <reason>". "quit" closes the connection and "shutdown" also stops
+  the server. Each connection is served by its own thread, so the requests
+  of several clients are built at the same time. The server uses the Intel
+  syntax; it does not take "att" requests since the syntax is global.
+*)
+let Serve (reader: TextReader) (writer: TextWriter) =
+  let mutable serving = true
+  let mutable running = true
+  while serving do
+    match reader.ReadLine () with
+    | null | "quit" -> serving <- false
+    | "shutdown" ->
+      serving <- false
+      running <- false
+    | line ->
+      let args = line.Split '\t'
+      let reply =
+        if IsATT args then "error the server only serves the Intel syntax"
+        else
+          try
+            match Build args with
+            | 0 -> "ok"
+            | code -> $"error exit code {code}"
+          with e -> "error " + e.Message.Replace ('\n', ' ')
+      writer.WriteLine reply
+      writer.Flush ()
+  running
+
+let ServeConnection (listener: Socket) (conn: Socket) =
+  try
+    use conn = conn
+    use stream = new NetworkStream (conn)
+    use reader = new StreamReader (stream)
+    use writer = new StreamWriter (stream)
+    // "shutdown" closes the listener, which ends the Accept loop
+    if not (Serve reader writer) then listener.Close ()
+  with :? IOException -> () // the client went away
+
+let ServeSocket (path: string) =
+  if File.Exists path then File.Delete path
+  use listener = new Socket (AddressFamily.Unix, SocketType.Stream,
+                             ProtocolType.Unspecified)
+  listener.Bind (UnixDomainSocketEndPoint path)
+  listener.Listen 16
+  let mutable running = true
+  while running do
+    try
+      let conn = listener.Accept ()
+      let worker = Thread (ThreadStart (fun () -> ServeConnection listener conn))
+      worker.IsBackground <- true
+      worker.Start ()
+    with
+    | :? SocketException
+    | :? ObjectDisposedException -> running <- false
+  File.Delete path
+
+[<EntryPoint>]
+let main args =
+  if args.Length > 0 && args[0] = "serve" then
+    // keep the log output of the analysis away from the replies
+    let out = Console.Out
+    Console.SetOut Console.Error
+    Disasm.setDisassemblyFlavor DefaultSyntax
+    if args.Length > 1 then ServeSocket args[1]
+    else Serve Console.In out |> ignore
+    0
+  else
+    SetFlavor args
+    Build args
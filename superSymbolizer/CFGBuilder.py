@@ -0,0 +1,143 @@
+import os
+import socket
+import subprocess
+import time
+
+from superSymbolizer.StageRunner import StageRunner
+
+DEFAULT_SOCKET = os.path.join(os.environ.get('XDG_RUNTIME_DIR', '/tmp'), 'suri-builder-%d.sock'%(os.getuid()))
+
+
+class CFGBuilder:
+    '''
+    Runs superCFGBuilder. A request goes to the builder server listening on
+    socket_path if there is one, and otherwise to a fresh process of the
+    built DLL, or of 'dotnet run' when the project has not been built yet.
+    Paths given to the builder must be absolute since the server does not
+    share our working directory. A DLL or a server older than the sources
+    is not used.
+    '''
+    def __init__(self, suri_dir, socket_path=DEFAULT_SOCKET, runner=None):
+        self.project_dir = os.path.join(suri_dir, 'superCFGBuilder', 'superCFGBuilder')
+        self.socket_path = socket_path
+        self.runner = runner or StageRunner()
+        self.source_mtime = None
+
+    def get_source_mtime(self):
+        # the newest source of superCFGBuilder and the projects it references
+        if self.source_mtime is None:
+            self.source_mtime = 0.0
+            for root, dirs, files in os.walk(os.path.dirname(self.project_dir)):
+                dirs[:] = [d for d in dirs if d not in ['bin', 'obj']]
+                for name in files:
+                    if name.endswith('.fs') or name.endswith('.fsproj'):
+                        mtime = os.path.getmtime(os.path.join(root, name))
+                        self.source_mtime = max(self.source_mtime, mtime)
+        return self.source_mtime
+
+    def get_dll(self):
+        for config in ['Release', 'Debug']:
+            dll = os.path.join(self.project_dir, 'bin', config, 'net9.0', 'superCFGBuilder.dll')
+            # a DLL older than the sources is stale; dotnet run rebuilds it
+            if os.path.exists(dll) and os.path.getmtime(dll) >= self.get_source_mtime():
+                return dll
+        return None
+
+    def get_command(self, args):
+        dll = self.get_dll()
+        if dll:
+            return ['dotnet', dll] + args
+        return ['dotnet', 'run', '-c', 'Release', '--project=%s'%(self.project_dir)] + args
+
+    def connect(self, stale_ok=False):
+        if not self.socket_path or not os.path.exists(self.socket_path):
+            return None
+        # the server binds the socket when it starts, so a server started
+        # before the last source edit runs a stale builder
+        if not stale_ok and os.path.getmtime(self.socket_path) < self.get_source_mtime():
+            if self.runner.verbose:
+                print('[-] superCFGBuilder server predates its sources; restart it')
+            return None
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.socket_path)
+        except OSError:
+            sock.close()
+            return None
+        return sock
+
+    def send(self, sock, line):
+        with sock.makefile('rw') as fd:
+            fd.write(line + '\n')
+            fd.flush()
+            return fd.readline().strip()
+
+    def is_running(self):
+        sock = self.connect()
+        if sock is None:
+            return False
+        with sock:
+            self.send(sock, 'quit')
+        return True
+
+    def run(self, args, stage='cfg'):
+        sock = self.connect()
+        if sock is not None:
+            # the work is done by the server; only the wall time is ours
+            with self.runner.stage(stage) as record, sock:
+                reply = self.send(sock, '\t'.join(args))
+                if reply != 'ok':
+                    print('[-] superCFGBuilder: %s'%(reply))
+                    record['returncode'] = 1
+                    record['error'] = reply
+            return reply == 'ok'
+        return self.runner.run(stage, self.get_command(args)) == 0
+
+    def start_server(self, timeout=120):
+        if self.is_running():
+            return True
+        # replace a server that runs a stale builder
+        self.stop_server()
+        proc = subprocess.Popen(self.get_command(['serve', self.socket_path]),
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                                start_new_session=True)
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.is_running():
+                return True
+            # e.g. the project failed to build
+            if proc.poll() is not None:
+                return False
+            time.sleep(0.5)
+        return False
+
+    def stop_server(self):
+        sock = self.connect(stale_ok=True)
+        if sock is None:
+            return
+        with sock:
+            self.send(sock, 'shutdown')
+
+
+import argparse
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='superCFGBuilder server')
+    parser.add_argument('command', choices=['start', 'stop', 'status'])
+    parser.add_argument('--socket', type=str, default=DEFAULT_SOCKET)
+
+    args = parser.parse_args()
+
+    suri_dir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+    builder = CFGBuilder(suri_dir, args.socket)
+    if args.command == 'start':
+        if builder.start_server():
+            print('[+] superCFGBuilder server is listening on %s'%(args.socket))
+        else:
+            print('[-] Failed to start superCFGBuilder server')
+    elif args.command == 'stop':
+        builder.stop_server()
+    else:
+        if builder.is_running():
+            print('[+] superCFGBuilder server is listening on %s'%(args.socket))
+        else:
+            print('[-] No superCFGBuilder server on %s'%(args.socket))
@@ -1,8 +1,11 @@
-import os, sys
+import os
 import enum
+import subprocess
 from ctypes import *
 
 from superSymbolizer import ElfBricks
+from superSymbolizer.lib.ElfDef import Unpack, map_file
+from superSymbolizer.StageRunner import StageRunner
 
 
 class ProgramType(enum.IntEnum):
@@ -40,11 +43,6 @@ class ProgramHeader(Structure):
         ('p_align', c_uint64),  # 0x38
     ]
 
-def Unpack(ctype, buf):
-    cstring = create_string_buffer(buf)
-    ctype_instance = cast(pointer(cstring), POINTER(ctype)).contents
-    return ctype_instance
-
 def get_program_header_list(data):
     header = Unpack(ELFHeader, data)
     program_header_list = []
@@ -53,7 +51,7 @@ def get_program_header_list(data):
 
     for idx in range(header.e_phnum):
         phoff = offset + idx * entsize
-        p_header = Unpack(ProgramHeader, data[phoff: phoff + entsize])
+        p_header = Unpack(ProgramHeader, data, phoff)
         program_header_list.append(p_header)
     return program_header_list
 
@@ -77,18 +75,51 @@ def get_vaddr_max(program_header_list, page_size, excluded_base_addr = 0):
     return max_addr
 
 def get_next_vaddr(filename, page_size):
-    with open(filename, 'rb') as f:
-        data = f.read()
-        program_header_list = get_program_header_list(data)
-        return get_vaddr_max(program_header_list, page_size)
-
-
-def emitter(target, reassem_path, output, page_size=0x200000, asan=False, verbose=False):
+    data = map_file(filename)
+    program_header_list = get_program_header_list(data)
+    return get_vaddr_max(program_header_list, page_size)
+
+
+def link_shards(runner, compiler, shards, lopt, tmp_file):
+    procs = []
+    obj_files = []
+    for shard in shards:
+        obj_file = os.path.splitext(shard)[0] + '.o'
+        proc = runner.start('assemble', [compiler, '-c', shard, '-fcf-protection=full', '-fPIE', '-o', obj_file])
+        if proc is not None:
+            procs.append(proc)
+        obj_files.append(obj_file)
+
+    # wait for all of them, even if one has failed
+    failed = len(procs) != len(shards)
+    for proc in procs:
+        if runner.wait(proc) != 0:
+            failed = True
+    if failed:
+        return False
+
+    if runner.run('link', [compiler] + obj_files + lopt + ['-o', tmp_file]) != 0:
+        return False
+    # the labels that the shards share are hidden globals; the
+    # executable of a single assembly file has no such symbols
+    return runner.run('strip', ['objcopy', '--wildcard', '--strip-symbol=.L*', tmp_file]) == 0
+
+
+def emitter(target, reassem_path, output, page_size=0x200000, asan=False, verbose=False, runner=None, write_asm=None):
+    '''
+    Assemble and link reassem_path, then fix the result up into
+    my_<output>. With reassem_path '-', gcc reads the assembly from stdin.
+    With write_asm, gcc reads it from a pipe instead: write_asm(fd) is
+    called with the write end while gcc runs, and reassem_path is ignored.
+    A list of paths are the shards of the reassembly, which are assembled
+    in parallel and then linked.
+    '''
+    if runner is None:
+        runner = StageRunner(verbose)
 
     #elf = ElfInfo(target)
     #lopt_list2 = elf.get_ld_option()
 
-    import subprocess
     result = subprocess.run(['ldd', target], stdout=subprocess.PIPE)
     lines = result.stdout.decode('utf-8').split('\n')
     lopt_list = []
@@ -112,9 +143,9 @@ def emitter(target, reassem_path, output, page_size=0x200000, asan=False, verbos
 
     compiler = '/usr/bin/gcc-11'
 
-    lopt = ''
+    lopt = []
     if asan:
-        lopt = '-lasan '
+        lopt.append('-lasan')
 
     for opt in lopt_list[:]:
 
@@ -128,18 +159,17 @@ def emitter(target, reassem_path, output, page_size=0x200000, asan=False, verbos
         elif opt.startswith('libc.so'):
             continue
 
-        lopt += opt + ' '
+        lopt.append(opt)
 
     if verbose:
         print(lopt_list)
-        print(lopt)
+        print(' '.join(lopt))
     #lopt += ' -Wl,--section-start=.interp=%s -Wl,--section-start=.note.ABI-tag=0x1000,--section-start=.my_rodata=%s'%\
     #        (hex(get_next_vaddr(target, page_size)), hex(elf._rodata_base_addr))
-    lopt += ' -Wl,--section-start=.interp=%s -Wl,--section-start=.note.ABI-tag=0x1000'%\
-            (hex(get_next_vaddr(target, page_size)))
-    lopt += ' -fcf-protection=full -pie -fPIE'
-    lopt += ' -fcf-protection=full -pie -fPIE'
-    lopt += ' -Wl,-z,lazy'
+    lopt += ['-Wl,--section-start=.interp=%s'%(hex(get_next_vaddr(target, page_size))),
+             '-Wl,--section-start=.note.ABI-tag=0x1000']
+    lopt += ['-fcf-protection=full', '-pie', '-fPIE']
+    lopt += ['-Wl,-z,lazy']
 
 
     abs_path = os.path.abspath(output)
@@ -148,31 +178,65 @@ def emitter(target, reassem_path, output, page_size=0x200000, asan=False, verbos
     tmp_file = '%s/tmp_%s'%(base, filename)
     my_file = '%s/my_%s'%(base, filename)
 
-    if verbose:
-        print("%s %s %s -o %s "%(compiler, reassem_path, lopt, tmp_file))
-    os.system("%s %s %s -o %s "%(compiler, reassem_path, lopt, tmp_file))
-    sys.stdout.flush()
-
-    cur_dir = os.path.dirname(os.path.realpath(__file__))
-    #print("python3 %s/ElfBricks.py %s %s %s"%(cur_dir, target, tmp_file, my_file))
-    #os.system("python3 %s/ElfBricks.py %s %s %s"%(cur_dir, target, tmp_file, my_file))
-    lego = ElfBricks.ElfBricks(tmp_file)
-    lego.fix_file(target, my_file)
+    if isinstance(reassem_path, list):
+        if not link_shards(runner, compiler, reassem_path, lopt, tmp_file):
+            return
+    elif write_asm is None and reassem_path != '-':
+        if runner.run('assemble', [compiler, reassem_path] + lopt + ['-o', tmp_file]) != 0:
+            return
+    else:
+        # '-x none' so that the libraries after the assembly are not taken
+        # for assembly as well
+        cmd = [compiler, '-x', 'assembler', '-', '-x', 'none'] + lopt + ['-o', tmp_file]
+        if write_asm is None:
+            if runner.run('assemble', cmd) != 0:
+                return
+        else:
+            proc = runner.start('assemble', cmd, stdin=subprocess.PIPE)
+            if proc is None:
+                return
+            try:
+                write_asm(proc.stdin)
+            except BrokenPipeError:
+                # gcc has given up; its exit status tells why
+                pass
+            except BaseException:
+                # do not leave gcc waiting for the rest of its input
+                proc.kill()
+                raise
+            finally:
+                try:
+                    proc.stdin.close()
+                except BrokenPipeError:
+                    pass
+                returncode = runner.wait(proc)
+            if returncode != 0:
+                return
+
+    with runner.stage('fixup'):
+        lego = ElfBricks.ElfBricks(tmp_file)
+        lego.fix_file(target, my_file)
 
     if verbose:
         print('chmod +x %s'%(my_file))
-    os.system('chmod +x %s'%(my_file))
+    mode = os.stat(my_file).st_mode
+    os.chmod(my_file, mode | (mode & 0o444) >> 2)
 
 import argparse
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='manager')
     parser.add_argument('target', type=str, help='target')
-    parser.add_argument('code', type=str, help='code')
+    parser.add_argument('code', type=str, nargs='+', help='code, or - to read it from stdin, or the shards of the code')
     parser.add_argument('output', type=str, help='output')
     parser.add_argument('--page-size', type=int, dest='page_size', default=0x200000)
     parser.add_argument('--asan', action='store_true')
     parser.add_argument('--verbose', action='store_true')
+    parser.add_argument('--report', type=str, help='Write the status, time and memory use of every stage to this JSON file')
 
     args = parser.parse_args()
 
-    emitter(args.target, args.code, args.output, args.page_size, args.asan, args.verbose)
+    runner = StageRunner(args.verbose)
+    code = args.code[0] if len(args.code) == 1 else args.code
+    emitter(args.target, code, args.output, args.page_size, args.asan, args.verbose, runner)
+    if args.report:
+        runner.write_report(args.report, target=args.target)
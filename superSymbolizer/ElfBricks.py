@@ -1,6 +1,7 @@
 from superSymbolizer.lib.ElfDef import ELFHeader, SectionHeader, ProgramHeader, Elf64_Sym, Elf64_Rela, Elf64_Dyn, Elf64_Verneed, \
     Elf64_Vernaux, Elf64_VernIdx, SectionType, SectionFlag, ProgramFlag, ProgramType, DynamicArrayTag, RelocationType, \
-    Pack, Unpack, SectionBrick, VersionBrick, Elf64_Addr
+    Pack, Unpack, SectionBrick, VersionBrick, Elf64_Addr, get_cstr, map_file
+from elftools.elf.elffile import ELFFile
 
 
 
@@ -10,8 +11,7 @@ class ElfBricks:
     def __init__(self, filename=None):
 
         if filename:
-            with open(filename, 'rb') as f:
-                data = f.read()
+            data = open_elf(filename).data
 
             self._data = data
             self._header = Unpack(ELFHeader, data)
@@ -58,9 +58,9 @@ class ElfBricks:
     def get_dt_needed_list(self, dyn_sec, dynstr):
         dt_needed_list = []
         for idx in range(len(dyn_sec)>>4):
-            entry = Unpack(Elf64_Dyn, dyn_sec[idx * 0x10:(idx + 1) * 0x10])
+            entry = Unpack(Elf64_Dyn, dyn_sec, idx * 0x10)
             if entry.d_tag == 1:
-                lib = dynstr[entry.d_un:].decode().split('\0')[0]
+                lib = get_cstr(dynstr, entry.d_un)
                 dt_needed_list.append((entry.d_un, lib))
         return dt_needed_list
 
@@ -71,8 +71,7 @@ class ElfBricks:
 
         rela_list = []
         for idx in range(int(rela_size/entry_size)):
-            entry = rela[idx*entry_size: (idx+1)*entry_size]
-            rela_list.append(Unpack(Elf64_Rela, entry))
+            rela_list.append(Unpack(Elf64_Rela, rela, idx*entry_size))
 
         return rela_list
 
@@ -145,7 +144,7 @@ class ElfBricks:
         offset = self._addr2offset(program_header_list, addr)
         array = []
         for idx in range(int(size/8)):
-            entry = Unpack(Elf64_Addr, data[offset+(idx*8):offset+((idx+1)*8)])
+            entry = Unpack(Elf64_Addr, data, offset+(idx*8))
             array.append(entry.addr)
         return array
 
@@ -162,7 +161,7 @@ class ElfBricks:
     def get_symtab_list(self, symtab):
         symtab_list = []
         for idx in range(int(len(symtab)/0x18)):
-            symtab_list.append(Unpack(Elf64_Sym, symtab[idx * 0x18:]))
+            symtab_list.append(Unpack(Elf64_Sym, symtab, idx * 0x18))
         return symtab_list
     def map_sym2addr(self, symtab_dict):
         fun_map = dict()
@@ -180,8 +179,8 @@ class ElfBricks:
         entry_size = symtab.header.sh_entsize
         sym_dict = dict()
         for idx in range(int(symtab.header.sh_size / entry_size)):
-            entry = Unpack(Elf64_Sym, symtab.body[idx * entry_size:])
-            name = str(strtab[entry.st_name:].decode('utf-8')).split('\x00')[0]
+            entry = Unpack(Elf64_Sym, symtab.body, idx * entry_size)
+            name = get_cstr(strtab, entry.st_name)
             if name not in sym_dict:
                 sym_dict[name] = list()
             sym_dict[name].append(entry)
@@ -190,7 +189,7 @@ class ElfBricks:
         for idx, header in enumerate(section_header_list):
             if header.name in ['.symtab']:
                 strtab_idx = header.header.sh_link
-                return self.make_symtab_dict(header, section_header_list[strtab_idx].body)
+                return self.make_symtab_dict(header, bytes(section_header_list[strtab_idx].body))
         return dict()
 
     def get_offset_range(self, program_header_list, excluded_base_addr = 0):
@@ -375,7 +374,7 @@ class ElfBricks:
             new_dynamic_section += Pack(entry)
 
         for idx in range(len(dyn_sec) >> 4):
-            entry = Unpack(Elf64_Dyn, dyn_sec[idx * 0x10:(idx + 1) * 0x10])
+            entry = Unpack(Elf64_Dyn, dyn_sec, idx * 0x10)
             if entry.d_tag == DynamicArrayTag.DT_NEEDED:
                 continue
 
@@ -422,8 +421,7 @@ class ElfBricks:
 
         rela_list = []
         for idx in range(int(rela_size/entry_size)):
-            entry = rela[idx*entry_size: (idx+1)*entry_size]
-            rela_list.append(Unpack(Elf64_Rela, entry))
+            rela_list.append(Unpack(Elf64_Rela, rela, idx*entry_size))
 
         return rela_list
 
@@ -432,7 +430,7 @@ class ElfBricks:
         ver_table = []
         last_version = 0
         for idx in range(num_of_entry):
-            idx = Unpack(Elf64_VernIdx, versym[idx * 2:])
+            idx = Unpack(Elf64_VernIdx, versym, idx * 2)
             ver_table.append(idx)
             if idx.idx > last_version:
                 last_version = idx.idx
@@ -446,12 +444,12 @@ class ElfBricks:
         offset = 0
 
         while True:
-            header = Unpack(Elf64_Verneed, verneeded[offset:])
-            lib_name = (dynstr[header.vn_file:].decode('utf-8')).split('\x00')[0]
+            header = Unpack(Elf64_Verneed, verneeded, offset)
+            lib_name = get_cstr(dynstr, header.vn_file)
 
             for idx in range(header.vn_cnt):
-                entry = Unpack(Elf64_Vernaux, verneeded[offset + (idx + 1) * 0x10:])
-                sym_name = (dynstr[entry.vna_name:].decode('utf-8')).split('\x00')[0]
+                entry = Unpack(Elf64_Vernaux, verneeded, offset + (idx + 1) * 0x10)
+                sym_name = get_cstr(dynstr, entry.vna_name)
                 version_dict[entry.vna_other] = VersionBrick(lib_name, sym_name, header, entry)
 
             if header.vn_next == 0:
@@ -463,7 +461,7 @@ class ElfBricks:
 
     def get_dynstr(self, dyn_dict, data):
         strsize = dyn_dict[DynamicArrayTag.DT_STRSZ] #DT_STRSZ
-        return self.get_matched_section(dyn_dict, data, DynamicArrayTag.DT_STRTAB, strsize)
+        return bytes(self.get_matched_section(dyn_dict, data, DynamicArrayTag.DT_STRTAB, strsize))
 
     def get_dynsym(self, dyn_dict, data):
         #ent_size = dyn_dict[DynamicArrayTag.DT_SYMENT] #DT_SYMENT
@@ -472,7 +470,7 @@ class ElfBricks:
     def make_dynamic_dict(self, dyn_sec):
         dyn_dict = dict()
         for idx in range(len(dyn_sec)>>4):
-            entry = Unpack(Elf64_Dyn, dyn_sec[idx * 0x10:(idx + 1) * 0x10])
+            entry = Unpack(Elf64_Dyn, dyn_sec, idx * 0x10)
             if entry.d_tag == 0:
                 break
             dyn_dict[entry.d_tag] = entry.d_un
@@ -581,13 +579,14 @@ class ElfBricks:
     def add_section_header(self, section_header):
         self.new_section_header_list.append(section_header)
 
+    # new_data is a bytearray: the edits below are done in place, so that
+    # the image is not copied again on every edit
     def overwrite_rodata_section(self, rodata_offset, new_rodata):
         size = len(new_rodata)
-        old_rodata = self.new_data[rodata_offset: rodata_offset+size]
-        self.new_data = self.new_data[:rodata_offset] + new_rodata + self.new_data[rodata_offset + size:]
+        self.new_data[rodata_offset: rodata_offset+size] = new_rodata
 
     def reset_data(self, data):
-        self.new_data = data
+        self.new_data = bytearray(data)
     def add_data(self, addtional_data):
         self.new_data += addtional_data
 
@@ -718,10 +717,10 @@ class ElfBricks:
 
         new_dynsym = b''
         for entry in elfBricks._dynsym_list:
-            name1 = str(elfBricks._dynstr[entry.st_name:].decode('utf-8')).split('\x00')[0]
+            name1 = get_cstr(elfBricks._dynstr, entry.st_name)
             if entry.st_name:
                 entry.st_name += len(self._dynstr)
-                name2 = str(new_dynstr[entry.st_name:].decode('utf-8')).split('\x00')[0]
+                name2 = get_cstr(new_dynstr, entry.st_name)
                 assert name1 == name2, 'symbol table mismatch'
                 if entry.st_value and elfBricks.is_in_plt_section(entry.st_value):
                     entry.st_value = 0
@@ -794,7 +793,7 @@ class ElfBricks:
             if sec_header.sh_addr == addr:
                 offset = sec_header.sh_offset
                 assert size == sec_header.sh_size, 'different section size'
-                self.new_data = self.new_data[:offset] + new_sec_data + self.new_data[offset+size:]
+                self.new_data[offset:offset+size] = new_sec_data
                 return
 
         assert False, 'Could not found target section %s'%(hex(addr))
@@ -908,17 +907,13 @@ class ElfBricks:
         new_base = self._vaddr_range.start
 
         # 1. read target file
-        additional_data = b''
-        with open(target, 'rb') as f:
-            additional_data = f.read()
-
         elfBricks = ElfBricks(target)
 
-        zeros = b'\x00' * (new_base - len(additional_data))
-        additional_data += zeros
-
         data_start_offset = self._offset_range.start
-        self.reset_data(additional_data)
+        self.reset_data(elfBricks._data)
+        if len(self.new_data) < new_base:
+            self.new_data.extend(bytes(new_base - len(self.new_data)))
+        additional_data_length = len(self.new_data)
 
         # overwrite original rodata section
         if self._myrodata_sec:
@@ -927,7 +922,6 @@ class ElfBricks:
         self.add_data(self._data[data_start_offset:])
 
         # 2. create program header
-        additional_data_length = len(additional_data)
         additional_offset = additional_data_length - self._offset_range.start
         new_program_header_list = self.fix_program_headers(self._program_header_list, additional_offset)
         self.reset_program_header_list(new_program_header_list)
@@ -969,7 +963,7 @@ class ElfBricks:
         for prog_header in self.new_program_header_list:
             if prog_header.p_type in [int(ProgramType.PT_DYNAMIC)]:
                 remain = prog_header.p_offset + len(new_dynamic_section)
-                self.new_data = self.new_data[:prog_header.p_offset] + new_dynamic_section + self.new_data[remain:]
+                self.new_data[prog_header.p_offset:remain] = new_dynamic_section
                 break
 
         # 3-4. create section header & program header
@@ -1008,16 +1002,15 @@ class ElfBricks:
         new_header.e_shnum = len(self.new_section_header_list)
         new_header.e_shstrndx = len(self.new_section_header_list) - 1
 
-        with open(filename, 'wb') as f:
-            offset = f.write(Pack(new_header))
-
-            for p_header in self.new_program_header_list:
-                offset += f.write(Pack(p_header))
-
-            offset += f.write(self.new_data[offset:])
+        # the headers are written over the start of new_data, and the image
+        # itself is written from a view instead of a copy
+        headers = [Pack(new_header)] + [Pack(p_header) for p_header in self.new_program_header_list]
+        offset = sum(len(header) for header in headers)
+        buffers = headers + [memoryview(self.new_data)[offset:]]
+        buffers += [Pack(s_header) for s_header in self.new_section_header_list]
 
-            for s_header in self.new_section_header_list:
-                offset += f.write(Pack(s_header))
+        with open(filename, 'wb') as f:
+            f.writelines(buffers)
 
     def get_load_segment_info(self):
         load_prog_header_list = []
@@ -1046,7 +1039,7 @@ class ElfBricks:
 
         for idx in range(self._header.e_phnum):
             phoff = offset + idx * entsize
-            p_header = Unpack(ProgramHeader, data[phoff: phoff + entsize])
+            p_header = Unpack(ProgramHeader, data, phoff)
             program_header_list.append(p_header)
         return program_header_list
 
@@ -1061,8 +1054,8 @@ class ElfBricks:
         entsize = self._header.e_shentsize
 
         shoff = offset + self._header.e_shstrndx * entsize
-        sec_header = Unpack(SectionHeader, data[shoff: shoff + entsize])
-        return sec_header, data[sec_header.sh_offset: sec_header.sh_offset + sec_header.sh_size]
+        sec_header = Unpack(SectionHeader, data, shoff)
+        return sec_header, bytes(data[sec_header.sh_offset: sec_header.sh_offset + sec_header.sh_size])
 
     def get_section_list(self, data):
 
@@ -1072,8 +1065,8 @@ class ElfBricks:
 
         for idx in range(self._header.e_shnum):
             shoff = offset + idx * entsize
-            sec_header = Unpack(SectionHeader, data[shoff: shoff + entsize])
-            sec_name = str(self._shstrtab[sec_header.sh_name:].decode('utf-8')).split('\x00')[0]
+            sec_header = Unpack(SectionHeader, data, shoff)
+            sec_name = get_cstr(self._shstrtab, sec_header.sh_name)
             if sec_header.sh_type in [8]: # SHT_NOBITS
                 offset_range = range(sec_header.sh_offset, sec_header.sh_offset)
                 body = b''
@@ -1113,8 +1106,7 @@ class ElfBricks:
 
 class ElfInfo(ElfBricks):
     def __init__(self, filename):
-        with open(filename, 'rb') as f:
-            data = f.read()
+        data = open_elf(filename).data
 
         self._header = Unpack(ELFHeader, data)
         self._program_header_list = self.get_program_header_list(data)
@@ -1142,6 +1134,72 @@ class ElfInfo(ElfBricks):
             lib_option.append('-l'+name)
         return lib_option
 
+
+class ElfModel:
+    '''
+    A binary shared by the parsers that read it: EParser, CFIInfo and
+    ElfBricks. The file is opened and mapped once, and each view of it is
+    built on first use:
+
+    - bricks: the ElfBricks of the file, i.e. the sections, .dynsym/.dynstr
+      and the relocations
+    - elffile: a pyelftools ELFFile on the same map, for the DWARF CFI
+    - get_section_data(): the contents of a section such as .eh_frame or
+      .gcc_except_table
+    - header and sections: the ELF header and the sections of the bricks,
+      in section header order
+    '''
+    def __init__(self, filename):
+        self.filename = filename
+        self.data = map_file(filename)
+        self._bricks = None
+        self._elffile = None
+        self.section_data = dict()
+
+    @property
+    def bricks(self):
+        if self._bricks is None:
+            self._bricks = ElfBricks(self)
+        return self._bricks
+
+    @property
+    def elffile(self):
+        if self._elffile is None:
+            # the mmap behind the view is a file-like object
+            self._elffile = ELFFile(self.data.obj)
+        return self._elffile
+
+    @property
+    def header(self):
+        return self.bricks._header
+
+    @property
+    def sections(self):
+        return self.bricks._sec_list
+
+    def get_section(self, name):
+        for sec in self.sections:
+            if sec.name == name:
+                return sec
+        return None
+
+    def get_section_data(self, name):
+        # (contents, address) of a section, or (b'', 0) without the section
+        if name not in self.section_data:
+            sec = self.get_section(name)
+            if sec is None:
+                self.section_data[name] = (b'', 0)
+            else:
+                self.section_data[name] = (bytes(sec.body), sec.header.sh_addr)
+        return self.section_data[name]
+
+
+def open_elf(elf):
+    # the parsers take an ElfModel to share, or the path of the binary
+    if isinstance(elf, ElfModel):
+        return elf
+    return ElfModel(elf)
+
 import argparse
 
 if __name__ == '__main__':
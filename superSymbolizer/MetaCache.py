@@ -0,0 +1,125 @@
+import hashlib
+import os
+import shutil
+import subprocess
+
+# bump this when the metadata produced by superCFGBuilder changes in a way
+# its sources do not show (e.g. a B2R2 update)
+BUILDER_VERSION = '1'
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'suri')
+DEFAULT_CACHE_SIZE = 4096   # MiB
+
+
+def sha256_file(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as fd:
+        for chunk in iter(lambda: fd.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def get_builder_version(builder_dir):
+    h = hashlib.sha256(BUILDER_VERSION.encode())
+    for root, dirs, files in os.walk(builder_dir):
+        dirs[:] = sorted(d for d in dirs if d not in ['bin', 'obj'])
+        for name in sorted(files):
+            if name.endswith('.fs') or name.endswith('.fsproj'):
+                path = os.path.join(root, name)
+                h.update(os.path.relpath(path, builder_dir).encode())
+                with open(path, 'rb') as fd:
+                    h.update(fd.read())
+    return h.hexdigest()
+
+
+def get_image_version(image):
+    # the ID of a Docker image changes whenever the image is rebuilt
+    try:
+        result = subprocess.run(['docker', 'image', 'inspect', '--format', '{{.Id}}', image],
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    except OSError:
+        return None
+    image_id = result.stdout.decode().strip()
+    if result.returncode != 0 or not image_id:
+        return None
+    h = hashlib.sha256(BUILDER_VERSION.encode())
+    h.update(image_id.encode())
+    return h.hexdigest()
+
+
+class MetaCache:
+    '''
+    Content-addressed cache of superCFGBuilder outputs. An entry is keyed by
+    the SHA-256 of the input binary, the builder version and the mode
+    (syntax, asan, output format). The builder version is a digest of the
+    superCFGBuilder sources in builder_dir, or of the ID of builder_image
+    when the builder runs in that Docker image. Entries are evicted in
+    least recently used order once the cache grows beyond max_size bytes.
+    '''
+    def __init__(self, builder_dir, cache_dir=DEFAULT_CACHE_DIR, max_size=DEFAULT_CACHE_SIZE << 20, builder_image=None):
+        self.builder_dir = builder_dir
+        self.builder_image = builder_image
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.builder_version = None
+        self.bin_hash = dict()
+
+    def get_key(self, bin_file, mode):
+        # None when the version of the builder cannot be told
+        if self.builder_version is None:
+            if self.builder_image:
+                self.builder_version = get_image_version(self.builder_image)
+                if self.builder_version is None:
+                    # nothing to key by; the builder cannot run either
+                    return None
+            else:
+                self.builder_version = get_builder_version(self.builder_dir)
+        if bin_file not in self.bin_hash:
+            self.bin_hash[bin_file] = sha256_file(bin_file)
+        key = '%s:%s:%s'%(self.bin_hash[bin_file], self.builder_version, mode)
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    def get_path(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def fetch(self, key, out_file):
+        path = self.get_path(key)
+        # another process may evict the entry at any time
+        try:
+            shutil.copyfile(path, out_file)
+            # the modification time orders entries for eviction
+            os.utime(path)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def store(self, key, meta_file):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self.get_path(key)
+        tmp_path = '%s.%d.tmp'%(path, os.getpid())
+        shutil.copyfile(meta_file, tmp_path)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def evict(self):
+        entries = []
+        total = 0
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.tmp'):
+                continue
+            path = self.get_path(name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
@@ -0,0 +1,52 @@
+import os
+import sys
+import time
+
+from superSymbolizer.lib.MetaPack import pack_meta
+from superSymbolizer.lib.MetaReader import load_asan_meta, load_meta
+
+
+def load(meta_file, asan):
+    if asan:
+        return load_asan_meta(meta_file)
+    return load_meta(meta_file)
+
+def measure(fn, repeat):
+    elapsed = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed.append(time.perf_counter() - start)
+    return min(elapsed)
+
+
+import argparse
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert superCFGBuilder JSON metadata to the packed format')
+    parser.add_argument('json_meta_file', type=str)
+    parser.add_argument('packed_meta_file', type=str)
+    parser.add_argument('--asan', action='store_true', help='the input is ASan metadata')
+    parser.add_argument('--check', action='store_true', help='decode the packed file and compare it with the JSON file')
+    parser.add_argument('--bench', type=int, default=0, metavar='N', help='report the best parse time of N runs')
+
+    args = parser.parse_args()
+
+    data = load(args.json_meta_file, args.asan)
+    pack_meta(data, args.packed_meta_file)
+
+    if args.check:
+        if load(args.packed_meta_file, args.asan) != data:
+            print('[-] %s does not match %s'%(args.packed_meta_file, args.json_meta_file))
+            sys.exit(1)
+        print('[+] %s matches %s'%(args.packed_meta_file, args.json_meta_file))
+
+    if args.bench:
+        del data
+        json_size = os.path.getsize(args.json_meta_file)
+        packed_size = os.path.getsize(args.packed_meta_file)
+        json_time = measure(lambda: load(args.json_meta_file, args.asan), args.bench)
+        packed_time = measure(lambda: load(args.packed_meta_file, args.asan), args.bench)
+        print('%-8s %12s %10s'%('format', 'size(B)', 'parse(s)'))
+        print('%-8s %12d %10.3f'%('json', json_size, json_time))
+        print('%-8s %12d %10.3f'%('msgpack', packed_size, packed_time))
+        print('size %.2fx smaller, parse %.2fx faster'%(json_size/packed_size, json_time/packed_time))
@@ -0,0 +1,184 @@
+import contextlib
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+
+def reset_peak_rss():
+    # Linux resets VmHWM of the process when 5 is written to clear_refs
+    try:
+        with open('/proc/self/clear_refs', 'w') as fd:
+            fd.write('5')
+    except OSError:
+        return False
+    return True
+
+def get_peak_rss():
+    try:
+        with open('/proc/self/status') as fd:
+            for line in fd:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+# Runs a stage command and writes its peak RSS to the fd given first. A
+# process forked from us starts with our resident pages, and exec keeps
+# that high-water mark, so wait4 would report our footprint for a small
+# command. The grandchild spawned by this small interpreter does not
+# inherit it; its peak is at least the few MiB of the interpreter.
+STAGE_WRAPPER = '''
+import os, resource, signal, sys
+fd = int(sys.argv[1])
+# the command must not hold the pipe open, e.g. through a daemon it starts
+os.set_inheritable(fd, False)
+try:
+    pid = os.posix_spawnp(sys.argv[2], sys.argv[2:], os.environ)
+except OSError as e:
+    os.write(fd, ('error %s'%(e)).encode())
+    sys.exit(127)
+signal.signal(signal.SIGINT, signal.SIG_IGN)
+_, status = os.waitpid(pid, 0)
+os.write(fd, str(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss).encode())
+if os.WIFSIGNALED(status):
+    if os.WTERMSIG(status) != signal.SIGKILL:
+        signal.signal(os.WTERMSIG(status), signal.SIG_DFL)
+    os.kill(os.getpid(), os.WTERMSIG(status))
+sys.exit(os.WEXITSTATUS(status))
+'''
+
+def get_exit_code(status):
+    # os.waitstatus_to_exitcode needs Python 3.9; Popen's convention is -signal
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+def get_cpu_time(who):
+    usage = resource.getrusage(who)
+    return usage.ru_utime + usage.ru_stime
+
+
+class StageRunner:
+    '''
+    Runs the stages of a rewrite and records, for each stage, the exit
+    status, wall-clock time, CPU time and peak RSS (KiB). A stage is either
+    an external command (run) or a block of Python code (stage); the latter
+    accounts for the subprocesses it waits for, e.g. a symbolization pool.
+    Commands run in Docker are only measured on the client side. The peak
+    RSS of a command is its own (see STAGE_WRAPPER); that of a block of
+    code is the one of this process.
+    '''
+    def __init__(self, verbose=False):
+        self.verbose = verbose
+        self.stages = []
+        # pid -> (record, start time, read end of the peak RSS pipe) of the
+        # commands being run
+        self.running = dict()
+
+    def run(self, name, cmd, **kwargs):
+        proc = self.start(name, cmd, **kwargs)
+        if proc is None:
+            return None
+        return self.wait(proc)
+
+    def start(self, name, cmd, **kwargs):
+        '''
+        Start a command without waiting for it, e.g. to feed its stdin.
+        Returns the Popen object, to be passed to wait(), or None if the
+        command could not be started.
+        '''
+        if self.verbose:
+            print(' '.join(cmd))
+        sys.stdout.flush()
+
+        record = {'stage':name, 'command':cmd}
+        start = time.perf_counter()
+        rss_read, rss_write = os.pipe()
+        try:
+            proc = subprocess.Popen([sys.executable, '-I', '-S', '-c', STAGE_WRAPPER, str(rss_write)] + cmd,
+                                    pass_fds=(rss_write,), **kwargs)
+        except OSError as e:
+            os.close(rss_read)
+            record.update({'returncode':None, 'error':str(e), 'wall':0.0})
+            self.stages.append(record)
+            return None
+        finally:
+            os.close(rss_write)
+        self.running[proc.pid] = (record, start, rss_read)
+        return proc
+
+    def wait(self, proc):
+        record, start, rss_read = self.running.pop(proc.pid)
+        # wait4 reports the usage of the command and of the children it waited for
+        _, status, usage = os.wait4(proc.pid, 0)
+        with os.fdopen(rss_read) as fd:
+            peak_rss = fd.read()
+        proc.returncode = get_exit_code(status)
+        record['wall'] = time.perf_counter() - start
+        record['cpu'] = usage.ru_utime + usage.ru_stime
+        if peak_rss.startswith('error '):
+            # the command could not be started
+            proc.returncode = None
+            record['error'] = peak_rss[len('error '):]
+            print('[-] %s: %s'%(record['stage'], record['error']))
+        elif peak_rss:
+            record['peak_rss'] = int(peak_rss)
+        else:
+            # the wrapper itself was killed
+            record['peak_rss'] = usage.ru_maxrss
+        record['returncode'] = proc.returncode
+        self.stages.append(record)
+
+        if proc.returncode not in [0, None]:
+            print('[-] %s failed with exit status %d'%(record['stage'], proc.returncode))
+        return proc.returncode
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        '''
+        The block may set 'returncode' and 'error' of the yielded record to
+        report a failure that is not an exception.
+        '''
+        record = {'stage':name, 'returncode':0}
+        has_peak = reset_peak_rss()
+        cpu_self = get_cpu_time(resource.RUSAGE_SELF)
+        cpu_children = get_cpu_time(resource.RUSAGE_CHILDREN)
+        rss_children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        start = time.perf_counter()
+        try:
+            yield record
+        except Exception as e:
+            record['returncode'] = None
+            record['error'] = '%s: %s'%(type(e).__name__, e)
+            raise
+        finally:
+            record['wall'] = time.perf_counter() - start
+            record['cpu'] = get_cpu_time(resource.RUSAGE_SELF) - cpu_self + \
+                            get_cpu_time(resource.RUSAGE_CHILDREN) - cpu_children
+            # without clear_refs this is the peak of the whole process so far
+            peak_rss = get_peak_rss() if has_peak else resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            # the children's peak only tells about this stage if it grew here
+            peak_children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+            if peak_children > rss_children:
+                peak_rss = max(peak_rss, peak_children)
+            record['peak_rss'] = peak_rss
+            self.stages.append(record)
+
+    def failed(self):
+        return [record['stage'] for record in self.stages if record['returncode'] != 0]
+
+    def get_report(self):
+        return {'wall':sum(record['wall'] for record in self.stages),
+                'cpu':sum(record.get('cpu', 0.0) for record in self.stages),
+                'peak_rss':max([record.get('peak_rss', 0) for record in self.stages] or [0]),
+                'stages':self.stages}
+
+    def write_report(self, report_file, **extra):
+        report = dict(extra)
+        report.update(self.get_report())
+        with open(report_file, 'w') as fd:
+            json.dump(report, fd, indent=2)
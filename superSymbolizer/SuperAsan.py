@@ -1,35 +1,47 @@
-import json
+import os
 import re
+import sys
+import time
 from superSymbolizer.SuperSymbolizer import SuperSymbolizer
+from superSymbolizer.lib.CFGSerializer import ALL_LIVE, FLAGS, NOT_SCRATCH, REG_BIT, SUB_REGISTERS, \
+    get_operand_regs, get_written_regs
+from superSymbolizer.lib.MetaReader import load_asan_meta
+from superSymbolizer.lib.Misc import REGISTERS_x64
+
+# the registers a shadow check uses when it has to save them, and the TLS
+# slots they are saved to
+CHECK_REGS = ['RDI', 'RSI', 'RDX', 'RCX']
+SPILL_SLOTS = ['fs:0x70', 'fs:0x78', 'fs:0x80']
 
 
 class SuperAsan(SuperSymbolizer):
+    # the shadow checks only save the registers and flags that are live
+    keep_liveness = True
 
     def read_asan_meta(self, meta_file):
-        with open(meta_file) as f:
-            data = json.load(f)
-            self.asan_dict = {item['Addr']:item['InstList'] for item in data}
+        data = load_asan_meta(meta_file)
+        self.asan_dict = {item['Addr']:item['InstList'] for item in data}
 
 
     def print_stack_poisoning(self, code, fun_addr):
         op_str = ' '.join(code.code.split()[1:])
         reg = op_str.split(', ')[1]
         dest = op_str.split(', ')[0]
-        self.write_code('#------- STACK POISON %s %s------'%(fun_addr, code.addr))
-        self.write_code('\tlea %s, %s'%(reg, dest))
-        self.write_code('\tshr %s, 0x3'%(reg))
-        self.write_code('\tmov BYTE PTR [%s+0x7fff8000], 0xff'%(reg))
-        self.write_code('#----------------------------------')
+        self.write_lines(['#------- STACK POISON %s %s------'%(fun_addr, code.addr),
+                          '\tlea %s, %s'%(reg, dest),
+                          '\tshr %s, 0x3'%(reg),
+                          '\tmov BYTE PTR [%s+0x7fff8000], 0xff'%(reg),
+                          '#----------------------------------'])
 
     def print_stack_unpoisoning(self, code, fun_addr):
         op_str = ' '.join(code.code.split()[1:])
         reg = op_str.split(', ')[0]
         dest = op_str.split(', ')[1]
-        self.write_code('#------- STACK UNPOISON %s %s------'%(fun_addr, code.addr))
-        self.write_code('\tlea %s, %s'%(reg, dest))
-        self.write_code('\tshr %s, 0x3'%(reg))
-        self.write_code('\tmov BYTE PTR [%s+0x7fff8000], 0x0'%(reg))
-        self.write_code('#----------------------------------')
+        self.write_lines(['#------- STACK UNPOISON %s %s------'%(fun_addr, code.addr),
+                          '\tlea %s, %s'%(reg, dest),
+                          '\tshr %s, 0x3'%(reg),
+                          '\tmov BYTE PTR [%s+0x7fff8000], 0x0'%(reg),
+                          '#----------------------------------'])
         #print(code.code)
 
     def print_reassem_fun_code(self, fun_addr):
@@ -50,10 +62,17 @@ class SuperAsan(SuperSymbolizer):
             self.write_code('\t.align 8')
 
         asan_meta = {item['Addr']:item for item in self.asan_dict[fun_addr]}
+        live_before = fun_symbolizer.live_before
+        # the operands checked since the last label, from --optimization 1
+        checked = None
+        if self.opt_level >= 1:
+            checked = dict()
         bStackPoison = False
         poison_code = []
         for idx, code in enumerate(reassem_code):
             if code.label:
+                if checked:
+                    checked.clear()
                 if code.comment:
                     self.write_code('%-40s: %s'%(code.label))
                 else:
@@ -69,9 +88,12 @@ class SuperAsan(SuperSymbolizer):
                     if bStackPoison and idx + 1 < len(reassem_code) and \
                         reassem_code[idx+1].code and reassem_code[idx+1].code.split()[-1] in ['FS:[0x28]']:
                             self.print_stack_unpoisoning(reassem_code[idx], fun_addr)
+                            if checked:
+                                checked.clear()
                     else:
                         meta = asan_meta[code.addr]
-                        self.add_mem_check_instrument(fun_addr, code, meta)
+                        live = live_before.get(code.addr, ALL_LIVE)
+                        self.add_mem_check_instrument(fun_addr, code, meta, live, checked)
                 else:
                     if code.code.split()[-1] in ['FS:[0x28]']:
                         if reassem_code[idx+1].code.startswith('mov qword ptr'):
@@ -79,12 +101,16 @@ class SuperAsan(SuperSymbolizer):
                             if self.bStack:
                                 self.print_stack_poisoning(reassem_code[idx+1], fun_addr)
                                 bStackPoison = True
+                                if checked:
+                                    checked.clear()
                             poison_code.append(idx+1)
 
                 if not code.comment:
                     self.write_code('\t%s'%(code.code))
                 elif code.code and code.comment:
                     self.write_code('\t%-40s %s'%(code.code, code.comment))
+                if checked:
+                    self.update_checked(checked, code.code)
 
             if '.cfi_personality 0x9b,DW.ref.__gxx_personality_v0' in code.code:
                 self.need_gxx_personality_symbol = True
@@ -121,7 +147,27 @@ class SuperAsan(SuperSymbolizer):
                     self.write_code('\t%-40s %s'%(code.code, code.comment))
         '''
 
-    def add_mem_check_instrument(self, fun_addr, code, meta):
+    def update_checked(self, checked, reassem):
+        # directives and commented-out instructions do not run
+        if reassem.startswith('.') or reassem.startswith('#'):
+            return
+        written = get_written_regs(reassem, 'intel')
+        if written == ALL_LIVE:
+            checked.clear()
+            return
+        for operand, (_, regs) in list(checked.items()):
+            if regs & written:
+                del checked[operand]
+
+    def add_mem_check_instrument(self, fun_addr, code, meta, live=ALL_LIVE, checked=None):
+        '''
+        Check the shadow memory of the first 8- to 64-bit access of code.
+        live is the mask of the registers and flags live before it; dead ones
+        are used without saving them. checked maps the operands checked since
+        the last label, branch or call whose registers have not changed since
+        to the size of their access; such an operand is not checked again
+        unless the access is wider.
+        '''
         reassem = code.code
         operands = reassem.split(',')
 
@@ -135,51 +181,91 @@ class SuperAsan(SuperSymbolizer):
                 if ck and len(ck[0]) > 10:
                     continue
 
-                label = '.LC_ASAN_%x_%x'%(int(fun_addr, 16), int(code.addr, 16))
-
-                self.write_code('#----------------------------------')
-                # save register value
-                self.write_code('\tmov fs:0x70, rdi')
-                self.write_code('\tlea rdi, %s'%(operand))
-                self.write_code('\tmov fs:0x78, rax')
-
-                # save flag register
-                self.write_code('\tseto al')
-                self.write_code('\tlahf')
-                self.write_code('\tmov fs:0x80, rax')
-
-                # check shadow memory
-                self.write_code('\tmov rax, rdi')
-                self.write_code('\tshr rax, 0x3')
-                #self.write_code('\tcmp BYTE PTR [rax+0x7fff8000], 0x0')
-                self.write_code('\tmov al, BYTE PTR [rax+0x7fff8000]')
-                self.write_code('\ttest al, al')
-                self.write_code('\tje %s'%(label))
-
-                if acc_size < 64:
-                    self.write_code('\tand edi, 0x7')
-                    #self.write_code('\tadd edi, 0x3')
-                    self.write_code('\tmovsx eax, al')
-                    self.write_code('\tcmp edi, eax')
-                    self.write_code('\tjl %s'%(label))
+                # the 64-bit check only tests the whole granule, the others
+                # are the same for any size
+                if checked is not None:
+                    if operand in checked and (checked[operand][0] == 64 or acc_size < 64):
+                        return
+                    checked[operand] = (acc_size, get_operand_regs(operand, 'intel'))
 
-                self.write_code('\tcall __asan_report_load%d@plt'%(int(acc_size/8)))
-
-                self.write_code('%s:'%(label))
-
-                # restore flag register
-                self.write_code('\tmov rax, fs:0x80')
-                self.write_code('\tadd al, 0x7f')
-                self.write_code('\tsahf')
-
-                # restore register value
-                self.write_code('\tmov rax, fs:0x78')
-                self.write_code('\tmov rdi, fs:0x70')
-
-                self.write_code('#----------------------------------')
+                label = '.LC_ASAN_%x_%x'%(int(fun_addr, 16), int(code.addr, 16))
+                self.write_lines(self.get_mem_check_code(operand, acc_size, label, live))
 
                 return
 
+    def get_check_regs(self, live):
+        '''
+        The address and the shadow registers of a check, dead ones first,
+        and the registers to save. While the flags are live, AX holds them.
+        '''
+        busy = NOT_SCRATCH
+        if live & FLAGS:
+            busy |= REG_BIT['RAX']
+        regs = [reg for reg in REGISTERS_x64 if not (live | busy) & REG_BIT[reg]]
+        # __asan_report_* takes the address in RDI
+        if 'RDI' in regs:
+            regs.remove('RDI')
+            regs.insert(0, 'RDI')
+        for reg in CHECK_REGS:
+            if reg not in regs:
+                regs.append(reg)
+        regs = regs[:2]
+
+        saved = [reg for reg in regs if live & REG_BIT[reg]]
+        if live & FLAGS and live & REG_BIT['RAX']:
+            saved.append('RAX')
+        return regs[0], regs[1], saved
+
+    def get_mem_check_code(self, operand, acc_size, label, live):
+        addr_reg, shadow_reg, saved = self.get_check_regs(live)
+        flags_live = live & FLAGS
+        addr32 = SUB_REGISTERS[addr_reg][0].lower()
+        shadow32 = SUB_REGISTERS[shadow_reg][0].lower()
+        addr_reg = addr_reg.lower()
+        shadow_reg = shadow_reg.lower()
+
+        lines = ['#----------------------------------']
+        # save register value
+        for reg, slot in zip(saved, SPILL_SLOTS):
+            lines.append('\tmov %s, %s'%(slot, reg.lower()))
+        lines.append('\tlea %s, %s'%(addr_reg, operand))
+
+        # save flag register
+        if flags_live:
+            lines.append('\tseto al')
+            lines.append('\tlahf')
+
+        # check shadow memory
+        lines.append('\tmov %s, %s'%(shadow_reg, addr_reg))
+        lines.append('\tshr %s, 0x3'%(shadow_reg))
+        lines.append('\tmovsx %s, BYTE PTR [%s+0x7fff8000]'%(shadow32, shadow_reg))
+        lines.append('\ttest %s, %s'%(shadow32, shadow32))
+        lines.append('\tje %s'%(label))
+
+        if acc_size < 64:
+            lines.append('\tand %s, 0x7'%(addr32))
+            lines.append('\tcmp %s, %s'%(addr32, shadow32))
+            lines.append('\tjl %s'%(label))
+
+        # the report does not return, so RDI need not be restored
+        if addr_reg != 'rdi':
+            lines.append('\tmov rdi, %s'%(addr_reg))
+        lines.append('\tcall __asan_report_load%d@plt'%(int(acc_size/8)))
+
+        lines.append('%s:'%(label))
+
+        # restore flag register
+        if flags_live:
+            lines.append('\tadd al, 0x7f')
+            lines.append('\tsahf')
+
+        # restore register value
+        for reg, slot in reversed(list(zip(saved, SPILL_SLOTS))):
+            lines.append('\tmov %s, %s'%(reg.lower(), slot))
+
+        lines.append('#----------------------------------')
+        return lines
+
 
     def print_asan_init(self):
         self.write_code('.section .init_array')
@@ -205,13 +291,15 @@ class SuperAsan(SuperSymbolizer):
         self.write_code('\tpop rax')
         self.write_code('\tret')
 
-    def create_reassem_file(self, filename, bStack):
+    def create_reassem_file(self, filename, bStack, shards=1):
         self.bStack = bStack
-        with open(filename, 'w') as fd:
-            self.fd = fd
+        start = time.perf_counter()
+        with self.open_writer(filename, shards) as writer:
+            self.writer = writer
             self.print_reassem_code()
             self.print_asan_init()
-        self.fd = None
+        self.writer = None
+        self.write_profile(filename, start)
 
 import argparse
 if __name__ == '__main__':
@@ -219,17 +307,39 @@ if __name__ == '__main__':
     parser.add_argument('bin_file', type=str)
     parser.add_argument('b2r2_meta_file', type=str)
     parser.add_argument('b2r2_asan_file', type=str)
-    parser.add_argument('reassembly_file', type=str)
+    parser.add_argument('reassembly_file', type=str, help='the reassembly file, or - for stdout')
     parser.add_argument('--optimization', type=int, default=0)
     parser.add_argument('--syntax', type=str, default='intel')
     parser.add_argument('--no-endbr', dest='endbr', action='store_false')
     parser.add_argument('--with-stack-poisoning', dest='stack', action='store_true')
+    parser.add_argument('--jobs', type=int, default=1)
+    parser.add_argument('--stream-meta', dest='stream_meta', action='store_true')
+    parser.add_argument('--profile', type=int, nargs='?', const=20, default=0, metavar='N',
+                        help='time the symbolization phases and list the N slowest functions (default 20)')
+    parser.add_argument('--shards', type=int, default=1, metavar='N',
+                        help='split the reassembly into N files along function boundaries')
+    parser.add_argument('--stream-emit', dest='stream_emit', action='store_true',
+                        help='symbolize each function while printing it and drop it afterwards')
+    parser.add_argument('--layout', type=str, metavar='PROFILE',
+                        help='print the hot functions of an execution profile first and the false blocks in .text.unlikely')
 
     args = parser.parse_args()
 
-    sym = SuperAsan(args.bin_file, args.b2r2_meta_file, args.optimization, args.syntax)
+    reassem_file = args.reassembly_file
+    profile_file = None
+    if args.shards > 1 and reassem_file == '-':
+        parser.error('--shards needs a reassembly file')
+    if reassem_file == '-':
+        # stdout only carries the assembly; everything else goes to stderr
+        reassem_file = sys.stdout
+        sys.stdout = sys.stderr
+        profile_file = os.path.splitext(args.b2r2_meta_file)[0] + '.profile.json'
+
+    sym = SuperAsan(args.bin_file, args.b2r2_meta_file, args.optimization, args.syntax, args.stream_meta, args.profile,
+                    layout=args.layout)
+    sym.profile_file = profile_file
     sym.read_asan_meta(args.b2r2_asan_file)
-    sym.symbolize(args.endbr)
-    sym.create_reassem_file(args.reassembly_file, args.stack)
+    sym.symbolize(args.endbr, jobs=args.jobs, stream_emit=args.stream_emit)
+    sym.create_reassem_file(reassem_file, args.stack, args.shards)
     #sym.print_reassem_code()
     #sym.report_statistics()
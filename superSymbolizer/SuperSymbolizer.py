@@ -1,25 +1,80 @@
+import os
 import struct
+import sys
+import time
+import multiprocessing
 
-from superSymbolizer.ElfBricks import ElfBricks
+from superSymbolizer.ElfBricks import ElfModel
+from superSymbolizer.lib.AsmWriter import AsmWriter, ShardWriter, shard_paths
+from superSymbolizer.lib.CFGSerializer import construct_CFG
 from superSymbolizer.lib.CFIInfo import CFIInfo
-from superSymbolizer.lib.LocalSymbolizer import LocalSymbolizer
+from superSymbolizer.lib.ElfDef import get_cstr
+from superSymbolizer.lib.FunStream import FunStream
+from superSymbolizer.lib.Layout import load_exec_profile, order_by_profile
+from superSymbolizer.lib.LocalSymbolizer import LocalSymbolizer, merge_fde_ranges
+from superSymbolizer.lib.MetaReader import load_meta, open_meta_reader, summarize_fun_info
 from superSymbolizer.lib.Misc import EParser, FunBriefInfo
-import json
+from superSymbolizer.lib.Profiler import SymbolizerProfile
 import re
 
-class SuperSymbolizer:
+# (symbolizer, rip_access_list, visit_log, disable_super_symbolize) shared with
+# the worker processes. It is set right before the pool is forked, so workers
+# inherit it instead of receiving a pickled copy per task.
+_worker_args = None
+
+def _symbolize_worker(task):
+    sym, rip_access_list, visit_log, disable_super_symbolize = _worker_args
+    fun_addr, fun_info = task
+    return sym.symbolize_fun(fun_addr, fun_info, rip_access_list, visit_log, disable_super_symbolize)
 
-    def __init__(self, bin_file, meta_file, opt_level=0, syntax='intel'):
-        with open(meta_file) as f:
-            data = json.load(f)
+class SuperSymbolizer:
+    # keep the liveness of the memory accesses for the printing phase
+    keep_liveness = False
+
+    def __init__(self, bin_file, meta_file, opt_level=0, syntax='intel', stream_meta=False, profile=0, lean=False,
+                 layout=None):
+        # with profile = N > 0, the phases of the symbolization are timed and
+        # the N slowest functions are listed
+        self.profile = None
+        if profile:
+            self.profile = SymbolizerProfile(profile)
+        # where the profile goes when the reassembly is not written to a
+        # path; by default it is written next to the reassembly file
+        self.profile_file = None
+        start = time.perf_counter()
+
+        # In stream mode funDict only holds the summary of each function and
+        # the superset CFGs are decoded again, one at a time, while
+        # symbolizing.
+        self.meta_reader = None
+        if stream_meta:
+            self.meta_reader = open_meta_reader(meta_file)
+            self.funDict = dict()
+            for fun_addr, fun_info in self.meta_reader.iter_fun_dict():
+                self.funDict[fun_addr] = summarize_fun_info(fun_addr, fun_info)
+            self.false_fun_list = self.meta_reader.meta['FalseFunList']
+            self.plt_dict = self.meta_reader.meta['PLTDict']
+        else:
+            data = load_meta(meta_file)
             self.funDict = data['FunDict']
             self.false_fun_list = data['FalseFunList']
             self.plt_dict = data['PLTDict']
+        start = self.add_profile_phase('load_meta', start)
 
-        eparser = EParser(bin_file)
+        # EParser, CFIInfo and ElfBricks share one parse of the binary
+        self.elf = ElfModel(bin_file)
+        eparser = EParser(self.elf)
+        start = self.add_profile_phase('EParser', start)
         self.entry = eparser.entry
         self.opt_level = opt_level
         self.syntax = syntax
+        # lean: emit no comments, only code, labels and directives
+        self.lean = lean
+        # with an execution profile (see load_exec_profile), the hot functions
+        # are printed first and the false blocks go to .text.unlikely
+        self.layout = None
+        if layout:
+            self.layout = load_exec_profile(layout)
 
         # add plt that B2R2 missed
         #self.plt_dict = dict()
@@ -39,20 +94,32 @@ class SuperSymbolizer:
         self.total_overlapped_bbls = 0
         self.total_br_sites = 0
         self.multi_br_sites = 0
+        self.br_depth_dict = {}
 
         self.fun_dict = {}
         self.fun_ids = {}
         self.fun_info_dict = {}
         self.main_fun = None
         self.refer_fun_dict = {}
-        self.fd = None
+        self.writer = None
         self.part_fun_dict = {}
+        # with stream_emit, fun_dict is a FunStream
+        self.stream_emit = False
 
-        self.cfi_dict = self.get_cfi_dict(bin_file)
+        start = self.add_profile_phase('find_plt', start)
+        self.cfi_dict = self.get_cfi_dict(self.elf)
+        start = self.add_profile_phase('get_cfi_dict', start)
 
-        self.elfBrick = ElfBricks(bin_file)
+        self.elfBrick = self.elf.bricks
         self.reloc_sym_dict = self.get_reloc_sym_dict(self.elfBrick)
         self.rip_access_addrs = []
+        self.add_profile_phase('ElfBricks', start)
+
+    def add_profile_phase(self, phase, start):
+        now = time.perf_counter()
+        if self.profile:
+            self.profile.total.add(phase, now - start)
+        return now
 
     def get_reloc_sym_dict(self, elfBrick):
         symdict = dict()
@@ -60,7 +127,7 @@ class SuperSymbolizer:
             idx = rela.r_info >> 32
             if idx > 0:
                 sym = elfBrick._dynsym_list[idx]
-                symname = str(elfBrick._dynstr[sym.st_name:].decode('utf-8')).split('\x00')[0]
+                symname = get_cstr(elfBrick._dynstr, sym.st_name)
                 if rela.r_addend:
                     symdict[rela.r_offset] = symname + '+%d'%(rela.r_addend)
                 else:
@@ -70,9 +137,9 @@ class SuperSymbolizer:
                 symdict[rela.r_offset] = rela.r_addend
         return symdict
 
-    def get_cfi_dict(self, bin_file):
+    def get_cfi_dict(self, elf):
         cfi_dict = dict()
-        cfi = CFIInfo(bin_file)
+        cfi = CFIInfo(elf)
         cfi_table = cfi.get_fde_tbl()
         for cfi_info in cfi_table:
             if cfi_info.start_proc in cfi_dict:
@@ -95,7 +162,12 @@ class SuperSymbolizer:
         return self.fun_ids[fun_addr]
 
 
-    def symbolize(self, endbr=True, rip_access_list=None, disable_super_symbolize=False):
+    def symbolize(self, endbr=True, rip_access_list=None, disable_super_symbolize=False, jobs=1, stream_emit=False):
+        '''
+        With stream_emit, the functions are only symbolized when they are
+        printed and dropped right after, so the reassembly can be created
+        once. Only the verdicts on the blocks are computed up front.
+        '''
         for fun_id, fun_addr in enumerate(self.funDict.keys()):
             self.fun_ids[fun_addr] = fun_id
             label = 'fun_%d_%x'%(fun_id, int(fun_addr, 16))
@@ -126,19 +198,24 @@ class SuperSymbolizer:
                 label = 'false_fun_minus_%x'%(-addr)
             self.fun_info_dict[fun_addr] = FunBriefInfo(label, False)
 
+        start = time.perf_counter()
         visit_log=dict()
-        for fun_addr in self.funDict.keys():
-            fun_id = self.fun_ids[fun_addr]
-            fun_label = self.fun_info_dict[fun_addr].label
-            fun_symbolizer = LocalSymbolizer(fun_addr, fun_id, fun_label, self.funDict[fun_addr], self.fun_info_dict,
-                                             self.plt_dict, self.opt_level, self.syntax,
-                                             disable_super_symbolize = disable_super_symbolize)
-            fun_symbolizer.run(self.cfi_dict, self.reloc_sym_dict, rip_access_list, visit_log)
-
-            self.fun_dict[fun_addr] = fun_symbolizer
-            self.update_stat(fun_symbolizer)
-
-            self.rip_access_addrs.extend(fun_symbolizer.rip_access_addrs)
+        if jobs > 1:
+            fun_symbolizers = self.symbolize_parallel(rip_access_list, visit_log, disable_super_symbolize, jobs)
+        else:
+            if stream_emit:
+                self.fill_visit_log(visit_log)
+            fun_symbolizers = (self.symbolize_fun(fun_addr, fun_info, rip_access_list, visit_log, disable_super_symbolize)
+                               for fun_addr, fun_info in self.iter_fun_info())
+
+        self.stream_emit = stream_emit
+        if stream_emit:
+            self.fun_dict = FunStream(self.funDict.keys(), fun_symbolizers, self.add_fun_symbolizer)
+        else:
+            for fun_symbolizer in fun_symbolizers:
+                self.fun_dict[fun_symbolizer.fun_addr] = fun_symbolizer
+                self.add_fun_symbolizer(fun_symbolizer)
+        self.add_profile_phase('symbolize', start)
 
         # search main function
         self.main_fun = self.search_main()
@@ -151,6 +228,67 @@ class SuperSymbolizer:
         self.init_array = self.elfBrick._init_array
         self.fini_array = self.elfBrick._fini_array
 
+    def add_fun_symbolizer(self, fun_symbolizer):
+        fun_addr = fun_symbolizer.fun_addr
+        # drop the superset CFG of the function; only the summary is
+        # used when printing
+        self.funDict[fun_addr] = summarize_fun_info(fun_addr, self.funDict[fun_addr])
+        self.update_stat(fun_symbolizer)
+        if self.profile:
+            self.profile.add_function(fun_addr, fun_symbolizer.profiler)
+
+        self.rip_access_addrs.extend(fun_symbolizer.rip_access_addrs)
+
+    def fill_visit_log(self, visit_log):
+        # A block that is shared by several functions is validated by the
+        # first function that reaches it. Filling visit_log in funDict order
+        # up front gives every function the verdicts of the serial run, in
+        # whatever order the functions are then symbolized.
+        for fun_addr, fun_info in self.iter_fun_info():
+            construct_CFG(fun_addr, fun_info['BBLs'], self.syntax, visit_log)
+
+    def iter_fun_info(self):
+        if self.meta_reader:
+            fun_infos = self.meta_reader.iter_fun_dict()
+        else:
+            fun_infos = ((fun_addr, self.funDict[fun_addr]) for fun_addr in list(self.funDict.keys()))
+        for fun_addr, fun_info in fun_infos:
+            # plt stubs have been removed from funDict
+            if fun_addr in self.funDict:
+                yield fun_addr, fun_info
+
+    def symbolize_fun(self, fun_addr, fun_info, rip_access_list, visit_log, disable_super_symbolize=False):
+        fun_id = self.fun_ids[fun_addr]
+        fun_label = self.fun_info_dict[fun_addr].label
+        fun_symbolizer = LocalSymbolizer(fun_addr, fun_id, fun_label, fun_info, self.fun_info_dict,
+                                         self.plt_dict, self.opt_level, self.syntax,
+                                         disable_super_symbolize = disable_super_symbolize,
+                                         profile = self.profile is not None, lean = self.lean,
+                                         cold_false_bbls = self.layout is not None,
+                                         keep_liveness = self.keep_liveness and self.opt_level >= 1)
+        fun_symbolizer.run(self.cfi_dict, self.reloc_sym_dict, rip_access_list, visit_log)
+        return fun_symbolizer
+
+    def symbolize_parallel(self, rip_access_list, visit_log, disable_super_symbolize, jobs):
+        global _worker_args
+
+        # fill visit_log before forking so that every worker sees the same
+        # verdicts as the serial run
+        self.fill_visit_log(visit_log)
+
+        chunksize = max(1, len(self.funDict) // (jobs * 4))
+
+        _worker_args = (self, rip_access_list, visit_log, disable_super_symbolize)
+        try:
+            with multiprocessing.get_context('fork').Pool(jobs) as pool:
+                # imap hands results back in submission order, which keeps
+                # the merge below deterministic
+                for fun_symbolizer in pool.imap(_symbolize_worker, self.iter_fun_info(), chunksize):
+                    fun_symbolizer.attach(self.fun_info_dict, self.plt_dict)
+                    yield fun_symbolizer
+        finally:
+            _worker_args = None
+
     def search_main(self):
         main_fun = None
         start_fun = self.fun_dict[hex(self.entry)]
@@ -167,24 +305,31 @@ class SuperSymbolizer:
         return main_fun
 
     def report_statistics(self, filename):
-        with open(filename, 'w') as fd:
-            self.fd = fd
+        with AsmWriter.open(filename) as writer:
+            self.writer = writer
             self.write_code("# [*] Overlapped BBLs %d/%d "%(self.total_overlapped_bbls, self.total_bbls))
             self.write_code("# [*] Indirect Branch Sites %d (%d)"%(self.total_br_sites, self.multi_br_sites))
-        self.fd = None
+            depths = [depth for (_, depth) in self.br_depth_dict.values()]
+            if depths:
+                self.write_code("# [*] Compare Depth %.2f (max %d)"%(sum(depths) / len(depths), max(depths)))
+            for site in sorted(self.br_depth_dict, key=lambda addr: int(addr, 16)):
+                tables, depth = self.br_depth_dict[site]
+                self.write_code("# [*] Compare Depth @%s: %d tables, %d compares"%(site, tables, depth))
+        self.writer = None
 
 
     def print_reassem_code(self, add_rodata=False):
         if self.syntax == 'intel':
-            self.write_code('.intel_syntax noprefix')
+            self.write_all_lines(['.intel_syntax noprefix'])
 
         fun_list = [int(addr, 16) for addr in self.fun_dict.keys()]
 
 
         extra_block_dict = {}
         for fun_addr in fun_list:
-            if len(self.fun_dict[hex(fun_addr)].reassem_code) > 1:
-                for key in self.fun_dict[hex(fun_addr)].reassem_code.keys():
+            block_addrs = self.get_block_addrs(hex(fun_addr))
+            if len(block_addrs) > 1:
+                for key in block_addrs:
                     if hex(key) in self.fun_dict:
                         if key == fun_addr:
                             continue
@@ -196,15 +341,30 @@ class SuperSymbolizer:
 
         fun_list.extend([addr for addr in extra_block_dict.keys()])
         fun_list.sort()
+        if self.layout is not None:
+            fun_list = order_by_profile(fun_list, self.layout)
+
+        shard_starts = set()
+        if self.writer is not None and self.writer.n_shards > 1:
+            shard_starts = self.get_shard_starts(fun_list, extra_block_dict, self.writer.n_shards)
+
+        release_dict = dict()
+        if self.stream_emit:
+            release_dict = self.get_release_dict(fun_list, extra_block_dict)
+
         self.need_gxx_personality_symbol = False
-        visited_fun = []
+        visited_fun = set()
         jump_table_list = []
+        data_label = []
         for fun_addr in fun_list:
             if fun_addr in visited_fun:
                 continue
-            visited_fun.append(fun_addr)
+            visited_fun.add(fun_addr)
+            if fun_addr in shard_starts:
+                self.writer.next_shard()
             if hex(fun_addr) in self.fun_dict:
                 self.print_reassem_fun_code(hex(fun_addr))
+                data_label.extend(self.fun_dict[hex(fun_addr)].data_labels)
                 if not add_rodata:
                     self.print_reassem_jump_tbls(hex(fun_addr))
                 else:
@@ -223,6 +383,8 @@ class SuperSymbolizer:
                     if absorber not in visited_absorber:
                         self.print_reassem_block_code(absorber, fun_addr)
 
+            for done_fun in release_dict.get(fun_addr, []):
+                self.fun_dict.release(done_fun)
 
         if add_rodata:
             self.print_rodata(jump_table_list)
@@ -230,22 +392,16 @@ class SuperSymbolizer:
         if self.need_gxx_personality_symbol:
             self.print_gxx_personality_symbol()
 
-        data_label = []
-        for fun_addr in fun_list:
-            if hex(fun_addr) in self.fun_dict:
-                fun_symbolizer = self.fun_dict[hex(fun_addr)]
-                data_label.extend(fun_symbolizer.data_labels)
-
-
         data_label_set = list(set(data_label))
         data_label_set.sort()
 
 
         if self.false_fun_list:
 
-            self.write_code('#----------------------------------------')
-            self.write_code('# the definition of false function label')
-            self.write_code('#----------------------------------------')
+            self.write_comment('#----------------------------------------')
+            self.write_comment('# the definition of false function label')
+            self.write_comment('#----------------------------------------')
+            lines = []
             for fun_addr in self.false_fun_list:
                 addr = int(fun_addr, 16)
 
@@ -254,14 +410,15 @@ class SuperSymbolizer:
                     label = 'false_fun_minus_%x'%(-addr)
                 else:
                     label = 'false_fun_%x'%(addr)
-                code = '%s:'%(label)
-                self.write_code(code)
+                lines.append('%s:'%(label))
+            self.write_lines(lines)
             self.write_code('\tcall abort@PLT')
 
 
-        self.write_code('#-----------------------------------')
-        self.write_code('#    the definition of data labels')
-        self.write_code('#-----------------------------------')
+        self.write_comment('#-----------------------------------')
+        self.write_comment('#    the definition of data labels')
+        self.write_comment('#-----------------------------------')
+        lines = []
         for label in data_label_set:
             addr = int(label.split('_')[-1], 16)
             if label.split('_')[-2] == 'minus':
@@ -269,19 +426,105 @@ class SuperSymbolizer:
                 code = '.set %s, -1'%(label)
             else:
                 code = '.set %s, %s'%(label, hex(addr))
-            self.write_code(code)
+            lines.append(code)
+        self.write_all_lines(lines)
+
+    def get_block_addrs(self, fun_addr):
+        '''
+        The keys of reassem_code: the entry of the function, and the start of
+        each FDE range that does not contain it. A function that is not
+        symbolized yet is assumed to have code in every FDE range; a block
+        without code is not printed anyway.
+        '''
+        if not self.stream_emit:
+            return list(self.fun_dict[fun_addr].reassem_code)
+        entry = int(fun_addr, 16)
+        block_addrs = []
+        for fdeRange in merge_fde_ranges(self.funDict[fun_addr]['FDERanges']):
+            fdeStart = int(fdeRange['Start'], 16)
+            if entry < fdeStart or int(fdeRange['End'], 16) <= entry:
+                key = fdeStart
+            else:
+                key = entry
+            if key not in block_addrs:
+                block_addrs.append(key)
+        return block_addrs
+
+    def get_release_dict(self, fun_list, extra_block_dict):
+        # the last address at which the code of a function is printed, i.e.
+        # where its own code or the last block it absorbs is printed, in the
+        # order of fun_list
+        position = dict()
+        for idx, addr in enumerate(fun_list):
+            position.setdefault(addr, idx)
+        last_use = {fun_addr: int(fun_addr, 16) for fun_addr in self.fun_dict.keys()}
+        for fun_addr in fun_list:
+            absorbers = list(extra_block_dict.get(fun_addr, []))
+            if hex(fun_addr) in self.funDict:
+                absorbers.extend(self.funDict[hex(fun_addr)]['AbsorbingFun'])
+            for absorber in absorbers:
+                if absorber in last_use:
+                    last_use[absorber] = max(last_use[absorber], fun_addr, key=position.__getitem__)
+
+        release_dict = dict()
+        for fun_addr, last_addr in last_use.items():
+            if last_addr not in release_dict:
+                release_dict[last_addr] = []
+            release_dict[last_addr].append(fun_addr)
+        return release_dict
+
+    def get_shard_starts(self, fun_list, extra_block_dict, n_shards):
+        '''
+        Split the functions into n_shards runs of about the same number of
+        instructions, in the order of fun_list, and return the addresses that
+        start a new shard. A block is kept in the shard of the function that
+        absorbs it, since the exception tables of the absorber refer to its
+        labels.
+        '''
+        addrs = list(dict.fromkeys(fun_list))
+        index = {addr: idx for idx, addr in enumerate(addrs)}
+        weights = []
+        # no shard may start in (lo, hi] of a span; counted as a difference array
+        spans = [0] * (len(addrs) + 1)
+        for idx, fun_addr in enumerate(addrs):
+            weight = 0
+            if hex(fun_addr) in self.fun_dict:
+                weight += len(self.funDict[hex(fun_addr)]['InstAddrs'])
+
+            absorbers = set(extra_block_dict.get(fun_addr, []))
+            if hex(fun_addr) in self.funDict:
+                absorbers.update(self.funDict[hex(fun_addr)]['AbsorbingFun'])
+            for absorber in absorbers:
+                if absorber not in self.fun_dict or int(absorber, 16) not in index:
+                    continue
+                other = index[int(absorber, 16)]
+                spans[min(idx, other) + 1] += 1
+                spans[max(idx, other) + 1] -= 1
+            weights.append(weight)
+
+        shard_size = sum(weights) / n_shards
+        shard_starts = set()
+        cur_size = 0
+        depth = 0
+        for idx, fun_addr in enumerate(addrs):
+            depth += spans[idx]
+            if cur_size >= shard_size and depth == 0 and len(shard_starts) + 1 < n_shards:
+                shard_starts.add(fun_addr)
+                cur_size = 0
+            cur_size += weights[idx]
+        return shard_starts
 
     def print_rodata(self, jump_table_list):
         jump_dict = dict()
         label_dict = dict()
         for jump_tables in jump_table_list:
-            for addr, tbls in jump_tables.items():
+            for addr, (tbls, entries) in jump_tables.items():
                 if addr not in jump_dict:
-                    jump_dict[addr] = tbls
+                    jump_dict[addr] = (tbls, entries)
                     label_dict[addr] = [tbls[0]]
                 else:
                     if len(tbls) > len(jump_dict):
-                        jump_dict[addr] = tbls
+                        jump_dict[addr] = (tbls, entries)
 
                     label_dict[addr].append(tbls[0])
 
@@ -294,40 +537,46 @@ class SuperSymbolizer:
 
         self.write_code('.section .my_rodata, "a", @progbits')
 
-        emitted_code = []
+        emitted_code = set()
+        lines = []
         for cur_addr in range(robase, robase+rosize, 4):
             idx = cur_addr - robase
 
             if cur_addr in jump_dict:
-                for label in label_dict[cur_addr]:
-                    self.write_code(label)
+                lines.extend(label_dict[cur_addr])
 
-                for line in jump_dict[cur_addr][1:]:
-                    self.write_code(line)
-                    if line.split()[0] in ['.long']:
-                        entry = int(line.split()[-1],16)
-                        assert (entry not in emitted_code), \
-                            'find overlapped entry %s'%(hex(entry))
-                        emitted_code.append(entry)
+                tbls, entries = jump_dict[cur_addr]
+                lines.extend(tbls[1:])
+                for entry in entries:
+                    assert (entry not in emitted_code), \
+                        'find overlapped entry %s'%(hex(entry))
+                    emitted_code.add(entry)
 
             if cur_addr in emitted_code:
                 continue
 
             if cur_addr + 4 <= robase + rosize:
-                contents = struct.unpack('<I', rodata[idx:idx + 4])[0]
-                self.write_code(' \t.long %-10s %20s %s'%(hex(contents), "#", hex(cur_addr)))
+                contents = struct.unpack_from('<I', rodata, idx)[0]
+                if self.lean:
+                    lines.append('\t.long %s'%(hex(contents)))
+                else:
+                    lines.append(' \t.long %-10s %20s %s'%(hex(contents), "#", hex(cur_addr)))
             else:
                 for cur_addr2 in range(cur_addr, robase+rosize, 1):
                     idx = cur_addr2 - robase
-                    contents = struct.unpack('<B', rodata[idx:idx + 1])[0]
-                    self.write_code('\t.byte %-10s %20s %s'%(hex(contents), "#", hex(cur_addr2)))
+                    contents = rodata[idx]
+                    if self.lean:
+                        lines.append('\t.byte %s'%(hex(contents)))
+                    else:
+                        lines.append('\t.byte %-10s %20s %s'%(hex(contents), "#", hex(cur_addr2)))
+        self.write_lines(lines)
 
 
 
     def print_gxx_personality_symbol(self):
-        self.write_code('#----------------------------------------')
-        self.write_code('# define a label for __gxx_personality_v0')
-        self.write_code('#----------------------------------------')
+        self.write_comment('#----------------------------------------')
+        self.write_comment('# define a label for __gxx_personality_v0')
+        self.write_comment('#----------------------------------------')
 
         self.write_code('.hidden DW.ref.__gxx_personality_v0')
         self.write_code('.weak   DW.ref.__gxx_personality_v0')
@@ -346,9 +595,10 @@ class SuperSymbolizer:
         if block_addr not in fun_symbolizer.reassem_code:
             return
 
-        self.write_code('#----------------------------------------')
-        self.write_code('# %s absorbs %s '%(absorber, hex(block_addr)))
-        self.write_code('#----------------------------------------')
+        if not self.lean:
+            self.write_code('#----------------------------------------')
+            self.write_code('# %s absorbs %s '%(absorber, hex(block_addr)))
+            self.write_code('#----------------------------------------')
 
         part_fun_label = self.get_part_fun_label(absorber)
 
@@ -357,20 +607,22 @@ class SuperSymbolizer:
         self.write_code('\t.align 8')
         self.write_code('%s:'%(part_fun_label))
 
+        lines = []
         for code in fun_symbolizer.reassem_code[block_addr]:
             if code.label:
                 if code.comment:
-                    self.write_code('%-40s: %s'%(code.label))
+                    lines.append('%-40s: %s'%(code.label))
                 else:
-                    self.write_code('%s:'%(code.label))
+                    lines.append('%s:'%(code.label))
                 continue
 
             if not code.code:
-                self.write_code('%s'%(code.comment))
+                lines.append('%s'%(code.comment))
             elif not code.comment:
-                self.write_code('\t%s'%(code.code))
+                lines.append('\t%s'%(code.code))
             elif code.code and code.comment:
-                self.write_code('\t%-40s %s'%(code.code, code.comment))
+                lines.append('\t%-40s %s'%(code.code, code.comment))
+        self.write_lines(lines)
 
         self.print_fun_size_def(part_fun_label)
 
@@ -384,6 +636,14 @@ class SuperSymbolizer:
         return fname + '.part.%d'%(id)
 
     def print_fun_brief_info(self, fun_addr, reassem_code):
+        if self.lean:
+            return
+
+        # while streaming, the functions that refer to this one may not be
+        # symbolized yet, so they are not listed
+        refer_fun_dict = self.refer_fun_dict
+        if self.stream_emit:
+            refer_fun_dict = {}
 
         self.write_code()
         self.write_code()
@@ -393,8 +653,8 @@ class SuperSymbolizer:
 
         if reassem_code[0].addr != int(fun_addr, 16):
             self.write_code("# %s is not a start address of this function"%(fun_addr))
-            if fun_addr in self.refer_fun_dict:
-                refer_fun = [ addr for addr in self.refer_fun_dict[fun_addr] if addr != fun_addr ]
+            if fun_addr in refer_fun_dict:
+                refer_fun = [ addr for addr in refer_fun_dict[fun_addr] if addr != fun_addr ]
             else: refer_fun = []
             if len(refer_fun) == 1:
                 for fdeRange in self.funDict[fun_addr]['FDERanges']:
@@ -409,8 +669,8 @@ class SuperSymbolizer:
 
 
 
-        if fun_addr in self.refer_fun_dict:
-            self.write_code("# %s is refered by %d function(s) :"%(fun_addr, len(self.refer_fun_dict[fun_addr])) + str(self.refer_fun_dict[fun_addr]))
+        if fun_addr in refer_fun_dict:
+            self.write_code("# %s is refered by %d function(s) :"%(fun_addr, len(refer_fun_dict[fun_addr])) + str(refer_fun_dict[fun_addr]))
         if len(self.funDict[fun_addr]['FDERanges']) > 1:
             entry = int(fun_addr, 16)
             parts = []
@@ -483,22 +743,24 @@ class SuperSymbolizer:
             self.print_fun_type(fun_info.label)
             self.write_code('\t.align 8')
 
+        lines = []
         for code in reassem_code:
             if code.label:
                 if code.comment:
-                    self.write_code('%-40s: %s'%(code.label))
+                    lines.append('%-40s: %s'%(code.label))
                 else:
-                    self.write_code('%s:'%(code.label))
+                    lines.append('%s:'%(code.label))
                 continue
 
             if not code.code:
-                self.write_code('%s'%(code.comment))
+                lines.append('%s'%(code.comment))
             elif not code.comment:
-                self.write_code('\t%s'%(code.code))
+                lines.append('\t%s'%(code.code))
             elif code.code and code.comment:
-                self.write_code('\t%-40s %s'%(code.code, code.comment))
+                lines.append('\t%-40s %s'%(code.code, code.comment))
             if '.cfi_personality 0x9b,DW.ref.__gxx_personality_v0' in code.code:
                 self.need_gxx_personality_symbol = True
+        self.write_lines(lines)
 
         if fun_info.label == self.main_fun:
             self.print_fun_size_def('main')
@@ -521,18 +783,21 @@ class SuperSymbolizer:
             self.print_section_name('.rodata')
             self.write_code('.align 4')
 
+        lines = []
         for tbl_addr in tbl_addrs:
             reassem_code = fun_symbolizer.reassem_tbl[tbl_addr]
             for code in reassem_code:
                 if code.label:
-                    self.write_code('%s:'%(code.label))
+                    lines.append('%s:'%(code.label))
 
                 if not code.code:
-                    self.write_code('%s'%(code.comment))
+                    if code.comment:
+                        lines.append('%s'%(code.comment))
                 elif not code.comment:
-                    self.write_code('\t%s'%(code.code))
+                    lines.append('\t%s'%(code.code))
                 elif code.code and code.comment:
-                    self.write_code('\t%-40s %s'%(code.code, code.comment))
+                    lines.append('\t%-40s %s'%(code.code, code.comment))
+        self.write_lines(lines)
     def get_jump_tables(self, fun_addr):
         fun_symbolizer = self.fun_dict[fun_addr]
         #return fun_symbolizer.reassem_tbl
@@ -550,18 +815,24 @@ class SuperSymbolizer:
         for tbl_addr in tbl_addrs:
             reassem_code = fun_symbolizer.reassem_tbl[tbl_addr]
             lines = []
+            # the addresses of the entries, which print_rodata does not
+            # print again
+            entries = []
             for code in reassem_code:
                 if code.label:
                     lines.append('%s:'%(code.label))
+                if code.code.startswith('.long'):
+                    entries.append(code.addr)
 
                 if not code.code:
-                    lines.append('%s'%(code.comment))
+                    if code.comment:
+                        lines.append('%s'%(code.comment))
                 elif not code.comment:
                     lines.append('\t%s'%(code.code))
                 elif code.code and code.comment:
                     lines.append('\t%-40s %s'%(code.code, code.comment))
 
-            tbl_dict[tbl_addr] = lines
+            tbl_dict[tbl_addr] = (lines, entries)
 
         return tbl_dict
 
@@ -571,6 +842,7 @@ class SuperSymbolizer:
         self.total_overlapped_bbls += fun_symbolizer.no_overlapped_bbls
         self.total_br_sites += fun_symbolizer.total_br_sites
         self.multi_br_sites += fun_symbolizer.multi_br_sites
+        self.br_depth_dict.update(fun_symbolizer.br_depth_dict)
 
         for refer_fun in fun_symbolizer.refer_funs:
             if refer_fun not in self.refer_fun_dict:
@@ -578,16 +850,54 @@ class SuperSymbolizer:
             self.refer_fun_dict[refer_fun].append(fun_symbolizer.fun_addr)
 
     def write_code(self, line=''):
-        if self.fd is None:
+        if self.writer is None:
             print(line)
         else:
-            print(line, file=self.fd)
+            self.writer.write(line)
 
-    def create_reassem_file(self, filename, add_rodata=False):
-        with open(filename, 'w') as fd:
-            self.fd = fd
+    def write_comment(self, line):
+        if not self.lean:
+            self.write_code(line)
+
+    def write_lines(self, lines):
+        if self.writer is None:
+            for line in lines:
+                print(line)
+        else:
+            self.writer.writelines(lines)
+
+    def write_all_lines(self, lines):
+        # lines that every shard of the reassembly needs
+        if self.writer is None:
+            self.write_lines(lines)
+        else:
+            self.writer.write_all(lines)
+
+    def open_writer(self, filename, shards=1):
+        if shards > 1:
+            return ShardWriter.open(shard_paths(filename, shards))
+        return AsmWriter.open(filename)
+
+    def create_reassem_file(self, filename, add_rodata=False, shards=1):
+        # filename may also be a file object such as a pipe or a buffer, or
+        # a list of paths and file objects that all get the reassembly. With
+        # shards > 1, the reassembly is split into the files of shard_paths()
+        start = time.perf_counter()
+        with self.open_writer(filename, shards) as writer:
+            self.writer = writer
             self.print_reassem_code(add_rodata)
-        self.fd = None
+        self.writer = None
+        self.write_profile(filename, start)
+
+    def write_profile(self, reassem_file, start):
+        self.add_profile_phase('create_reassem_file', start)
+        if not self.profile:
+            return
+        profile_file = self.profile_file
+        if profile_file is None and isinstance(reassem_file, str):
+            profile_file = os.path.splitext(reassem_file)[0] + '.profile.json'
+        if profile_file:
+            self.profile.write(profile_file)
 
 
 import argparse
@@ -595,22 +905,51 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Serializer')
     parser.add_argument('bin_file', type=str)
     parser.add_argument('b2r2_meta_file', type=str)
-    parser.add_argument('reassembly_file', type=str)
+    parser.add_argument('reassembly_file', type=str, help='the reassembly file, or - for stdout')
     parser.add_argument('--optimization', type=int, default=0)
     parser.add_argument('--syntax', type=str, default='intel')
     parser.add_argument('--no-endbr', dest='endbr', action='store_false')
     parser.add_argument('--no-supersym', dest='supersym', action='store_false')
+    parser.add_argument('--jobs', type=int, default=1)
+    parser.add_argument('--stream-meta', dest='stream_meta', action='store_true')
+    parser.add_argument('--profile', type=int, nargs='?', const=20, default=0, metavar='N',
+                        help='time the symbolization phases and list the N slowest functions (default 20)')
+    parser.add_argument('--lean', action='store_true', help='emit no comments in the reassembly file')
+    parser.add_argument('--shards', type=int, default=1, metavar='N',
+                        help='split the reassembly into N files along function boundaries')
+    parser.add_argument('--stream-emit', dest='stream_emit', action='store_true',
+                        help='symbolize each function while printing it and drop it afterwards')
+    parser.add_argument('--layout', type=str, metavar='PROFILE',
+                        help='print the hot functions of an execution profile first and the false blocks in .text.unlikely')
 
     args = parser.parse_args()
 
-    sym = SuperSymbolizer(args.bin_file, args.b2r2_meta_file, args.optimization, args.syntax)
-    sym.symbolize(args.endbr)
+    reassem_file = args.reassembly_file
+    profile_file = None
+    if args.shards > 1 and reassem_file == '-':
+        parser.error('--shards needs a reassembly file')
+    if reassem_file == '-':
+        # stdout only carries the assembly; everything else goes to stderr
+        reassem_file = sys.stdout
+        sys.stdout = sys.stderr
+        profile_file = os.path.splitext(args.b2r2_meta_file)[0] + '.profile.json'
+
+    sym = SuperSymbolizer(args.bin_file, args.b2r2_meta_file, args.optimization, args.syntax, args.stream_meta, args.profile,
+                          args.lean, args.layout)
+    sym.profile_file = profile_file
+    sym.symbolize(args.endbr, jobs=args.jobs, stream_emit=args.stream_emit)
     if args.supersym:
-        sym.create_reassem_file(args.reassembly_file)
+        sym.create_reassem_file(reassem_file, shards=args.shards)
     else:
-        sym2 = SuperSymbolizer(args.bin_file, args.b2r2_meta_file, args.optimization, args.syntax)
-        sym2.symbolize(args.endbr, sym.rip_access_addrs, disable_super_symbolize=True)
-        sym2.create_reassem_file(args.reassembly_file, add_rodata=True)
+        if args.stream_emit:
+            # only the RIP-relative accesses of the first run are needed
+            sym.fun_dict.drain()
+        sym2 = SuperSymbolizer(args.bin_file, args.b2r2_meta_file, args.optimization, args.syntax, args.stream_meta, args.profile,
+                               args.lean, args.layout)
+        sym2.profile_file = profile_file
+        sym2.symbolize(args.endbr, sym.rip_access_addrs, disable_super_symbolize=True, jobs=args.jobs,
+                       stream_emit=args.stream_emit)
+        sym2.create_reassem_file(reassem_file, add_rodata=True, shards=args.shards)
 
     #sym.print_reassem_code()
     #sym.report_statistics()
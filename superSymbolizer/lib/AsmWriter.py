@@ -0,0 +1,201 @@
+import io
+import os
+import re
+import sys
+
+CHUNK_LINES = 1 << 14
+
+# a label definition: a symbol at the start of a line, followed by a colon
+LABEL_DEF = re.compile(r'^[ \t]*([\w.$]+):', re.M)
+SYMBOL = re.compile(r'[\w.$]+')
+GLOBAL_DEF = re.compile(r'^[ \t]*\.(?:globl|global|weak)[ \t]+([\w.$]+)', re.M)
+
+
+class AsmWriter:
+    '''
+    Buffered writer of the reassembly file.
+
+    Lines are collected in a list and written out in chunks of chunk_lines
+    lines with a single write call. A target is any file object: a file, the
+    stdin of a pipe or an io.StringIO/io.BytesIO buffer. Binary targets get
+    the chunks encoded as UTF-8. With a list of targets, e.g. the stdin of
+    the assembler and a file to keep, every target gets the same chunks.
+
+    AsmWriter.open() also accepts paths; the writer owns the files it opens
+    and closes them.
+    '''
+    def __init__(self, fd=None, chunk_lines=CHUNK_LINES, owned=()):
+        if fd is None:
+            fd = sys.stdout
+        if not isinstance(fd, (list, tuple)):
+            fd = [fd]
+        self.targets = [(item, not isinstance(item, io.TextIOBase)) for item in fd]
+        self.owned = list(owned)
+        self.chunk_lines = chunk_lines
+        self.lines = []
+
+    @classmethod
+    def open(cls, target, chunk_lines=CHUNK_LINES):
+        if not isinstance(target, (list, tuple)):
+            target = [target]
+        fds = []
+        owned = []
+        for item in target:
+            if isinstance(item, str):
+                item = open(item, 'w')
+                owned.append(item)
+            fds.append(item)
+        return cls(fds, chunk_lines, owned)
+
+    # the interface of ShardWriter: a single file is its only shard
+    n_shards = 1
+
+    def next_shard(self):
+        pass
+
+    def write_all(self, lines):
+        self.writelines(lines)
+
+    def write(self, line=''):
+        self.lines.append(line)
+        if len(self.lines) >= self.chunk_lines:
+            self.flush()
+
+    def writelines(self, lines):
+        self.lines.extend(lines)
+        if len(self.lines) >= self.chunk_lines:
+            self.flush()
+
+    def flush(self):
+        if not self.lines:
+            return
+        self.lines.append('')
+        data = '\n'.join(self.lines)
+        self.lines = []
+        self.write_chunk(data)
+
+    def write_chunk(self, data):
+        encoded = None
+        for fd, binary in self.targets:
+            if binary:
+                if encoded is None:
+                    encoded = data.encode()
+                fd.write(encoded)
+            else:
+                fd.write(data)
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            for fd, _ in self.targets:
+                if fd in self.owned:
+                    fd.close()
+                else:
+                    fd.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+
+def shard_paths(filename, n_shards):
+    # 7zip.s -> 7zip.0.s, 7zip.1.s, ...
+    base, ext = os.path.splitext(filename)
+    return ['%s.%d%s'%(base, idx, ext or '.s') for idx in range(n_shards)]
+
+
+class AsmShard(AsmWriter):
+    '''
+    An AsmWriter that records the labels defined in its output and the
+    symbols it refers to, so that ShardWriter can tell which labels are
+    used by the other shards.
+    '''
+    def __init__(self, fd=None, chunk_lines=CHUNK_LINES, owned=()):
+        super().__init__(fd, chunk_lines, owned)
+        self.labels = set()
+        self.symbols = set()
+        self.global_labels = set()
+
+    def write_chunk(self, data):
+        self.labels.update(LABEL_DEF.findall(data))
+        self.symbols.update(SYMBOL.findall(data))
+        self.global_labels.update(GLOBAL_DEF.findall(data))
+        super().write_chunk(data)
+
+
+class ShardWriter:
+    '''
+    Splits the reassembly into several assembly files (shards) that are
+    assembled separately and linked together. The printer writes to the
+    current shard and moves on with next_shard(); write_all() writes lines
+    that every shard needs, such as the data labels.
+
+    A label is local to its shard, so on close every label that another
+    shard refers to is made .globl and .hidden in the shard that defines
+    it. Hidden symbols are resolved within the executable and are not
+    exported.
+    '''
+    def __init__(self, shards):
+        self.shards = shards
+        self.n_shards = len(shards)
+        self.cur = 0
+
+    @classmethod
+    def open(cls, filenames, chunk_lines=CHUNK_LINES):
+        shards = []
+        for filename in filenames:
+            fd = open(filename, 'w')
+            shards.append(AsmShard(fd, chunk_lines, [fd]))
+        return cls(shards)
+
+    def next_shard(self):
+        if self.cur + 1 < self.n_shards:
+            self.cur += 1
+
+    def write(self, line=''):
+        self.shards[self.cur].write(line)
+
+    def writelines(self, lines):
+        self.shards[self.cur].writelines(lines)
+
+    def write_all(self, lines):
+        for shard in self.shards:
+            shard.writelines(lines)
+
+    def get_shared_labels(self):
+        owner = dict()
+        for idx, shard in enumerate(self.shards):
+            for label in shard.labels - shard.global_labels:
+                owner[label] = idx
+
+        shared = [set() for _ in self.shards]
+        for idx, shard in enumerate(self.shards):
+            for symbol in shard.symbols:
+                if owner.get(symbol, idx) != idx:
+                    shared[owner[symbol]].add(symbol)
+        return shared
+
+    def close(self):
+        try:
+            for shard in self.shards:
+                shard.flush()
+            for shard, labels in zip(self.shards, self.get_shared_labels()):
+                lines = []
+                for label in sorted(labels):
+                    lines.append('\t.globl %s'%(label))
+                    lines.append('\t.hidden %s'%(label))
+                shard.writelines(lines)
+        finally:
+            for shard in self.shards:
+                shard.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
@@ -1,41 +1,45 @@
+import re
 from collections import namedtuple
 
-from superSymbolizer.lib.Misc import is_unsupported_instruction, Instrumentation, InstType
+from superSymbolizer.lib.Misc import is_unsupported_instruction, Instrumentation, InstType, REGISTERS_x64
 
 BBLInfo = namedtuple('BBLInfo', ['Start', 'End', 'Fallthrough'])
 
 
+# intra-instruction edges and calls do not lead to other blocks of the function
+SKIPPED_EDGES = {'IntraCJmpTrueEdge', 'IntraCJmpFalseEdge', 'IntraJmpEdge', 'CallEdge'}
+
+
 def construct_CFG(root, BBLs, syntax, visit_log):
+    '''
+    Walk the superset CFG from root. Returns the valid blocks in the order
+    they are reached and the invalid ones, which are listed each time they
+    are reached. visit_log caches the validity of each block across calls.
+    '''
     leaders = []
-    pred_dict = {}
+    leader_set = set()
     droppedBBLs = []
-    queue = [("", root)]
+    queue = [root]
 
     history = set()
     while queue:
-        (pred, cur) = queue.pop()
+        cur = queue.pop()
 
-        if cur not in pred_dict:
-            pred_dict[cur] = []
-        if pred not in pred_dict[cur]:
-            pred_dict[cur].append(pred)
-
-        if cur in leaders:
+        if cur in leader_set:
             continue
 
-        bValid = True
-        if cur not in visit_log:
+        bValid = visit_log.get(cur)
+        if bValid is None:
+            bValid = True
             for inst in BBLs[cur]['Code']:
                 if is_unsupported_instruction(inst['Disassem'], syntax):
                     #print('[-] Unsupprted instruction %s %s' % (inst['Disassem'], inst['Addr']))
                     bValid = False
-            if bValid:
-                visit_log[cur] = True
-            else:
-                visit_log[cur] = False
-        bValid = visit_log[cur]
+                    break
+            visit_log[cur] = bValid
         if bValid:
             leaders.append(cur)
+            leader_set.add(cur)
         else:
             droppedBBLs.append(cur)
 
@@ -43,36 +47,464 @@ def construct_CFG(root, BBLs, syntax, visit_log):
             continue
 
         for edge in BBLs[cur]['Edges']:
-            if edge['EdgeType'] in ['IntraCJmpTrueEdge', 'IntraCJmpFalseEdge', 'IntraJmpEdge', 'CallEdge']:
+            if edge['EdgeType'] in SKIPPED_EDGES:
                 continue
 
-            if (edge['From'], edge['To']) not in history:
-                queue.append((edge['From'], edge['To']))
-                history.add((edge['From'], edge['To']))
+            edge_key = (edge['From'], edge['To'])
+            if edge_key not in history:
+                queue.append(edge['To'])
+                history.add(edge_key)
 
-    if root not in leaders:
+    if root not in leader_set:
         return [], droppedBBLs + leaders
     return leaders, droppedBBLs
 
 
+# Register liveness: a mask with one bit per 64-bit register, in the order
+# of REGISTERS_x64, and one bit for the flags.
+SUB_REGISTERS = {
+    'RAX': ['EAX', 'AX', 'AH', 'AL'], 'RBX': ['EBX', 'BX', 'BH', 'BL'],
+    'RCX': ['ECX', 'CX', 'CH', 'CL'], 'RDX': ['EDX', 'DX', 'DH', 'DL'],
+    'RSI': ['ESI', 'SI', 'SIL'], 'RDI': ['EDI', 'DI', 'DIL'],
+    'RBP': ['EBP', 'BP', 'BPL'], 'RSP': ['ESP', 'SP', 'SPL'],
+}
+for idx in range(8, 16):
+    SUB_REGISTERS['R%d'%(idx)] = ['R%dD'%(idx), 'R%dW'%(idx), 'R%dB'%(idx)]
+
+REG_BIT = dict()
+# a write to a 64-bit or a 32-bit register overwrites the whole register
+FULL_WRITE = set()
+for idx, reg in enumerate(REGISTERS_x64):
+    REG_BIT[reg] = 1 << idx
+    for name in SUB_REGISTERS[reg]:
+        REG_BIT[name] = 1 << idx
+    FULL_WRITE.update([reg, SUB_REGISTERS[reg][0]])
+
+FLAGS = 1 << len(REGISTERS_x64)
+ALL_LIVE = (FLAGS << 1) - 1
+
+def reg_mask(regs):
+    mask = 0
+    for reg in regs:
+        mask |= REG_BIT[reg]
+    return mask
+
+# System V ABI: a call reads the argument registers (RAX for varargs, R10
+# for the static chain). The callee-saved ones are read by the landing pads
+# and by the code after the call. With gcc -fipa-ra a caller keeps values in
+# the caller-saved registers its callee does not touch, so a call is not
+# assumed to clobber them and a return reads all of them; only the flags are
+# always clobbered.
+CALLEE_SAVED = reg_mask(['RBX', 'RBP', 'RSP', 'R12', 'R13', 'R14', 'R15'])
+CALL_USE = reg_mask(['RAX', 'RDI', 'RSI', 'RDX', 'RCX', 'R8', 'R9', 'R10']) | CALLEE_SAVED
+CALL_KILL = FLAGS
+RET_USE = ALL_LIVE & ~FLAGS
+
+# never used as a scratch register
+NOT_SCRATCH = reg_mask(['RSP'])
+
+CONDITIONS = ['o', 'no', 'b', 'nb', 'c', 'nc', 'ae', 'nae', 'e', 'ne', 'z', 'nz', 'be', 'nbe', 'a', 'na',
+              's', 'ns', 'p', 'np', 'pe', 'po', 'l', 'nl', 'ge', 'nge', 'le', 'nle', 'g', 'ng']
+FLAGS_READERS = set(['j' + cc for cc in CONDITIONS] + ['set' + cc for cc in CONDITIONS] +
+                    ['cmov' + cc for cc in CONDITIONS] + ['loope', 'loopne', 'loopz', 'loopnz'])
+
+# the destination is written, the other operands are read
+MOVE_OPS = {'mov', 'movabs', 'movzx', 'movsx', 'movsxd', 'lea', 'movd', 'movq'}
+# the operands are read and the flags are overwritten
+FLAGS_WRITERS = {'add', 'sub', 'and', 'or', 'xor', 'cmp', 'test', 'neg', 'adc', 'sbb'}
+# the operands are read, and at most partially written
+OPERAND_OPS = {'xchg', 'not', 'inc', 'dec', 'shl', 'shr', 'sar', 'sal', 'rol', 'ror', 'bswap', 'bt',
+               'imul', 'push', 'loop', 'jrcxz', 'jecxz', 'jcxz'} | FLAGS_READERS
+NOP_OPS = {'nop', 'endbr64', 'endbr32'}
+KNOWN_OPS = MOVE_OPS | FLAGS_WRITERS | OPERAND_OPS | NOP_OPS | {
+    'pop', 'call', 'ret', 'jmp', 'leave', 'cdqe', 'cwde', 'cdq', 'cqo'}
+
+ATT_OPS = {'movzbw': 'movzx', 'movzbl': 'movzx', 'movzbq': 'movzx', 'movzwl': 'movzx', 'movzwq': 'movzx',
+           'movsbw': 'movsx', 'movsbl': 'movsx', 'movsbq': 'movsx', 'movswl': 'movsx', 'movswq': 'movsx',
+           'movslq': 'movsxd', 'cltq': 'cdqe', 'cwtl': 'cwde', 'cltd': 'cdq', 'cqto': 'cqo'}
+PREFIXES = {'notrack', 'bnd', 'cs', 'ds', 'ss', 'es', 'lock'}
+
+INTEL_REG = re.compile(r'\b[A-Z][A-Z0-9]*\b')
+ATT_REG = re.compile(r'%([A-Z][A-Z0-9]*)')
+ATT_COMMA = re.compile(r',(?![^()]*\))')
+
+
+def get_att_opcode(opcode):
+    if opcode in ATT_OPS:
+        return ATT_OPS[opcode]
+    if opcode not in KNOWN_OPS and opcode[-1:] in 'bwlq' and opcode[:-1] in KNOWN_OPS:
+        return opcode[:-1]
+    return opcode
+
+def split_instruction(disassem, syntax):
+    '''
+    The opcode and the operands of an instruction without its prefixes.
+    The operands are in Intel order, the destination first.
+    '''
+    words = disassem.split(None, 1)
+    while words and words[0] in PREFIXES:
+        words = words[1].split(None, 1) if len(words) > 1 else []
+    if not words:
+        return '', []
+
+    if syntax == 'intel':
+        operands = words[1].split(',') if len(words) > 1 else []
+        return words[0], [op.strip() for op in operands]
+    operands = ATT_COMMA.split(words[1]) if len(words) > 1 else []
+    return get_att_opcode(words[0]), [op.strip() for op in reversed(operands)]
+
+def get_register(operand, syntax):
+    # the register an operand consists of, or ''
+    if syntax != 'intel':
+        if not operand.startswith('%'):
+            return ''
+        operand = operand[1:]
+    return operand if operand in REG_BIT else ''
+
+def get_use_kill(disassem, syntax, table_jump=False):
+    '''
+    Masks of the registers and flags an instruction reads (use) and
+    overwrites (kill). An instruction that is not modeled reads everything
+    and overwrites nothing, and so does an indirect jump unless table_jump
+    says that its targets are the edges of its block.
+    '''
+    opcode, operands = split_instruction(disassem, syntax)
+    if not opcode:
+        return 0, 0
+
+    reg_re = INTEL_REG if syntax == 'intel' else ATT_REG
+    masks = [reg_mask([reg for reg in reg_re.findall(op) if reg in REG_BIT]) for op in operands]
+    dest = get_register(operands[0], syntax) if operands else ''
+    srcs = masks[1:]
+
+    if opcode not in KNOWN_OPS:
+        return ALL_LIVE, 0
+
+    use = 0
+    for mask in masks:
+        use |= mask
+
+    if opcode in NOP_OPS:
+        return 0, 0
+    if opcode in MOVE_OPS or opcode == 'pop' or (opcode == 'imul' and len(operands) == 3):
+        src_use = REG_BIT['RSP'] if opcode == 'pop' else 0
+        if dest not in FULL_WRITE:
+            return use | src_use, 0
+        for mask in srcs:
+            src_use |= mask
+        return src_use, REG_BIT[dest]
+    if opcode in FLAGS_WRITERS:
+        # xor EAX, EAX does not depend on EAX
+        if opcode in ['xor', 'sub'] and len(operands) == 2 and operands[0] == operands[1] and dest in FULL_WRITE:
+            return 0, REG_BIT[dest] | FLAGS
+        if opcode in ['adc', 'sbb']:
+            use |= FLAGS
+        return use, FLAGS
+    if opcode in FLAGS_READERS:
+        use |= FLAGS
+    if opcode in OPERAND_OPS:
+        if opcode == 'push':
+            use |= REG_BIT['RSP']
+        elif opcode.startswith('loop') or opcode in ['jrcxz', 'jecxz', 'jcxz']:
+            use |= REG_BIT['RCX']
+        elif opcode == 'imul' and len(operands) < 2:
+            return ALL_LIVE, 0
+        return use, 0
+    if opcode == 'jmp':
+        try:
+            int(operands[0], 16)
+            return 0, 0
+        except (IndexError, ValueError):
+            if table_jump:
+                return use, 0
+            return ALL_LIVE, 0
+    if opcode == 'call':
+        return use | CALL_USE, CALL_KILL
+    if opcode == 'ret':
+        return RET_USE, ALL_LIVE
+    if opcode == 'leave':
+        return reg_mask(['RBP', 'RSP']), 0
+    if opcode in ['cdqe', 'cwde']:
+        return REG_BIT['RAX'], 0
+    # cdq, cqo
+    return REG_BIT['RAX'], REG_BIT['RDX']
+
+
+def compute_liveness(bbls, syntax, table_jumps=()):
+    '''
+    Backward liveness of the registers and the flags over the superset CFG
+    of a function. Returns the masks live before and after each instruction,
+    merged over the blocks that contain it.
+
+    A block without successors, or with a successor out of the function,
+    is left with everything live. The jumps at table_jumps go through jump
+    tables, whose entries are the edges of their blocks.
+    '''
+    insts = dict()
+    summary = dict()
+    preds = {addr: [] for addr in bbls}
+    for addr, bbl in bbls.items():
+        code = [(inst['Addr'],) + get_use_kill(inst['Disassem'], syntax, inst['Addr'] in table_jumps)
+                for inst in bbl['Code']]
+        use = 0
+        kill = 0
+        for _, inst_use, inst_kill in reversed(code):
+            use = (use & ~inst_kill) | inst_use
+            kill |= inst_kill
+        insts[addr] = code
+        summary[addr] = (use, kill)
+        for edge in bbl['Edges']:
+            if edge['EdgeType'] not in SKIPPED_EDGES and edge['To'] in preds:
+                preds[edge['To']].append(addr)
+
+    def get_live_out(addr):
+        live = 0
+        succs = [edge['To'] for edge in bbls[addr]['Edges'] if edge['EdgeType'] not in SKIPPED_EDGES]
+        if not succs:
+            return ALL_LIVE
+        for succ in succs:
+            live |= live_in.get(succ, ALL_LIVE)
+        return live
+
+    live_in = {addr: 0 for addr in bbls}
+    queue = list(bbls)
+    pending = set(queue)
+    while queue:
+        addr = queue.pop()
+        pending.discard(addr)
+        use, kill = summary[addr]
+        live = (get_live_out(addr) & ~kill) | use
+        if live != live_in[addr]:
+            live_in[addr] = live
+            for pred in preds[addr]:
+                if pred not in pending:
+                    pending.add(pred)
+                    queue.append(pred)
+
+    live_before = dict()
+    live_after = dict()
+    for addr, code in insts.items():
+        live = get_live_out(addr)
+        for inst_addr, use, kill in reversed(code):
+            live_after[inst_addr] = live_after.get(inst_addr, 0) | live
+            live = (live & ~kill) | use
+            live_before[inst_addr] = live_before.get(inst_addr, 0) | live
+    return live_before, live_after
+
+
+# instructions that write at most the register of their destination
+DEST_WRITE_OPS = MOVE_OPS | FLAGS_WRITERS | {'inc', 'dec', 'not', 'shl', 'shr', 'sar', 'sal', 'rol', 'ror',
+                                             'bswap', 'imul', 'pop'}
+
+def get_operand_regs(operand, syntax):
+    # the mask of the registers an operand refers to
+    reg_re = INTEL_REG if syntax == 'intel' else ATT_REG
+    return reg_mask([reg for reg in reg_re.findall(operand) if reg in REG_BIT])
+
+def get_written_regs(disassem, syntax):
+    '''
+    Mask of the registers an instruction may modify, even partially.
+    Everything for an instruction that is not modeled, and for a branch,
+    a call or a return.
+    '''
+    opcode, operands = split_instruction(disassem, syntax)
+    if not opcode or opcode in NOP_OPS or opcode in ['cmp', 'test', 'bt']:
+        return 0
+    if opcode == 'push':
+        return REG_BIT['RSP']
+    if opcode not in DEST_WRITE_OPS or (opcode == 'imul' and len(operands) < 2):
+        return ALL_LIVE
+    written = REG_BIT['RSP'] if opcode == 'pop' else 0
+    dest = get_register(operands[0], syntax) if operands else ''
+    if dest:
+        written |= REG_BIT[dest]
+    return written
+
+
+# Stack frame: the stack pointer and the frame pointer as offsets from the
+# stack pointer at the entry of the function. A frame pointer of None holds
+# no stack address.
+UNKNOWN = 'unknown'
+# bytes below RSP that signal handlers leave alone (System V ABI)
+RED_ZONE = 0x80
+
+PUSH_OPS = {'push', 'pushf', 'pushfq'}
+POP_OPS = {'pop', 'popf', 'popfq'}
+# instructions that do not write their first operand
+NO_WRITE_OPS = {'cmp', 'test', 'bt', 'push', 'nop'}
+
+INTEL_STACK_REF = re.compile(r'\[(RSP|RBP)\b([^\]]*)\]')
+INTEL_DISP = re.compile(r'([+-]0x[0-9a-f]+)$')
+ATT_STACK_REF = re.compile(r'(-?0x[0-9a-f]+)?\(%(RSP|RBP)\b')
+
+
+def get_stack_refs(operands, syntax):
+    # (base, displacement) of the operands addressed from RSP or RBP
+    refs = []
+    for op in operands:
+        if syntax == 'intel':
+            for base, rest in INTEL_STACK_REF.findall(op):
+                disp = INTEL_DISP.search(rest)
+                refs.append((base, int(disp.group(1), 16) if disp else 0))
+        else:
+            for disp, base in ATT_STACK_REF.findall(op):
+                refs.append((base, int(disp, 16) if disp else 0))
+    return refs
+
+def get_imm(operand, syntax):
+    if syntax != 'intel':
+        if not operand.startswith('$'):
+            return None
+        operand = operand[1:]
+    try:
+        return int(operand, 16)
+    except ValueError:
+        return None
+
+def add_offset(offset, value):
+    if isinstance(offset, int):
+        return offset + value
+    return UNKNOWN
+
+def merge_offset(offset, other):
+    return offset if offset == other else UNKNOWN
+
+def step_frame(opcode, operands, syntax, sp, bp):
+    '''
+    The stack pointer and the frame pointer after an instruction.
+    '''
+    dest = get_register(operands[0], syntax) if operands else ''
+    if opcode in PUSH_OPS:
+        return add_offset(sp, -8), bp
+    if opcode in POP_OPS:
+        return add_offset(sp, 8), (None if dest in SUB_REGISTERS['RBP'] + ['RBP'] else bp)
+    if opcode == 'leave':
+        return add_offset(bp, 8), None
+    if opcode in ['call', 'ret']:
+        return sp, bp
+    if opcode == 'enter':
+        return UNKNOWN, UNKNOWN
+    if opcode == 'xchg':
+        regs = [get_register(op, syntax) for op in operands]
+        if 'RSP' in regs:
+            sp = UNKNOWN
+        if 'RBP' in regs:
+            bp = UNKNOWN
+        return sp, bp
+    if opcode in NO_WRITE_OPS or dest not in ['RSP', 'RBP'] + SUB_REGISTERS['RSP'] + SUB_REGISTERS['RBP']:
+        return sp, bp
+
+    src = operands[1] if len(operands) == 2 else ''
+    if dest in SUB_REGISTERS['RBP'] + ['RBP'] and bp is None and 'RSP' not in src:
+        # still no stack address
+        return sp, None
+
+    value = UNKNOWN
+    imm = get_imm(src, syntax)
+    if dest in ['RSP', 'RBP'] and opcode in ['add', 'sub'] and imm is not None:
+        offset = sp if dest == 'RSP' else bp
+        value = add_offset(offset, imm if opcode == 'add' else -imm)
+    elif dest in ['RSP', 'RBP'] and opcode in ['mov', 'movq']:
+        src_reg = get_register(src, syntax)
+        if src_reg == 'RSP':
+            value = sp
+        elif src_reg == 'RBP':
+            value = bp
+        elif dest == 'RBP' and 'RSP' not in src and 'RBP' not in src:
+            value = None
+    elif dest in ['RSP', 'RBP'] and opcode == 'lea':
+        refs = get_stack_refs([src], syntax)
+        index = INTEL_REG.findall(src) if syntax == 'intel' else ATT_REG.findall(src)
+        if len(refs) == 1 and len(index) == 1:
+            base, disp = refs[0]
+            value = add_offset(sp if base == 'RSP' else bp, disp)
+
+    if dest == 'RSP':
+        return value, bp
+    if dest == 'RBP':
+        return sp, value
+    # a part of RSP or RBP
+    if dest in SUB_REGISTERS['RSP']:
+        return UNKNOWN, bp
+    return sp, UNKNOWN
+
+
+def compute_stack_frame(bbls, root, syntax):
+    '''
+    Forward analysis of the stack pointer over the superset CFG of a
+    function, from its entry. Returns the stack pointer before each
+    instruction and the lowest address below the stack pointer that the
+    function refers to: None if it refers to none, UNKNOWN if it refers to
+    the stack through a pointer that is not known.
+    '''
+    states = {root: (0, None)} if root in bbls else {}
+    queue = list(states)
+    while queue:
+        addr = queue.pop()
+        sp, bp = states[addr]
+        for inst in bbls[addr]['Code']:
+            opcode, operands = split_instruction(inst['Disassem'], syntax)
+            sp, bp = step_frame(opcode, operands, syntax, sp, bp)
+        for edge in bbls[addr]['Edges']:
+            if edge['EdgeType'] in SKIPPED_EDGES or edge['To'] not in bbls:
+                continue
+            old = states.get(edge['To'])
+            new = (sp, bp) if old is None else (merge_offset(old[0], sp), merge_offset(old[1], bp))
+            if new != old:
+                states[edge['To']] = new
+                queue.append(edge['To'])
+
+    sp_dict = dict()
+    lowest = None
+    for addr, (sp, bp) in states.items():
+        for inst in bbls[addr]['Code']:
+            inst_addr = inst['Addr']
+            sp_dict[inst_addr] = merge_offset(sp_dict[inst_addr], sp) if inst_addr in sp_dict else sp
+            opcode, operands = split_instruction(inst['Disassem'], syntax)
+            for base, disp in get_stack_refs(operands, syntax):
+                if base == 'RBP' and bp is None:
+                    continue
+                ref = add_offset(sp if base == 'RSP' else bp, disp)
+                if sp == UNKNOWN or ref == UNKNOWN:
+                    lowest = UNKNOWN
+                elif ref < sp and lowest != UNKNOWN:
+                    lowest = ref if lowest is None else min(lowest, ref)
+            sp, bp = step_frame(opcode, operands, syntax, sp, bp)
+    return sp_dict, lowest
+
+
+# methods timed with --profile
+PROFILED_METHODS = ['build_cfg', 'construct_CFG', 'examine_br', 'serialize', 'solve_overlap', 'get_liveness',
+                    'get_stack_frame']
+
+
 class CFGSerializer:
+    # a method so that --profile can time it
+    construct_CFG = staticmethod(construct_CFG)
 
-    def __init__(self, fun_addr, bbls, jmp_info, opt_level=0, syntax='intel'):
+    def __init__(self, fun_addr, bbls, jmp_info, opt_level=0, syntax='intel', profiler=None, lean=False):
         self.root = fun_addr
         self._original_bbls = bbls
         self.jmp_info = jmp_info
         self.opt_level = opt_level
         self.syntax = syntax
+        # no comment instrumentation in lean mode
+        self.lean = lean
 
         self.bbl_seq = {}
         self.overlapped_bbls = []
         self.bbl_addrs = {}
+        self.liveness = None
+        self.stack_frame = None
+
+        if profiler:
+            profiler.instrument(self, PROFILED_METHODS)
 
     def build_cfg(self, visit_log):
 
         self.br_dict, self.tbl_sym_dict, self.comment_dict = self.examine_br()
 
-        leaders, droppedBBLs = construct_CFG(self.root, self._original_bbls, self.syntax, visit_log)
+        leaders, droppedBBLs = self.construct_CFG(self.root, self._original_bbls, self.syntax, visit_log)
 
         regions = []
         for leader in leaders:
@@ -136,24 +568,24 @@ class CFGSerializer:
         queue = []
         visited = []
         first_bbl = overlap[0]
-        comment = '\n# <--------- The Beginning of Overlapped Region (%s)'%(hex(first_bbl.Start))
-        queue.append(Instrumentation(first_bbl.Start, comment, InstType.Comment, None))
+        if not self.lean:
+            comment = '\n# <--------- The Beginning of Overlapped Region (%s)'%(hex(first_bbl.Start))
+            queue.append(Instrumentation(first_bbl.Start, comment, InstType.Comment, None))
 
         while overlap:
             cur_bbl = overlap[0]
             next_addr = cur_bbl.End
-            comment = '# Overlapped Region <<<<< %s'%(hex(cur_bbl.Start))
-            queue.append(Instrumentation(cur_bbl.Start, comment, InstType.Comment, None))
+            if not self.lean:
+                comment = '# Overlapped Region <<<<< %s'%(hex(cur_bbl.Start))
+                queue.append(Instrumentation(cur_bbl.Start, comment, InstType.Comment, None))
             queue.append(cur_bbl)
             visited.append(cur_bbl.Start)
-            debugMsg = '\t\t\t[*] Serialize: 0x%x-0x%x'%(cur_bbl.Start, cur_bbl.End)
             for tmp_bbl in overlap:
                 if tmp_bbl.Start == next_addr:
                     cur_bbl = tmp_bbl
                     queue.append(cur_bbl)
                     visited.append(cur_bbl.Start)
                     next_addr = cur_bbl.End
-                    debugMsg += ', 0x%x-0x%x'%(cur_bbl.Start, cur_bbl.End)
 
                     if cur_bbl.Fallthrough != cur_bbl.End:
                         break
@@ -163,14 +595,15 @@ class CFGSerializer:
             # jump to the next block
             if next_addr == last_addr:
                 if overlap:
-                    comment = '# Jump to next block >>>> %s'%(hex(last_addr))
+                    comment = '' if self.lean else '# Jump to next block >>>> %s'%(hex(last_addr))
                     queue.append(Instrumentation(next_addr, comment, InstType.JMP, None))
             elif next_addr in visited and cur_bbl.Fallthrough == cur_bbl.End:
-                comment = '# Jump to next block >>>> %s' % (hex(next_addr))
+                comment = '' if self.lean else '# Jump to next block >>>> %s' % (hex(next_addr))
                 queue.append(Instrumentation(next_addr, comment, InstType.JMP, None))
 
-        comment = '# <--------- The End of Overlapped Region (%s)\n'%(hex(last_addr))
-        queue.append(Instrumentation(last_addr, comment, InstType.Comment, None))
+        if not self.lean:
+            comment = '# <--------- The End of Overlapped Region (%s)\n'%(hex(last_addr))
+            queue.append(Instrumentation(last_addr, comment, InstType.Comment, None))
         return queue
 
 
@@ -232,6 +665,9 @@ class CFGSerializer:
 
                 mem_acc_addr = int(pattern['MemAccSite']['Addr'], 16)
 
+            if self.lean:
+                continue
+
             if len(tables) > 1:
                 comment = '# [*] Multiple Candidates @%s: %s'%(jmp_site, tables)
                 queue.append(Instrumentation(mem_acc_addr, comment, InstType.Comment, None))
@@ -301,3 +737,47 @@ class CFGSerializer:
                 return True
 
         return False
+
+    def get_liveness(self):
+        if self.liveness is None:
+            self.liveness = compute_liveness(self._original_bbls, self.syntax, self.jmp_info)
+        return self.liveness
+
+    def get_live(self, inst, after=False):
+        live_before, live_after = self.get_liveness()
+        if after:
+            return live_after.get(inst['Addr'], ALL_LIVE)
+        return live_before.get(inst['Addr'], ALL_LIVE)
+
+    def get_dead_register(self, inst, excluded=()):
+        # a register that is not live before inst, or '' if there is none
+        live = self.get_live(inst) | NOT_SCRATCH | reg_mask([reg for reg in excluded if reg in REG_BIT])
+        for reg in REGISTERS_x64:
+            if not live & REG_BIT[reg]:
+                return reg
+        return ''
+
+    def is_flags_live(self, inst, after=False):
+        return bool(self.get_live(inst, after) & FLAGS)
+
+    def get_stack_frame(self):
+        if self.stack_frame is None:
+            self.stack_frame = compute_stack_frame(self._original_bbls, self.root, self.syntax)
+        return self.stack_frame
+
+    def get_spill_offset(self, inst):
+        '''
+        Offset below RSP of an 8-byte stack slot that is free before inst:
+        below every address the function refers to under the stack pointer
+        and within the red zone. -1 if there is no such slot.
+        '''
+        sp_dict, lowest = self.get_stack_frame()
+        sp = sp_dict.get(inst['Addr'], UNKNOWN)
+        if sp == UNKNOWN or lowest == UNKNOWN:
+            return -1
+        offset = 8
+        if lowest is not None:
+            offset = max(offset, sp - lowest + 8)
+        if offset > RED_ZONE:
+            return -1
+        return offset
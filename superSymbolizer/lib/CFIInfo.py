@@ -1,19 +1,21 @@
 #!/usr/bin/env python3 -tt
 #-*- coding: utf-8 -*-
-from elftools.elf.elffile import ELFFile
 from elftools.dwarf.callframe import CallFrameInfo
 from elftools.dwarf.callframe import FDE
 from elftools.dwarf.structs import DWARFStructs
 from elftools.dwarf.dwarf_expr import DW_OP_opcode2name
+from superSymbolizer.ElfBricks import open_elf
 from superSymbolizer.lib.ExceptTable import GCCExceptTable
 from superSymbolizer.lib.ExceptTable import decode_uleb128
 import struct
 
+
 class CFIInfo:
     def __init__(self, bin_path, arch='x86-64'):
 
-        self.f = open(bin_path, 'rb')
-        self.elffile = ELFFile(self.f)
+        # bin_path is the path of the binary or its shared ElfModel
+        self.elf = open_elf(bin_path)
+        self.elffile = self.elf.elffile
         self.arch = arch
 
         self.dwarf = self.elffile.get_dwarf_info()
@@ -23,13 +25,24 @@ class CFIInfo:
 
         self.my_struct = DWARFStructs(little_endian=self.config.little_endian, dwarf_format=32, address_size=self.config.default_address_size)
 
+        # pyelftools 0.31 and later share one DWARFStructs per format
+        # between the CFI entries instead of building one per entry; 0.33
+        # changes the decoded form of the CFI instructions (see get_desc)
         self.cfi = CallFrameInfo(self.eh_frame.stream, self.eh_frame.size, self.eh_frame.address, base_structs=self.my_struct, for_eh_frame=True)
 
-        self.entries = self.cfi.get_entries()
+        self.entries = self.parse_entries()
+
+        # parsed once per binary: the CIE headers by offset in .eh_frame and
+        # the LSDAs by address (GCCExceptTable.except_dict)
+        self.cie_headers = dict()
+        self.gcc_except_table = GCCExceptTable(self.elf)
 
         self.fde_tbl = None
         self.get_fde_tbl()
 
+    def parse_entries(self):
+        return self.cfi.get_entries()
+
 
     def get_eh_frame_section(self):
         for section in self.elffile.iter_sections():
@@ -38,9 +51,23 @@ class CFIInfo:
         return ''
 
 
-    def get_augment_addr(self, section, c_offset, a_offset):
-        data = section.data()
-        cie = CIEHeader(data[c_offset:])
+    def get_eh_frame(self):
+        # (contents, address) of .eh_frame
+        return self.elf.get_section_data('.eh_frame')
+
+    def get_cie_header(self, c_offset):
+        if c_offset not in self.cie_headers:
+            data, _ = self.get_eh_frame()
+            self.cie_headers[c_offset] = CIEHeader(memoryview(data)[c_offset:])
+        return self.cie_headers[c_offset]
+
+    def get_lsda(self, addr):
+        # a copy, as the caller adds the FDE's own entries to it
+        return dict(self.gcc_except_table.parse(addr))
+
+    def get_augment_addr(self, c_offset, a_offset):
+        _, eh_frame_addr = self.get_eh_frame()
+        cie = self.get_cie_header(c_offset)
 
         if 'P_fp' in cie.aData:
             fp_offset = c_offset + cie.aData['P_fp'][0] + cie.aData['P_fp'][1]
@@ -49,7 +76,7 @@ class CFIInfo:
 
         if a_offset != cie.aData['P_fp'][0]:
             assert False
-        return section.header.sh_addr + a_offset + c_offset + cie.aData['P_fp'][1]
+        return eh_frame_addr + a_offset + c_offset + cie.aData['P_fp'][1]
 
     def get_fde_tbl(self):
         if self.fde_tbl is not None:
@@ -75,15 +102,12 @@ class CFIInfo:
         #FDE location
         offset = item.offset
 
-        gcc_except_table = GCCExceptTable(self.elffile)
         if len(item.augmentation_bytes) > 0:
-            eh_frame = self.get_eh_frame_section()
-            eh_frame_data = eh_frame.data()
-            eh_frame_addr = eh_frame.header.sh_addr
+            _, eh_frame_addr = self.get_eh_frame()
 
 
             f_offset = item.cie.augmentation_dict['personality'].function
-            f_addr = self.get_augment_addr(eh_frame, item.cie.offset, f_offset)
+            f_addr = self.get_augment_addr(item.cie.offset, f_offset)
 
             #encoding
             LSDA_encoding = item.cie.augmentation_dict['LSDA_encoding']
@@ -92,7 +116,7 @@ class CFIInfo:
 
             gcc_except_table_addr = augment+offset+17+eh_frame_addr
 
-            tbl = gcc_except_table.parse(gcc_except_table_addr)
+            tbl = self.get_lsda(gcc_except_table_addr)
             tbl['entry_point'] = entry_point
             tbl['gcc_except_table_addr'] = gcc_except_table_addr
             tbl['f_addr'] = f_addr
@@ -132,7 +156,7 @@ class CIEHeader:
             if data[idx] == 0 or data[idx] == '\x00':
                 break
             idx += 1
-        self.augmentation = data[9:idx]
+        self.augmentation = bytes(data[9:idx])
         idx += 1
         self.code_align = data[idx]
         idx += 1
@@ -408,7 +432,7 @@ def print_except_table(cfi, item, ehTbl):
 
 
         f_offset = item.cie.augmentation_dict['personality'].function
-        f_addr = cfi.get_augment_addr(eh_frame, item.cie.offset, f_offset)
+        f_addr = cfi.get_augment_addr(item.cie.offset, f_offset)
 
         #encoding
         LSDA_encoding = item.cie.augmentation_dict['LSDA_encoding']
@@ -1,7 +1,7 @@
 import enum
+import mmap
 from collections import namedtuple
-from ctypes import Structure, c_char, c_uint16, c_uint32, c_uint64, c_int64, c_uint8, string_at, byref, sizeof, \
-    create_string_buffer, cast, pointer, POINTER
+from ctypes import Structure, c_char, c_uint16, c_uint32, c_uint64, c_int64, c_uint8, string_at, byref, sizeof
 
 
 class ELFHeader(Structure):
@@ -265,10 +265,35 @@ def Pack(ctype_instance):
     return buf
 
 
-def Unpack(ctype, buf):
-    cstring = create_string_buffer(buf)
-    ctype_instance = cast(pointer(cstring), POINTER(ctype)).contents
-    return ctype_instance
+def Unpack(ctype, buf, offset=0):
+    '''
+    Decode the ctype structure at offset of buf, which can be bytes, a
+    memoryview or an mmap. Only the structure itself is copied, so the
+    result can be modified and packed again and it does not keep buf
+    alive. A buf that ends before the structure does is padded with zeros.
+    '''
+    size = sizeof(ctype)
+    if len(buf) - offset < size:
+        return ctype.from_buffer_copy(bytes(buf[offset:offset + size]).ljust(size, b'\x00'))
+    return ctype.from_buffer_copy(buf, offset)
+
+
+def get_cstr(strtab, offset, encoding='utf-8'):
+    # the NUL-terminated string at offset of a string table
+    end = strtab.find(b'\x00', offset)
+    if end < 0:
+        end = len(strtab)
+    return strtab[offset:end].decode(encoding)
+
+
+def map_file(filename):
+    '''
+    Map filename read-only and return a memoryview of it. Slices of the view
+    share the mapping, so only the pages that are read are loaded. The file
+    must not be truncated while the view is in use.
+    '''
+    with open(filename, 'rb') as f:
+        return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
 
 
 SectionBrick = namedtuple('SectionBrick', ['name', 'OffsetRange', 'AddrRange', 'header', 'body'])
@@ -66,7 +66,7 @@ class LSDA_CALLSITE_ENTRY:
         self.action, length = decode_uleb128(data[idx:])
         idx += length
 
-        self.data = data[:idx]
+        self.data = bytes(data[:idx])
         self.idx = idx
 
 
@@ -90,7 +90,7 @@ class LSDA_TYPE_TABLE:
 
 class LSDA_TYPE_ENTRY:
     def __init__(self, data, offset, item_size):
-        self.data = data
+        self.data = bytes(data)
         #if len(data) < 4:
         #    import pdb
         #    pdb.set_trace()
@@ -148,8 +148,8 @@ class LSDA_CALLSITE_HEADER:
 
 
 class GCCExceptTable:
-    def __init__(self, elffile):
-        self.elffile = elffile
+    def __init__(self, elf):
+        self.elf = elf
 
         #import pdb
         #pdb.set_trace()
@@ -174,15 +174,14 @@ class GCCExceptTable:
             idx += length
     '''
     def parse(self, addr):
+        # an LSDA is parsed once, whatever the number of FDEs that refer to it
+        if addr in self.except_dict:
+            return self.except_dict[addr]
 
-        #import pdb
-        #pdb.set_trace()
-
-        #print(section)
         offset = addr - self.sec_addr
         if offset > len(self.section):
             offset = offset & 0xffffffff
-        lsda, length = self.parse_LSDA(self.section[offset:])
+        lsda, length = self.parse_LSDA(memoryview(self.section)[offset:])
         self.except_dict[addr] = lsda
         return lsda
 
@@ -320,40 +319,31 @@ class GCCExceptTable:
 
 
     def get_gcc_except_table(self):
-        for section in self.elffile.iter_sections():
-            if section.name == '.gcc_except_table':
-                return section.data(), section.header.sh_addr
-        return '',0
-
-
-EHFUN_CNT = 0
-EHBB_CNT = 0
-EHTBL_CNT = 0
+        return self.elf.get_section_data('.gcc_except_table')
 
 
 class EHTable:
     def __init__(self, tbl, start_proc_addr, reloc_sym_dict, symbolizer):
-        global EHFUN_CNT
-        global EHTBL_CNT
 
         self.tbl = tbl
         self.start_proc_addr = start_proc_addr
         self.before_label_dict = dict()
         self.after_label_dict = dict()
 
-        self.eh_fun_id = EHFUN_CNT
+        # the id is local to the owning function so that labels do not
+        # depend on the order in which functions are symbolized
+        self.eh_fun_id = symbolizer.get_eh_fun_id()
+        self.eh_bb_cnt = 0
         self.label = dict()
-        self.label['fun'] = '.LEHF%d' % (EHFUN_CNT)
-        self.label['begin'] = '.LLSDA%d' % (EHTBL_CNT)
-        self.label['ttype'] = '.LLSDATTD%d' % (EHTBL_CNT)
-        self.label['cs_begin'] = '.LLSDACSB%d' % (EHTBL_CNT)
-        self.label['cs_end'] = '.LLSDACSE%d' % (EHTBL_CNT)
-        self.label['end'] = '.LLSDATT%d' % (EHTBL_CNT)
+        self.label['fun'] = '.LEHF%s' % (self.eh_fun_id)
+        self.label['begin'] = '.LLSDA%s' % (self.eh_fun_id)
+        self.label['ttype'] = '.LLSDATTD%s' % (self.eh_fun_id)
+        self.label['cs_begin'] = '.LLSDACSB%s' % (self.eh_fun_id)
+        self.label['cs_end'] = '.LLSDACSE%s' % (self.eh_fun_id)
+        self.label['end'] = '.LLSDATT%s' % (self.eh_fun_id)
 
         # tsection = resdic['.text']
 
-        EHFUN_CNT += 1
-        EHTBL_CNT += 1
         # tsection.get(start_proc_addr).eh_label_before += '%s:\n' % (label['fun'])
         #label_dict[start_proc_addr] = '%s:\n' % (self.label['fun'])
         self.ref_sym_dict = dict()
@@ -372,19 +362,24 @@ class EHTable:
         return self.eh_table
 
     def _create_eh_table(self, reloc_sym_dict, symbolizer):
+        lean = symbolizer.lean
         contents = []
         contents.append('.section .gcc_except_table,"a",@progbits')
-        contents.append('#----------except table %s------------' % (hex(self.start_proc_addr)))
+        if not lean:
+            contents.append('#----------except table %s------------' % (hex(self.start_proc_addr)))
         contents.extend(self.get_LSDA_header())
 
-        contents.append('#---------- table entries ------------')
+        if not lean:
+            contents.append('#---------- table entries ------------')
         contents.append('%s:' % (self.label['cs_begin']))
         contents.extend(self.get_LSDA_tbl_entries())
         contents.append('%s:' % (self.label['cs_end']))
 
-        contents.append('#---------- action info ------------')
+        if not lean:
+            contents.append('#---------- action info ------------')
         contents.extend(self.get_action_tbl_entries())
-        contents.append('#---------- type info ------------')
+        if not lean:
+            contents.append('#---------- type info ------------')
         contents.append(' .p2align 2')
         contents.extend(self.get_type_tbl_entries(reloc_sym_dict, symbolizer))
         contents.append('%s:' % (self.label['end']))
@@ -445,7 +440,6 @@ class EHTable:
     def get_LSDA_tbl_entries(self):
         # offset = 0
         contents = []
-        global EHBB_CNT
         for item in self.tbl['region_tbl']:
             bb_start = self.start_proc_addr + item.start
             bb_end = bb_start + item.length
@@ -453,18 +447,18 @@ class EHTable:
             action = item.action
             # print(' entry: %s-%s : landing_pad: %s, action %d'%(hex(bb_start), hex(bb_end), hex(landing_pad_start), action))
             local_label = {}
-            local_label['bb_begin'] = '.LEHB_%d_%d' % (self.eh_fun_id, EHBB_CNT)
-            local_label['bb_end'] = '.LEHE_%d_%d' % (self.eh_fun_id, EHBB_CNT)
+            local_label['bb_begin'] = '.LEHB_%s_%d' % (self.eh_fun_id, self.eh_bb_cnt)
+            local_label['bb_end'] = '.LEHE_%s_%d' % (self.eh_fun_id, self.eh_bb_cnt)
             local_label['landing_begin'] = ''
             if landing_pad_start > self.start_proc_addr:
-                landing_label = '.LANDING_%d_%d' % (self.eh_fun_id, EHBB_CNT)
+                landing_label = '.LANDING_%s_%d' % (self.eh_fun_id, self.eh_bb_cnt)
                 local_label['landing_begin'] = landing_label
                 self.register_before_label(landing_pad_start, landing_label)
 
             self.register_before_label(bb_start, local_label['bb_begin'])
             self.register_after_label(bb_end, local_label['bb_end'])
 
-            EHBB_CNT += 1
+            self.eh_bb_cnt += 1
 
             contents.append(' .uleb128 %s-%s' % (local_label['bb_begin'], self.label['fun']))
             contents.append(' .uleb128 %s-%s' % (local_label['bb_end'], local_label['bb_begin']))
@@ -0,0 +1,51 @@
+class FunStream:
+    '''
+    The fun_dict of the streaming emission. Instead of holding the
+    LocalSymbolizer of every function, it symbolizes a function when it is
+    first looked up and forgets it on release(), so that only the functions
+    being printed are in memory.
+
+    symbolizers yields the LocalSymbolizers in metadata order; the ones that
+    come before the function looked up are kept until they are asked for.
+    on_symbolize(fun_symbolizer) is called for each of them in that order,
+    so whatever it collects is the same as without streaming.
+    '''
+    def __init__(self, fun_addrs, symbolizers, on_symbolize):
+        self.fun_addrs = list(fun_addrs)
+        self.fun_addr_set = set(self.fun_addrs)
+        self.symbolizers = iter(symbolizers)
+        self.on_symbolize = on_symbolize
+        self.ready = dict()
+        self.released = set()
+
+    def keys(self):
+        return self.fun_addrs
+
+    def __contains__(self, fun_addr):
+        return fun_addr in self.fun_addr_set
+
+    def __len__(self):
+        return len(self.fun_addrs)
+
+    def __getitem__(self, fun_addr):
+        if fun_addr not in self.fun_addr_set:
+            raise KeyError(fun_addr)
+        assert fun_addr not in self.released, '%s is used after it was released'%(fun_addr)
+        while fun_addr not in self.ready:
+            fun_symbolizer = next(self.symbolizers)
+            self.on_symbolize(fun_symbolizer)
+            self.ready[fun_symbolizer.fun_addr] = fun_symbolizer
+        return self.ready[fun_addr]
+
+    def release(self, fun_addr):
+        if fun_addr in self.ready:
+            del self.ready[fun_addr]
+        self.released.add(fun_addr)
+
+    def drain(self):
+        # symbolize the remaining functions only for what on_symbolize collects
+        for fun_symbolizer in self.symbolizers:
+            self.on_symbolize(fun_symbolizer)
+            self.released.add(fun_symbolizer.fun_addr)
+        self.released.update(self.ready.keys())
+        self.ready = dict()
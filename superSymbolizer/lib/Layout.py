@@ -0,0 +1,54 @@
+import bisect
+
+# the section of the code that only runs when something went wrong; it is
+# left with .popsection to get back to the section of the function
+COLD_SECTION = '.pushsection .text.unlikely,"ax",@progbits'
+
+
+def load_exec_profile(filename):
+    '''
+    Read an execution profile of the original binary: one sample per line,
+    an address in hex followed by an optional count (1 by default). Blank
+    lines and lines starting with # are skipped, so the output of
+    `perf script -F ip` as well as a list of `<addr> <count>` lines can be
+    used. The addresses are those of the binary on disk, i.e. the load base
+    of a PIE is already subtracted.
+    '''
+    counts = dict()
+    with open(filename) as fd:
+        for line in fd:
+            fields = line.split()
+            if not fields or fields[0].startswith('#'):
+                continue
+            addr = int(fields[0], 16)
+            count = int(fields[1]) if len(fields) > 1 else 1
+            counts[addr] = counts.get(addr, 0) + count
+    return counts
+
+
+def get_unit_weights(units, counts):
+    '''
+    The number of samples of each unit, i.e. of each function or part
+    block printed on its own. A sample belongs to the unit with the
+    greatest start address at or below it.
+    '''
+    starts = sorted(set(units))
+    weights = [0] * len(starts)
+    for addr, count in counts.items():
+        idx = bisect.bisect_right(starts, addr) - 1
+        if idx >= 0:
+            weights[idx] += count
+    return dict(zip(starts, weights))
+
+
+def order_by_profile(units, counts):
+    '''
+    The units with samples, hottest first, followed by the others in
+    address order. Units are only moved as a whole: a function keeps its
+    blocks, CFI and exception tables, and its part blocks are labeled.
+    '''
+    weights = get_unit_weights(units, counts)
+    starts = sorted(weights)
+    hot = sorted([addr for addr in starts if weights[addr]], key=lambda addr: -weights[addr])
+    cold = [addr for addr in starts if not weights[addr]]
+    return hot + cold
@@ -1,13 +1,46 @@
 import re
 from superSymbolizer.lib.CFGSerializer import CFGSerializer
 from superSymbolizer.lib.ExceptTable import EHTable
+from superSymbolizer.lib.Layout import COLD_SECTION
 from superSymbolizer.lib.Misc import RelocExpr, Instrumentation, InstType, REGISTERS, is_register, REGISTERS_x64, is_unsupported_instruction
+from superSymbolizer.lib.Profiler import Profiler, uninstrument
 
 pattern = re.compile('\[(.*)\]')
 
+# what the comments of the lean mode are replaced with
+EMPTY_CODE = RelocExpr('', '', '', '')
+
+# sites with at least this many candidate tables are dispatched by a binary
+# search over the table addresses instead of a chain of compares
+BR_DISPATCH_MIN = 4
+
+# methods timed with --profile
+PROFILED_METHODS = ['run', 'symbolize_fun', 'symbolize_jtables', 'symbolize_disassem_code',
+                    'emit_symbolized_asm', 'symbolize_rip_addressing', 'symbolize_pc_addressing']
+
+def merge_fde_ranges(fde_info):
+    fde_dict = {int(item['Start'], 16): int(item['End'], 16) for item in fde_info}
+    fde_list = []
+    for fdeStart in sorted(list(fde_dict.keys())):
+        new_end = fde_dict[fdeStart]
+        b_update = False
+        for idx, item in enumerate(fde_list):
+            if fdeStart in item:
+                new_end = max(item.stop, new_end)
+                fde_list[idx] = range(item.start, new_end )
+                b_update = True
+                break
+        if not b_update:
+            fde_list.append(range(fdeStart, new_end))
+    fde_ranges = []
+    for item in fde_list:
+        fde_ranges.append({'Start':hex(item.start), 'End':hex(item.stop)})
+    return fde_ranges
+
 class LocalSymbolizer:
     def __init__(self, fun_addr, fun_id, fun_label, fun_info, fun_info_dict, plt_dict, opt_level=0, syntax='intel',
-                 disable_super_symbolize = False):
+                 disable_super_symbolize = False, profile=False, lean=False, cold_false_bbls=False,
+                 keep_liveness=False):
         self.fun_addr = fun_addr
         self.addr = int(fun_addr, 16)
         self.fun_label = fun_label
@@ -17,6 +50,15 @@ class LocalSymbolizer:
         self.refer_funs = set()
         self.opt_level = opt_level
         self.syntax = syntax
+        # in lean mode no comments are emitted, only code, labels and
+        # directives
+        self.lean = lean
+        # the false blocks are defined in .text.unlikely, away from the code
+        self.cold_false_bbls = cold_false_bbls
+        # with keep_liveness, the registers and flags live before each memory
+        # access are kept for the instrumentation added while printing
+        self.keep_liveness = keep_liveness
+        self.live_before = {}
         if disable_super_symbolize:
             self.super_symbolize = False
         else:
@@ -38,33 +80,38 @@ class LocalSymbolizer:
         self.no_overlapped_bbls = 0
         self.total_br_sites = 0
         self.multi_br_sites = 0
+        # MemAccSite -> (candidate tables, compares to reach the last table)
+        self.br_depth_dict = {}
         self.local_label_dict = {}
         self.visited_local_labels = []
-        self.stack_height = 0
+        # offset below RSP of the stack slot for spills at the current site
+        self.spill_offset = -1
 
         self.data_labels = []
         self.jtable_dict = {}
         self.instrument_label_dict = {}
         self.rip_access_addrs = []
+        self.eh_tbl_cnt = 0
+
+        self.profiler = None
+        if profile:
+            self.profiler = Profiler()
+            self.profiler.instrument(self, PROFILED_METHODS)
+
+    def __getstate__(self):
+        # the dictionaries shared by every function are not shipped back from
+        # a symbolization worker; SuperSymbolizer re-attaches them
+        state = self.__dict__.copy()
+        for key in ['fun_info_dict', 'plt_dict']:
+            state[key] = None
+        return uninstrument(state, PROFILED_METHODS)
+
+    def attach(self, fun_info_dict, plt_dict):
+        self.fun_info_dict = fun_info_dict
+        self.plt_dict = plt_dict
 
     def create_fde_list(self, fde_info):
-        fde_dict = {int(item['Start'], 16): int(item['End'], 16) for item in fde_info}
-        fde_list = []
-        for fdeStart in sorted(list(fde_dict.keys())):
-            new_end = fde_dict[fdeStart]
-            b_update = False
-            for idx, item in enumerate(fde_list):
-                if fdeStart in item:
-                    new_end = max(item.stop, new_end)
-                    fde_list[idx] = range(item.start, new_end )
-                    b_update = True
-                    break
-            if not b_update:
-                fde_list.append(range(fdeStart, new_end))
-        fde_ranges = []
-        for item in fde_list:
-            fde_ranges.append({'Start':hex(item.start), 'End':hex(item.stop)})
-        return fde_ranges
+        return merge_fde_ranges(fde_info)
 
     def add_false_block_labels(self, reassem_code):
         visited_false_labels = []
@@ -72,15 +119,20 @@ class LocalSymbolizer:
             falseLeader = int(falseBBL, 16)
             if falseLeader in self.visited_local_labels:
                 visited_false_labels.append(falseLeader)
-        if visited_false_labels:
+        if visited_false_labels and not self.lean:
             comments = ['#----------------------------------------',
                         '# the definition of false BBLs',
                         '#----------------------------------------']
             for comment in comments:
                 reassem_code.append(self.emit_comment('' , comment))
+        if visited_false_labels:
+            if self.cold_false_bbls:
+                reassem_code.append(self.emit_directive(COLD_SECTION))
             for falseLeader in visited_false_labels:
                 reassem_code.append(self.emit_local_label(falseLeader))
             reassem_code.append(self.emit_code('', 'call abort@PLT'))
+            if self.cold_false_bbls:
+                reassem_code.append(self.emit_directive('.popsection'))
         return reassem_code
 
     def run(self, cfi_dict, reloc_sym_dict, rip_access_list, visit_log):
@@ -88,6 +140,18 @@ class LocalSymbolizer:
         if self.reassem_code:
             self.reassem_tbl = self.symbolize_jtables(rip_access_list)
             self.reassem_code[self.addr] = self.add_false_block_labels(self.reassem_code[self.addr])
+            if self.lean:
+                self.drop_empty_code()
+
+        # the superset CFG is not needed once the function is symbolized
+        self.bbls = None
+        self.jmp_info = None
+        self.jmp_tbls = None
+
+    def drop_empty_code(self):
+        # the comments left by the lean mode and the empty labels
+        for key, reassem_code in self.reassem_code.items():
+            self.reassem_code[key] = [code for code in reassem_code if code.label or code.code]
 
     def get_jtable_list(self):
 
@@ -106,6 +170,8 @@ class LocalSymbolizer:
             jmp_site = tbl['JmpSite']
             base_addr = int(tbl['BaseAddr'], 16)
             if base_addr in tbl_dict:
+                if self.lean:
+                    continue
                 label = tbl_dict[base_addr][0].label
                 code = tbl_dict[base_addr][0].code
                 comment = tbl_dict[base_addr][0].comment + ', %s'%(jmp_site)
@@ -119,7 +185,9 @@ class LocalSymbolizer:
 
                 base_label = self.get_jt_label(base_addr)
                 code = ''
-                comment = '# jmp site(s): %s'%(jmp_site)
+                comment = ''
+                if not self.lean:
+                    comment = '# jmp site(s): %s'%(jmp_site)
                 reassem_code.append(RelocExpr(base_addr, base_label, code, comment))
 
                 overlap = False
@@ -143,6 +211,9 @@ class LocalSymbolizer:
                     assert target_label
 
                     code = '.long %s - %s'%(target_label, base_label)
+                    if self.lean:
+                        reassem_code.append(self.emit_code(addr, code))
+                        continue
                     comment = '# %s'%(hex(addr))
 
                     if addr != base_addr and (overlap or addr in self.jmp_tbls):
@@ -158,7 +229,8 @@ class LocalSymbolizer:
 
     def symbolize_fun(self, cfi_dict, reloc_sym_dict, visit_log):
 
-        cfgSerializer = CFGSerializer(self.fun_addr, self.bbls, self.jmp_info, self.opt_level, self.syntax)
+        cfgSerializer = CFGSerializer(self.fun_addr, self.bbls, self.jmp_info, self.opt_level, self.syntax, self.profiler,
+                                      self.lean)
         regions, dropped_region = cfgSerializer.build_cfg(visit_log)
         if not regions:
             return []
@@ -187,9 +259,20 @@ class LocalSymbolizer:
             reassem_code[key].extend(symbolized_code)
 
         self.update_stat(cfgSerializer)
+        if self.keep_liveness:
+            self.live_before = self.get_mem_liveness(cfgSerializer)
 
         return reassem_code
 
+    def get_mem_liveness(self, serializer):
+        live_before, _ = serializer.get_liveness()
+        mem_liveness = dict()
+        for bbl in self.bbls.values():
+            for inst in bbl['Code']:
+                if '[' in inst['Disassem'] and inst['Addr'] in live_before:
+                    mem_liveness[inst['Addr']] = live_before[inst['Addr']]
+        return mem_liveness
+
     def update_stat(self, serializer):
         self.no_bbls = sum([len(item) for (_,item) in serializer.bbl_seq.items()])
         self.no_overlapped_bbls = serializer.overlapped_bbls
@@ -199,6 +282,10 @@ class LocalSymbolizer:
             if len(set([tbl.comment.split('TblAddr:')[1] for tbl in tbl_info])) > 1:
                 self.multi_br_sites += 1
 
+        for site, tbl_info in serializer.br_dict.items():
+            tables = set([tbl.args[1] for tbl in tbl_info])
+            self.br_depth_dict[site] = (len(tables), self.get_br_cmp_depth(tbl_info))
+
         #self.multi_br_sites = len([patterns for patterns in serializer.br_dict.values() if len(patterns) > 10])
 
     def get_local_label(self, addr):
@@ -263,15 +350,20 @@ class LocalSymbolizer:
                 return True
         return False
 
-    EHFUN_CNT = 0
-    EHBB_CNT = 0
-    EHTBL_CNT = 0
+    def get_eh_fun_id(self):
+        eh_fun_id = '%d_%d'%(self.fun_id, self.eh_tbl_cnt)
+        self.eh_tbl_cnt += 1
+        return eh_fun_id
 
-    def get_stack_height(self):
+    def get_spill_offset(self):
+        return self.spill_offset
+
+    def set_spill_offset(self, serializer, inst):
+        # spills go to fs: unless a stack slot is known to be free
         if self.opt_level >= 2:
-            return self.stack_height
+            self.spill_offset = serializer.get_spill_offset(inst)
         else:
-            return -1
+            self.spill_offset = -1
 
     def symbolize_disassem_code(self, serializer, fdeStart, fdeEnd, cfi_dict, reloc_sym_dict):
 
@@ -296,23 +388,8 @@ class LocalSymbolizer:
                     addr = int(inst['Addr'], 16)
                     if addr >= fdeStart:
                         addr_set.add(addr)
-                    res = None
                     if 'endbr64' in inst['Disassem']:
                         self.endbr_list.append(addr)
-                    if self.syntax == 'intel':
-                        if 'RSP-' in inst['Disassem']:
-                            res = re.findall('RSP-([0-9a-fx]*)', inst['Disassem'])
-
-                    else:
-                        if '%RSP' in inst['Disassem']:
-                            res = re.findall('-([0-9a-fx]*)\(%RSP\)', inst['Disassem'])
-                    if res:
-                        try:
-                            stack_height = int(res[0], 16)
-                            if stack_height >= 0 and stack_height <= 0x8000000:
-                                self.stack_height = stack_height
-                        except ValueError:
-                            pass
 
 
 
@@ -398,7 +475,7 @@ class LocalSymbolizer:
                     if serializer.need_direct_symbolize(inst):
                         reassem_code.append(self.emit_jt_symbolized_code(inst))
                     elif serializer.need_transformation(inst, label_location):
-                        reassem_code.extend(self.emit_transformed_code(inst))
+                        reassem_code.extend(self.emit_transformed_code(serializer, inst))
                     else:
                         reassem_code.append(self.emit_symbolized_asm(inst))
 
@@ -474,31 +551,43 @@ class LocalSymbolizer:
         for br_inst in serializer.get_br_insts(inst):
             regs.extend(br_inst.args[0])
 
-        for reg in REGISTERS:
-            if reg not in regs:
-                tmp_reg = reg
-                break
+        # a register that is dead at the memory access needs no spill
+        tmp_reg = ''
+        if self.opt_level >= 1:
+            tmp_reg = serializer.get_dead_register(inst, regs)
+        spill = not tmp_reg
+        self.set_spill_offset(serializer, inst)
+
+        if spill:
+            for reg in REGISTERS:
+                if reg not in regs:
+                    tmp_reg = reg
+                    break
 
-        reassem_code.extend(self.emit_push_code(inst['Addr'], tmp_reg))
+        reassem_code.extend(self.emit_push_code(inst['Addr'], tmp_reg, spill))
 
-        no_br = len(serializer.get_br_insts(inst))
-        is_last = False
-        for idx, br_inst in enumerate(serializer.get_br_insts(inst)):
-            if no_br == idx+1:
-                is_last = True
-            reassem_code.extend(self.emit_resymbolize_code(inst['Addr'], br_inst, tmp_reg, idx, is_last, debug))
+        dispatch = self.get_br_dispatch(serializer.get_br_insts(inst))
+        if dispatch:
+            reassem_code.extend(self.emit_br_dispatch_code(inst['Addr'], dispatch, tmp_reg, debug))
+        else:
+            no_br = len(serializer.get_br_insts(inst))
+            is_last = False
+            for idx, br_inst in enumerate(serializer.get_br_insts(inst)):
+                if no_br == idx+1:
+                    is_last = True
+                reassem_code.extend(self.emit_resymbolize_code(inst['Addr'], br_inst, tmp_reg, idx, is_last, debug))
 
-        if debug:
-            reassem_code.append(self.emit_abort_code(inst['Addr']))
+            if debug:
+                reassem_code.append(self.emit_abort_code(inst['Addr']))
 
         reassem_code.append(self.emit_instrument_label(inst['Addr']))
 
-        reassem_code.extend(self.emit_pop_code(inst['Addr'], tmp_reg))
+        reassem_code.extend(self.emit_pop_code(inst['Addr'], tmp_reg, spill))
 
         return reassem_code
 
 
-    def emit_transformed_code(self, inst):
+    def emit_transformed_code(self, serializer, inst):
         disassem = inst['Disassem']
         opcode = disassem.split()[0]
         args = disassem.split()[1:]
@@ -508,16 +597,21 @@ class LocalSymbolizer:
         target = pc + offset
         idx = 0
 
+        # the flags are saved only if the code after the instruction reads them
+        save_flags = self.opt_level == 0 or serializer.is_flags_live(inst, after=True)
+        self.set_spill_offset(serializer, inst)
+
         reassem_code = []
 
         reassem_code.append(self.emit_hyphen_comment())
         symbolized_reassem = self.symbolize_pc_addressing(disassem, inst['Addr'])
-        comment = '# transform instruction: %s'%(symbolized_reassem)
-        reassem_code.append(self.emit_comment(pc, '%-44s # %s'%(comment, hex(pc))))
+        if not self.lean:
+            comment = '# transform instruction: %s'%(symbolized_reassem)
+            reassem_code.append(self.emit_comment(pc, '%-44s # %s'%(comment, hex(pc))))
 
         if opcode.startswith('loop'):
             #reassem_code.append(self.emit_pushf())
-            reassem_code.extend(self.emit_new_pushf())
+            reassem_code.extend(self.emit_new_pushf(spill=save_flags, flags_live=save_flags))
             if self.syntax == 'intel':
                 reassem_code.append(self.emit_code(addr, 'dec RCX'))
             else:
@@ -532,18 +626,18 @@ class LocalSymbolizer:
                 reassem_code.append(self.emit_code(addr, 'jnz %s'%(end_of_instrument_label)))
 
             #reassem_code.append(self.emit_popf())
-            reassem_code.extend(self.emit_new_popf())
+            reassem_code.extend(self.emit_new_popf(spill=save_flags, flags_live=save_flags))
 
             symbolized_reassem = self.symbolize_pc_addressing('jmp %s'%(hex(offset)), inst['Addr'])
             reassem_code.append(self.emit_code(addr, symbolized_reassem))
 
             reassem_code.append(self.emit_instrument_label(inst['Addr'], idx))
             #reassem_code.append(self.emit_popf())
-            reassem_code.extend(self.emit_new_popf())
+            reassem_code.extend(self.emit_new_popf(spill=save_flags, flags_live=save_flags))
 
         elif opcode in ['jrcxz', 'jecxz', 'jcxz']:
             #reassem_code.append(self.emit_pushf())
-            reassem_code.extend(self.emit_new_pushf())
+            reassem_code.extend(self.emit_new_pushf(spill=save_flags, flags_live=save_flags))
 
             if opcode in ['jrcxz']:
                 if self.syntax == 'intel':
@@ -565,14 +659,14 @@ class LocalSymbolizer:
             reassem_code.append(self.emit_code(addr, 'jne %s'%(end_of_instrument_label)))
 
             #reassem_code.append(self.emit_popf())
-            reassem_code.extend(self.emit_new_popf())
+            reassem_code.extend(self.emit_new_popf(spill=save_flags, flags_live=save_flags))
 
             symbolized_reassem = self.symbolize_pc_addressing('jmp %s'%(hex(offset)), inst['Addr'])
             reassem_code.append(self.emit_code(addr, symbolized_reassem))
 
             reassem_code.append(self.emit_instrument_label(inst['Addr'], idx))
             #reassem_code.append(self.emit_popf())
-            reassem_code.extend(self.emit_new_popf())
+            reassem_code.extend(self.emit_new_popf(spill=save_flags, flags_live=save_flags))
         else:
             assert False
 
@@ -602,6 +696,8 @@ class LocalSymbolizer:
         return RelocExpr(addr, label, '','')
 
     def emit_code(self, addr, code, comment=''):
+        if self.lean:
+            return RelocExpr(addr, '', code, '')
         return RelocExpr(addr, '', code, comment)
 
     def emit_hyphen_comment(self):
@@ -614,13 +710,13 @@ class LocalSymbolizer:
         comment = '# push flags'
         return self.emit_code('', code, comment)
 
-    def emit_new_pushf(self, has_side_effect=True, reg=''):
+    def emit_new_pushf(self, has_side_effect=True, reg='', spill=True, flags_live=True):
         if not reg:
             reg = 'R11'
 
         inst_list = []
 
-        if self.get_stack_height() < 0:
+        if spill and self.get_spill_offset() < 0:
             if self.syntax == 'intel':
                 code = 'mov fs:0x58, %s'%(reg)
             else:
@@ -643,15 +739,15 @@ class LocalSymbolizer:
             comment = '# save a value in [RSP-8]'
             inst_list.append(self.emit_code('', code, comment))
             '''
-        else:
+        elif spill:
             if self.syntax == 'intel':
-                code = 'mov [RSP-%s], %s'%(self.get_stack_height() + 0x100, reg)
+                code = 'mov [RSP-%s], %s'%(self.get_spill_offset(), reg)
             else:
-                code = 'mov %%%s, -%s(%%RSP)'%(reg, self.get_stack_height() + 0x100)
-            comment = '# save a value to stack [RSP-%s]'%(self.get_stack_height ()+ 0x100)
+                code = 'mov %%%s, -%s(%%RSP)'%(reg, self.get_spill_offset())
+            comment = '# save a value to stack [RSP-%s]'%(self.get_spill_offset())
             inst_list.append(self.emit_code('', code, comment))
 
-        if self.opt_level == 0 or has_side_effect:
+        if (self.opt_level == 0 or has_side_effect) and flags_live:
             '''
             code = 'pushf'
             '''
@@ -686,13 +782,13 @@ class LocalSymbolizer:
 
         return inst_list
 
-    def emit_new_popf(self, has_side_effect=True, reg=''):
+    def emit_new_popf(self, has_side_effect=True, reg='', spill=True, flags_live=True):
         if not reg:
             reg = 'R11'
 
         inst_list = []
 
-        if self.opt_level == 0 or has_side_effect:
+        if (self.opt_level == 0 or has_side_effect) and flags_live:
             '''
             code = 'popf'
             '''
@@ -727,7 +823,7 @@ class LocalSymbolizer:
                     code = 'mov %fs:0x60, %RAX'
                 inst_list.append(self.emit_code('', code, comment))
 
-        if self.get_stack_height() < 0:
+        if spill and self.get_spill_offset() < 0:
             '''
             if self.syntax == 'intel':
                 code = 'mov %s, fs:0x50' % (reg)
@@ -749,12 +845,12 @@ class LocalSymbolizer:
                 code = 'mov %%fs:0x58, %%%s' % (reg)
             comment = '# restore a value in register %s' % (reg)
             inst_list.append(self.emit_code('', code, comment))
-        else:
+        elif spill:
             if self.syntax == 'intel':
-                code = 'mov %s, [RSP-%s]'%(reg, self.get_stack_height() + 0x100)
+                code = 'mov %s, [RSP-%s]'%(reg, self.get_spill_offset())
             else:
-                code = 'movq -%s(%%RSP), %%%s' % (self.get_stack_height() + 0x100, reg)
-            comment = '# load a value from stack [RSP-%s]'%(self.get_stack_height ()+ 0x100)
+                code = 'movq -%s(%%RSP), %%%s' % (self.get_spill_offset(), reg)
+            comment = '# load a value from stack [RSP-%s]'%(self.get_spill_offset())
             inst_list.append(self.emit_code('', code, comment))
 
         return inst_list
@@ -764,15 +860,15 @@ class LocalSymbolizer:
         comment = '# pop flags'
         return self.emit_code('', code, comment)
 
-    def emit_push_code(self, addr, reg):
+    def emit_push_code(self, addr, reg, spill=True):
         reassem_code = []
         reassem_code.append(self.emit_hyphen_comment())
-        reassem_code.extend(self.emit_new_pushf(has_side_effect=False, reg=reg))
+        reassem_code.extend(self.emit_new_pushf(has_side_effect=False, reg=reg, spill=spill))
         return reassem_code
 
-    def emit_pop_code(self, addr, reg):
+    def emit_pop_code(self, addr, reg, spill=True):
         reassem_code = []
-        reassem_code.extend(self.emit_new_popf(has_side_effect=False, reg=reg))
+        reassem_code.extend(self.emit_new_popf(has_side_effect=False, reg=reg, spill=spill))
         reassem_code.append(self.emit_hyphen_comment())
 
         return reassem_code
@@ -802,6 +898,121 @@ class LocalSymbolizer:
 
         return reassem_code
 
+    def get_br_dispatch(self, br_insts):
+        # the candidates of a site can be searched for only if they differ in
+        # the table alone; one Instrumentation per table, sorted by address
+        if self.opt_level < 1:
+            return None
+        if len(set([tuple(br_inst.args[0]) for br_inst in br_insts])) != 1:
+            return None
+        dispatch = {}
+        for br_inst in br_insts:
+            if br_inst.args[1] not in dispatch:
+                dispatch[br_inst.args[1]] = br_inst
+        # .Ldata_minus_ labels are all set to -1
+        if len(dispatch) < BR_DISPATCH_MIN or min(dispatch) < 0:
+            return None
+        return [dispatch[tbl_addr] for tbl_addr in sorted(dispatch)]
+
+    def get_br_cmp_depth(self, br_insts):
+        # compares run before the last candidate is matched
+        dispatch = self.get_br_dispatch(br_insts)
+        if dispatch:
+            return len(dispatch).bit_length()
+        if self.opt_level >= 3:
+            return len(br_insts)
+        return len(br_insts) * 2
+
+    def emit_br_dispatch_code(self, addr, dispatch, tmp_reg, debug=False):
+        reassem_code = []
+        empty_code = ''
+        inst_addr = int(addr, 16)
+
+        escape_label = self.get_instrument_label(inst_addr)
+        miss_label = escape_label
+        if debug:
+            miss_label = self.get_instrument_label(inst_addr, len(dispatch))
+
+        comment = '# [*] Binary search over %d candidate tables'%(len(dispatch))
+        reassem_code.append(self.emit_code(addr, empty_code, comment))
+        for inst in self.get_br_search_code(dispatch, tmp_reg, 0, len(dispatch), miss_label):
+            reassem_code.append(self.emit_code(addr, inst))
+
+        if debug:
+            # none of the original tables: the register may already hold a
+            # new one
+            reassem_code.append(self.emit_code(addr, '%s:'%(miss_label)))
+            for idx, br_inst in enumerate(dispatch):
+                for inst in self.get_duumy_br_symbolize_code(br_inst, tmp_reg, idx):
+                    reassem_code.append(self.emit_code(addr, inst))
+            reassem_code.append(self.emit_abort_code(addr))
+
+        for idx, br_inst in enumerate(dispatch):
+            reassem_code.append(self.emit_code(addr, empty_code, br_inst.comment))
+            is_last = idx + 1 == len(dispatch)
+            for inst in self.get_br_hit_code(br_inst, idx, is_last):
+                reassem_code.append(self.emit_code(addr, inst))
+
+        return reassem_code
+
+    def get_br_search_code(self, dispatch, tmp_reg, lo, hi, miss_label):
+        # compare with the middle table, go to the lower half on below and
+        # fall through to the upper half
+        if lo >= hi:
+            return ['jmp %s'%(miss_label)]
+
+        mid = (lo + hi) // 2
+        br_inst = dispatch[mid]
+        reg1 = br_inst.args[0][0]
+        old_label = self.get_data_label(br_inst.args[1])
+        hit_label = self.get_instrument_label(br_inst.addr, mid)
+
+        ins_list = []
+        if self.syntax == 'intel':
+            ins_list.append('lea %s, [RIP+%s]'%(tmp_reg, old_label))
+            ins_list.append('cmp %s, %s'%(reg1, tmp_reg))
+        else:
+            ins_list.append('leaq %s(%%RIP), %%%s'%(old_label, tmp_reg))
+            ins_list.append('cmp %%%s, %%%s'%(tmp_reg, reg1))
+        ins_list.append('je %s'%(hit_label))
+
+        if lo == mid:
+            ins_list.extend(self.get_br_search_code(dispatch, tmp_reg, mid + 1, hi, miss_label))
+            return ins_list
+
+        lower_label = self.get_instrument_label(br_inst.addr, mid) + '_lower'
+        ins_list.append('jb %s'%(lower_label))
+        ins_list.extend(self.get_br_search_code(dispatch, tmp_reg, mid + 1, hi, miss_label))
+        ins_list.append('%s:'%(lower_label))
+        ins_list.extend(self.get_br_search_code(dispatch, tmp_reg, lo, mid, miss_label))
+        return ins_list
+
+    def get_br_hit_code(self, instr, idx, is_last):
+        ins_list = []
+        reg1 = instr.args[0][0]
+        new_label = self.get_jt_label(instr.args[1])
+
+        escape_label = self.get_instrument_label(instr.addr)
+        hit_label = self.get_instrument_label(instr.addr, idx)
+
+        ins_list.append('%s:'%(hit_label))
+        if self.syntax == 'intel':
+            ins_list.append('lea %s, [RIP+%s]'%(reg1, new_label))
+        else:
+            ins_list.append('leaq %s(%%RIP), %%%s'%(new_label, reg1))
+
+        if len(instr.args[0]) == 2:
+            ins_list.append('%s:' % (hit_label+'_1'))
+            if self.syntax == 'intel':
+                ins_list.append('mov %s, %s'%(instr.args[0][1], reg1 ))
+            else:
+                ins_list.append('mov %%%s, %%%s'%(reg1, instr.args[0][1]))
+
+        if not is_last:
+            ins_list.append('jmp %s'%(escape_label))
+
+        return ins_list
+
     def emit_jt_symbolized_code(self, inst):
 
         disasm = inst['Disassem']
@@ -842,7 +1053,9 @@ class LocalSymbolizer:
 
         reassem = ','.join(words)
 
-        if target_addr in self.tbl_list:
+        if self.lean:
+            comment = ''
+        elif target_addr in self.tbl_list:
             comment = '# %s contains table address'%(inst['Addr'])
         else:
             comment = '# %s contains table candidate but the function has no such table' % (inst['Addr'])
@@ -864,6 +1077,8 @@ class LocalSymbolizer:
 
 
     def emit_comment(self, addr, comment):
+        if self.lean:
+            return EMPTY_CODE
         empty_code = ''
         return self.emit_code(addr, empty_code, comment)
 
@@ -995,6 +1210,8 @@ class LocalSymbolizer:
 
         if is_unsupported_instruction(reassem, self.syntax):
             # print('[-] Unsupported instruction %s'%(reassem))
+            if self.lean:
+                return EMPTY_CODE
             reassem = '# ' + reassem
             comment = 'Unsupported instruction'
         else:
@@ -1016,6 +1233,8 @@ class LocalSymbolizer:
                     if opcode.startswith('loop') or opcode in ['jcxe', 'jecxz', 'jrcxz'] or reassem.startswith('repz ret'): # which has 1 byte offset
                         dest = reassem.split()[-1]
                         if 'falseBBL' in dest:
+                            if self.lean:
+                                return EMPTY_CODE
                             reassem = '# ' + reassem
                             comment = 'invalid loop instruction since it points to false block'
 
@@ -1025,7 +1244,10 @@ class LocalSymbolizer:
                     elif '[' not in reassem :
                         comment = ', fun %s miss the target of PC-relative addressing '%(self.fun_addr)
 
-        comment = '# %s %s'%(inst['Addr'], comment)
+        if self.lean:
+            comment = ''
+        else:
+            comment = '# %s %s'%(inst['Addr'], comment)
         if self.syntax != 'intel':
             reassem = reassem.replace(' +', ' ')
             reassem = reassem.replace(':+', ':')
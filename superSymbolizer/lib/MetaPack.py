@@ -0,0 +1,170 @@
+'''
+Compact (MessagePack) metadata written by superCFGBuilder when the output
+file name ends with '.msgpack'. The layout is described in
+superCFGBuilder/superCFGBuilder/MetaPack.fs. The decoder rebuilds the same
+dictionaries as the JSON metadata, so the symbolizer does not care which
+format it was given. Since that includes the hex strings of the addresses,
+the format saves space (about 4x) rather than parsing time.
+'''
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+MAGIC = 'SURI-META'
+VERSION = 1
+HEADER_PREFIX = b'\x93\xa9' + MAGIC.encode()
+
+
+def is_packed_meta(meta_file):
+    with open(meta_file, 'rb') as fd:
+        return fd.read(len(HEADER_PREFIX)) == HEADER_PREFIX
+
+def check_msgpack():
+    if msgpack is None:
+        raise ImportError('msgpack is required to read or write .msgpack metadata (pip install msgpack)')
+
+
+def unpack_site_info(site):
+    addr, regs, op_type = site
+    return {'Addr':addr, 'Regs':regs, 'OpType':op_type}
+
+def unpack_branch_info(info):
+    jmp_site, add_site, mem_acc_site, tbl_ref_sites, tbl_addr = info
+    return {'JmpSite':unpack_site_info(jmp_site),
+            'AddSite':unpack_site_info(add_site),
+            'MemAccSite':unpack_site_info(mem_acc_site),
+            'TblRefSite':[{'SiteInfo':unpack_site_info(site), 'IsDeterminate':is_determinate}
+                          for site, is_determinate in tbl_ref_sites],
+            'TblAddr':tbl_addr}
+
+def unpack_bbl(bbl):
+    addr, size, code, edges = bbl
+    return {'Addr':hex(addr), 'Size':size,
+            'Code':[{'Addr':hex(inst_addr), 'Length':length, 'ByteString':byte_string.hex().upper(),
+                     'Disassem':disassem, 'RIPAddressing':rip_addressing, 'IsBranch':is_branch}
+                    for inst_addr, length, byte_string, disassem, rip_addressing, is_branch in code],
+            'Edges':[{'From':hex(src), 'To':hex(dst), 'EdgeType':edge_type}
+                     for src, dst, edge_type in edges]}
+
+def unpack_fun_info(fun):
+    addr, inst_addrs, jmp_tables, jmp_info, fde_ranges, bbls, absorbing_fun, false_bbls = fun
+    fun_info = dict()
+    fun_info['Addr'] = hex(addr)
+    fun_info['InstAddrs'] = [hex(inst_addr) for inst_addr in inst_addrs]
+    fun_info['JmpTables'] = [{'JmpSite':hex(jmp_site), 'BaseAddr':hex(base_addr), 'Size':size,
+                              'Entries':[hex(entry) for entry in entries]}
+                             for jmp_site, base_addr, size, entries in jmp_tables]
+    fun_info['JmpInfo'] = {hex(jmp_site):[unpack_branch_info(info) for info in infos]
+                           for jmp_site, infos in jmp_info}
+    fun_info['FDERanges'] = [{'Start':hex(start), 'End':hex(end)} for start, end in fde_ranges]
+    fun_info['BBLs'] = {hex(bbl[0]):unpack_bbl(bbl) for bbl in bbls}
+    fun_info['AbsorbingFun'] = [hex(fun_addr) for fun_addr in absorbing_fun]
+    fun_info['FalseBBLs'] = [hex(bbl_addr) for bbl_addr in false_bbls]
+    return fun_info
+
+def unpack_asan_info(fun):
+    addr, inst_list = fun
+    return {'Addr':hex(addr),
+            'InstList':[{'Addr':hex(inst_addr), 'MemAccType':acc_type, 'MemAccSize':acc_size}
+                        for inst_addr, acc_type, acc_size in inst_list]}
+
+
+class PackedMetaReader:
+    '''
+    Counterpart of MetaReader for the packed format. The top-level members
+    precede the functions, so self.meta is filled before the first FunDict
+    entry is yielded.
+    '''
+    def __init__(self, meta_file):
+        check_msgpack()
+        self.meta_file = meta_file
+        self.meta = dict()
+
+    def read_header(self, unpacker, kind):
+        magic, version, meta_kind = unpacker.unpack()
+        assert magic == MAGIC and version == VERSION, \
+            '%s: unsupported metadata version %s'%(self.meta_file, version)
+        assert meta_kind == kind, '%s is not %s metadata'%(self.meta_file, kind)
+
+    def open(self, fd):
+        # max_buffer_size only bounds a single function, not the whole file
+        return msgpack.Unpacker(fd, raw=False, max_buffer_size=0x7fffffff)
+
+    def iter_fun_dict(self):
+        with open(self.meta_file, 'rb') as fd:
+            unpacker = self.open(fd)
+            self.read_header(unpacker, 'cfg')
+            self.meta['PLTDict'] = {hex(addr):name for addr, name in unpacker.unpack()}
+            self.meta['FalseFunList'] = [hex(addr) for addr in unpacker.unpack()]
+            self.meta['SuspiciousFunList'] = [hex(addr) for addr in unpacker.unpack()]
+            for _ in range(unpacker.unpack()):
+                fun_info = unpack_fun_info(unpacker.unpack())
+                yield fun_info['Addr'], fun_info
+
+    def load(self):
+        fun_dict = dict(self.iter_fun_dict())
+        data = {'FunDict':fun_dict}
+        data.update(self.meta)
+        return data
+
+    def load_asan(self):
+        with open(self.meta_file, 'rb') as fd:
+            unpacker = self.open(fd)
+            self.read_header(unpacker, 'asan')
+            return [unpack_asan_info(unpacker.unpack()) for _ in range(unpacker.unpack())]
+
+
+def pack_fun_info(fun_info):
+    return [int(fun_info['Addr'], 16),
+            [int(addr, 16) for addr in fun_info['InstAddrs']],
+            [[int(tbl['JmpSite'], 16), int(tbl['BaseAddr'], 16), tbl['Size'],
+              [int(entry, 16) for entry in tbl['Entries']]]
+             for tbl in fun_info['JmpTables']],
+            [[int(jmp_site, 16), [pack_branch_info(info) for info in infos]]
+             for jmp_site, infos in fun_info['JmpInfo'].items()],
+            [[int(item['Start'], 16), int(item['End'], 16)] for item in fun_info['FDERanges']],
+            [pack_bbl(bbl) for bbl in fun_info['BBLs'].values()],
+            [int(addr, 16) for addr in fun_info['AbsorbingFun']],
+            [int(addr, 16) for addr in fun_info['FalseBBLs']]]
+
+def pack_site_info(site):
+    return [site['Addr'], site.get('Regs', []), site.get('OpType', '')]
+
+def pack_branch_info(info):
+    return [pack_site_info(info['JmpSite']), pack_site_info(info['AddSite']),
+            pack_site_info(info['MemAccSite']),
+            [[pack_site_info(item['SiteInfo']), item['IsDeterminate']] for item in info['TblRefSite']],
+            info['TblAddr']]
+
+def pack_bbl(bbl):
+    return [int(bbl['Addr'], 16), bbl['Size'],
+            [[int(inst['Addr'], 16), inst['Length'], bytes.fromhex(inst['ByteString']),
+              inst['Disassem'], inst['RIPAddressing'], inst['IsBranch']]
+             for inst in bbl['Code']],
+            [[int(edge['From'], 16), int(edge['To'], 16), edge['EdgeType']] for edge in bbl['Edges']]]
+
+def pack_meta(data, meta_file):
+    '''
+    Write JSON metadata (the dictionary, or list for ASan metadata, loaded
+    from a superCFGBuilder JSON file) in the packed format.
+    '''
+    check_msgpack()
+    packer = msgpack.Packer(use_bin_type=True)
+    with open(meta_file, 'wb') as fd:
+        if isinstance(data, list):
+            fd.write(packer.pack([MAGIC, VERSION, 'asan']))
+            fd.write(packer.pack(len(data)))
+            for fun in data:
+                fd.write(packer.pack([int(fun['Addr'], 16),
+                                      [[int(inst['Addr'], 16), inst['MemAccType'], inst['MemAccSize']]
+                                       for inst in fun['InstList']]]))
+            return
+
+        fd.write(packer.pack([MAGIC, VERSION, 'cfg']))
+        fd.write(packer.pack([[int(addr, 16), name] for addr, name in data['PLTDict'].items()]))
+        fd.write(packer.pack([int(addr, 16) for addr in data['FalseFunList']]))
+        fd.write(packer.pack([int(addr, 16) for addr in data['SuspiciousFunList']]))
+        fd.write(packer.pack(len(data['FunDict'])))
+        for fun_info in data['FunDict'].values():
+            fd.write(packer.pack(pack_fun_info(fun_info)))
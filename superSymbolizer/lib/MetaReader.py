@@ -0,0 +1,144 @@
+import contextlib
+import gc
+import json
+from superSymbolizer.lib.MetaPack import PackedMetaReader, is_packed_meta
+
+CHUNK_SIZE = 1 << 20
+
+
+class MetaReader:
+    '''
+    Incremental reader for the superset CFG metadata of superCFGBuilder.
+
+    The metadata is a JSON object whose 'FunDict' member maps a function
+    address to its superset CFG. iter_fun_dict() decodes one FunDict entry at
+    a time, so only the entry being processed has to stay in memory. The
+    remaining top-level members (PLTDict, FalseFunList, ...) are stored in
+    self.meta once the whole file has been read.
+    '''
+    def __init__(self, meta_file):
+        self.meta_file = meta_file
+        self.meta = dict()
+        self.decoder = json.JSONDecoder()
+
+        self.fd = None
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def iter_fun_dict(self):
+        with open(self.meta_file) as fd:
+            self.fd = fd
+            self.buf = ''
+            self.pos = 0
+            self.eof = False
+
+            self.expect('{')
+            while not self.accept('}'):
+                key = self.decode()
+                self.expect(':')
+                if key == 'FunDict':
+                    self.expect('{')
+                    while not self.accept('}'):
+                        fun_addr = self.decode()
+                        self.expect(':')
+                        yield fun_addr, self.decode()
+                        self.accept(',')
+                else:
+                    self.meta[key] = self.decode()
+                self.accept(',')
+        self.fd = None
+        self.buf = ''
+
+    def fill(self, size=CHUNK_SIZE):
+        data = self.fd.read(size)
+        if not data:
+            self.eof = True
+            return False
+        # drop what we have already consumed before growing the buffer
+        self.buf = self.buf[self.pos:] + data
+        self.pos = 0
+        return True
+
+    def peek(self):
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in ' \t\r\n':
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                raise ValueError('%s: unexpected end of metadata'%(self.meta_file))
+
+    def accept(self, ch):
+        if self.peek() == ch:
+            self.pos += 1
+            return True
+        return False
+
+    def expect(self, ch):
+        if not self.accept(ch):
+            raise ValueError('%s: expected %s at offset %d'%(self.meta_file, ch, self.pos))
+
+    def decode(self):
+        self.peek()
+        while True:
+            try:
+                # every value we decode here is a string, an object or an
+                # array, so a truncated buffer never yields a partial value
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+                self.pos = end
+                return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+                # grow geometrically so that a huge entry is not re-parsed
+                # once per chunk
+                self.fill(max(CHUNK_SIZE, len(self.buf) - self.pos))
+
+
+def summarize_fun_info(fun_addr, fun_info):
+    '''
+    Keep the parts of a FunDict entry that are still needed once the
+    LocalSymbolizer of the function has run: the information printed in the
+    function header, and the entry block used to detect endbr64 and PLT
+    stubs.
+    '''
+    summary = dict()
+    summary['Addr'] = fun_info['Addr']
+    summary['InstAddrs'] = fun_info['InstAddrs']
+    summary['FDERanges'] = fun_info['FDERanges']
+    summary['AbsorbingFun'] = fun_info['AbsorbingFun']
+    summary['BBLs'] = {fun_addr: fun_info['BBLs'][fun_addr]}
+    return summary
+
+
+def open_meta_reader(meta_file):
+    if is_packed_meta(meta_file):
+        return PackedMetaReader(meta_file)
+    return MetaReader(meta_file)
+
+@contextlib.contextmanager
+def gc_paused():
+    # the metadata is a large acyclic tree, so running the cyclic collector
+    # while it is being built only costs time
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+def load_meta(meta_file):
+    with gc_paused():
+        if is_packed_meta(meta_file):
+            return PackedMetaReader(meta_file).load()
+        with open(meta_file) as f:
+            return json.load(f)
+
+def load_asan_meta(meta_file):
+    with gc_paused():
+        if is_packed_meta(meta_file):
+            return PackedMetaReader(meta_file).load_asan()
+        with open(meta_file) as f:
+            return json.load(f)
@@ -1,88 +1,87 @@
 from collections import namedtuple
 import re
-from elftools.elf.elffile import ELFFile
-from elftools.elf.sections import SymbolTableSection
-from elftools.elf.relocation import RelocationSection
-from elftools.elf.enums import ENUM_RELOC_TYPE_x64
 from enum import Enum
 import os
 
+from superSymbolizer.ElfBricks import open_elf
+from superSymbolizer.lib.ElfDef import Elf64_Rela, Elf64_Sym, SectionType, RelocationType, Unpack, get_cstr
+
 
 class EParser:
-    def __init__(self, filename):
+    '''
+    The entry point, the .plt ranges and the R_X86_64_JUMP_SLOT relocations
+    of a binary, read from the sections of its ElfModel. Symbol names are
+    decoded as latin-1, as pyelftools does, so that any name can be read.
+    '''
+    def __init__(self, elf):
         self.entry = None
         self.plt_dict = {}
         self.reloc_dict = {}
         self.fun_dict = {}
-        with open(filename, 'rb') as f:
-
-            elffile = ELFFile(f)
-            self.entry = elffile.header['e_entry']
-
-            # get R_X86_64_JUMP_SLOT info
-            self.plt_ranges = []
-            for sec in elffile.iter_sections():
-                if isinstance(sec, RelocationSection):
-                    symtab = elffile.get_section(sec['sh_link'])
-                    self.examine_reloc(elffile, sec, symtab)
-                if sec.name in ['.plt']:
-                    self.plt_ranges.append(range(sec.header['sh_offset'], sec.header['sh_offset'] + sec.header['sh_size']))
-
-            for sec in elffile.iter_sections():
-                if isinstance(sec, SymbolTableSection):
-                    self.examine_sym_tab(sec)
 
-    def examine_reloc(self, elffile, section, symtab):
-
-        for rel in section.iter_relocations():
-            if rel['r_info_sym'] == 0:
+        elf = open_elf(elf)
+        sections = elf.sections
+        self.entry = elf.header.e_entry
+
+        # get R_X86_64_JUMP_SLOT info
+        self.plt_ranges = []
+        for sec in sections:
+            if sec.header.sh_type == int(SectionType.SHT_RELA):
+                symtab = sections[sec.header.sh_link]
+                self.examine_reloc(sections, sec, symtab)
+            if sec.name in ['.plt']:
+                self.plt_ranges.append(range(sec.header.sh_offset, sec.header.sh_offset + sec.header.sh_size))
+
+        for sec in sections:
+            if sec.header.sh_type in [int(SectionType.SHT_SYMTAB), int(SectionType.SHT_DYNSYM)]:
+                self.examine_sym_tab(sections, sec)
+
+    def get_strtab(self, sections, symtab):
+        return bytes(sections[symtab.header.sh_link].body)
+
+    def get_symbol_name(self, sections, strtab, symbol):
+        if symbol.st_name == 0:
+            return sections[symbol.st_shndx].name
+        return get_cstr(strtab, symbol.st_name, 'latin-1')
+
+    def examine_reloc(self, sections, section, symtab):
+
+        strtab = self.get_strtab(sections, symtab)
+        entry_size = section.header.sh_entsize or 0x18
+        for idx in range(section.header.sh_size // entry_size):
+            rel = Unpack(Elf64_Rela, section.body, idx * entry_size)
+            if rel.r_info >> 32 == 0:
                 continue
 
-            symbol = symtab.get_symbol(rel['r_info_sym'])
-
-            if symbol['st_name'] == 0:
-                symsec = elffile.get_section(symbol['st_shndx'])
-                symbol_name = symsec.name
-            else:
-                symbol_name = symbol.name
+            # Code generator should handle the other relocations
+            if rel.r_info & 0xffffffff == RelocationType.R_X86_64_JUMP_SLOT:
+                symbol = Unpack(Elf64_Sym, symtab.body, (rel.r_info >> 32) * 0x18)
+                symbol_name = self.get_symbol_name(sections, strtab, symbol)
 
-            if rel['r_info_type'] == ENUM_RELOC_TYPE_x64['R_X86_64_JUMP_SLOT']:
                 # register plt dictionary
                 if 'R_X86_64_JUMP_SLOT' not in self.reloc_dict:
                     self.reloc_dict['R_X86_64_JUMP_SLOT'] = dict()
-                offset = rel['r_offset']
-                append = rel['r_addend']
+                offset = rel.r_offset
+                append = rel.r_addend
                 assert append == 0, 'Wierd!!!'
                 self.reloc_dict['R_X86_64_JUMP_SLOT'][offset] = (symbol_name)
-            '''
-            # Code generator should handle following relocation
-            elif rel['r_info_type'] == ENUM_RELOC_TYPE_x64['R_X86_64_64']:
-
-                assert False, 'TODO'
-            elif rel['r_info_type'] == ENUM_RELOC_TYPE_x64['R_X86_64_COPY']:
-                continue
-            elif rel['r_info_type'] == ENUM_RELOC_TYPE_x64['R_X86_64_GLOB_DAT']:
-                assert False, 'TODO'
-            elif rel['r_info_type'] == ENUM_RELOC_TYPE_x64['R_X86_64_RELATIVE']:
-                assert False, 'TODO'
-            else:
-                assert False, 'TODO'
-            '''
 
-    def examine_sym_tab(self, section):
+    def examine_sym_tab(self, sections, section):
         if section.name not in ['.dynsym']:
             return
 
-        if section['sh_entsize'] == 0:
+        if section.header.sh_entsize == 0:
             return
 
-        for symbol in section.iter_symbols():
-            if symbol['st_other']['visibility'] == "STV_HIDDEN":
+        strtab = self.get_strtab(sections, section)
+        for idx in range(section.header.sh_size // section.header.sh_entsize):
+            symbol = Unpack(Elf64_Sym, section.body, idx * section.header.sh_entsize)
+            if symbol.st_other & 0x3 == 2: # STV_HIDDEN
                 continue
 
-            if (symbol['st_info']['type'] == 'STT_FUNC'
-                    and symbol['st_shndx'] != 'SHN_UNDEF'):
-                self.fun_dict[hex(symbol['st_value'])] = symbol.name
+            if (symbol.st_info & 0xf == 2 # STT_FUNC
+                    and symbol.st_shndx != 0): # SHN_UNDEF
+                self.fun_dict[hex(symbol.st_value)] = self.get_symbol_name(sections, strtab, symbol)
 
 
     def report(self):
@@ -0,0 +1,79 @@
+import json
+import time
+from functools import wraps
+
+
+class Profiler:
+    '''
+    Cumulative time and call count per phase. Phases are inclusive, e.g.
+    symbolize_rip_addressing is also counted in emit_symbolized_asm.
+
+    Methods are profiled by wrapping them on the instance, so an object
+    that is not profiled runs the plain class methods.
+    '''
+    def __init__(self):
+        self.phases = dict()
+
+    def add(self, phase, elapsed, calls=1):
+        if phase not in self.phases:
+            self.phases[phase] = [0.0, 0]
+        self.phases[phase][0] += elapsed
+        self.phases[phase][1] += calls
+
+    def wrap(self, phase, fn):
+        @wraps(fn)
+        def profiled(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.add(phase, time.perf_counter() - start)
+        return profiled
+
+    def instrument(self, obj, methods):
+        for name in methods:
+            setattr(obj, name, self.wrap(name, getattr(obj, name)))
+
+    def merge(self, other):
+        for phase, (elapsed, calls) in other.phases.items():
+            self.add(phase, elapsed, calls)
+
+    def get_time(self, phase):
+        return self.phases.get(phase, [0.0, 0])[0]
+
+    def to_dict(self):
+        return {phase:{'time':elapsed, 'calls':calls} for phase, (elapsed, calls) in sorted(self.phases.items())}
+
+    def __getstate__(self):
+        return {'phases':self.phases}
+
+
+def uninstrument(state, methods):
+    # drop the instance wrappers from a pickled state; they are closures
+    for name in methods:
+        state.pop(name, None)
+    return state
+
+
+class SymbolizerProfile:
+    '''
+    Collects the profiles of the functions of a binary and writes them, in
+    aggregate and per function, as JSON.
+    '''
+    def __init__(self, top=20):
+        self.top = top
+        self.total = Profiler()
+        self.functions = dict()
+
+    def add_function(self, fun_addr, profiler):
+        self.total.merge(profiler)
+        self.functions[fun_addr] = profiler
+
+    def write(self, filename):
+        slowest = sorted(self.functions.items(), key=lambda item: item[1].get_time('run'), reverse=True)
+        report = {'aggregate':self.total.to_dict(),
+                  'slowest':[{'Addr':fun_addr, 'time':profiler.get_time('run')}
+                             for fun_addr, profiler in slowest[:self.top]],
+                  'functions':{fun_addr:profiler.to_dict() for fun_addr, profiler in self.functions.items()}}
+        with open(filename, 'w') as fd:
+            json.dump(report, fd, indent=2)
@@ -1,9 +1,18 @@
+import json
+import multiprocessing
 import os
-from superSymbolizer import SuperSymbolizer, CustomCompiler, SuperAsan
+import shutil
+import subprocess
+import sys
+import time
+from superSymbolizer import SuperSymbolizer, CustomCompiler, SuperAsan, MetaCache, CFGBuilder, StageRunner
+from superSymbolizer.lib.AsmWriter import shard_paths
+
+DOCKER_IMAGE = 'suri:v1.0'
 
 
 class SURI:
-    def __init__(self, target, new_out_dir, asan, use_docker, verbose, metafile):
+    def __init__(self, target, new_out_dir, asan, use_docker, verbose, metafile, jobs=1, stream_meta=False, packed_meta=False, cache=None, builder_socket=CFGBuilder.DEFAULT_SOCKET, profile=0, lean=False, pipe_asm=False, keep_asm=False, shards=1, stream_emit=False, layout=None):
         self.target = target
         self.input_dir = os.path.dirname(target)
         if new_out_dir:
@@ -14,144 +23,271 @@ class SURI:
         self.filename = os.path.basename(target)
         self.use_docker = use_docker
         self.verbose = verbose
+        self.jobs = jobs
+        self.stream_meta = stream_meta
+        # symbolize each function while printing it instead of all of them first
+        self.stream_emit = stream_emit
+        self.profile = profile
+        self.lean = lean
+        # with pipe_asm, gcc reads the assembly from a pipe, and the
+        # assembly file is only written with keep_asm
+        self.pipe_asm = pipe_asm
+        self.keep_asm = keep_asm
+        # the assembly is split into this many files, assembled in parallel
+        self.shards = shards
+        # execution profile of the target that decides the function layout
+        self.layout = layout
+        self.cache = cache
+        self.runner = StageRunner.StageRunner(verbose)
+        self.builder = CFGBuilder.CFGBuilder(self.suri_dir, builder_socket, self.runner)
+
+        # superCFGBuilder writes the packed format for a .msgpack file
+        if packed_meta:
+            meta_ext = 'msgpack'
+        else:
+            meta_ext = 'json'
+        self.meta_ext = meta_ext
 
         if metafile:
-            self.json = '%s.json'%(metafile)
+            self.json = '%s.%s'%(metafile, meta_ext)
         else:
-            self.json = '%s.json'%(self.filename)
+            self.json = '%s.%s'%(self.filename, meta_ext)
 
         if asan:
-            self.asan = '%s_asan.json'%(self.filename)
+            self.asan = '%s_asan.%s'%(self.filename, meta_ext)
         else:
             self.asan = ''
         self.asm = '%s.s'%(self.filename)
+        if shards > 1:
+            self.asm_files = shard_paths(self.asm, shards)
+        else:
+            self.asm_files = [self.asm]
         self.tmp = 'tmp_%s'%(self.filename)
+        if self.layout and use_docker:
+            # only the input and output folders are visible in the container
+            self.layout_file = '%s.layout'%(self.filename)
+            shutil.copyfile(self.layout, '%s/%s'%(self.output_dir, self.layout_file))
         self.myfile = 'my_%s'%(self.filename)
 
-    def run_docker(self, cmd):
+    def run_docker(self, stage, cmd):
         if self.verbose:
             print(cmd)
-            docker_cmd = 'docker run --rm -v %s:/input -v %s:/output suri:v1.0 sh -c " %s; "'%(self.input_dir, self.output_dir, cmd )
+            stderr = None
         else:
-            docker_cmd = 'docker run --rm -v %s:/input -v %s:/output suri:v1.0 sh -c " %s 2> /dev/null "'%(self.input_dir, self.output_dir, cmd )
-        os.system(docker_cmd)
+            stderr = subprocess.DEVNULL
+        docker_cmd = ['docker', 'run', '--rm', '-v', '%s:/input'%(self.input_dir), '-v', '%s:/output'%(self.output_dir),
+                      DOCKER_IMAGE, 'sh', '-c', cmd]
+        return self.runner.run(stage, docker_cmd, stderr=stderr)
+
+    def fetch_cached_meta(self, mode, meta_path):
+        if not self.cache:
+            return False
+        key = self.cache.get_key(self.target, '%s:intel:%s'%(mode, self.meta_ext))
+        if key is not None and self.cache.fetch(key, meta_path):
+            if self.verbose:
+                print('[+] Reuse cached metadata: %s'%(key))
+            return True
+        # do not mistake a stale output for the result of this build
+        if os.path.exists(meta_path):
+            os.remove(meta_path)
+        return False
+
+    def store_cached_meta(self, mode, meta_path):
+        if not self.cache or not os.path.exists(meta_path):
+            return
+        key = self.cache.get_key(self.target, '%s:intel:%s'%(mode, self.meta_ext))
+        if key is not None:
+            self.cache.store(key, meta_path)
 
     def cfg_suri(self):
+        # with --asan, superCFGBuilder emits the superset CFG and the ASan
+        # metadata in a single run
+        json_path = '%s/%s'%(self.output_dir, self.json)
+        asan_path = '%s/%s'%(self.output_dir, self.asan)
+        if self.fetch_cached_meta('cfg', json_path):
+            if not self.asan or self.fetch_cached_meta('asan', asan_path):
+                return
+
         if self.use_docker:
             file_path = '/input/%s'%(self.filename)
             json_path = '/output/%s'%(self.json)
-            cmd = 'dotnet run -c Release --project=/project/SURI/superCFGBuilder/superCFGBuilder %s %s'%(file_path, json_path)
-            self.run_docker(cmd)
+            args = '%s %s'%(file_path, json_path)
+            if self.asan:
+                args += ' with-asan /output/%s'%(self.asan)
+            # the image ships a Release build; skip the MSBuild check of dotnet run
+            dll = '/project/SURI/superCFGBuilder/superCFGBuilder/bin/Release/net9.0/superCFGBuilder.dll'
+            cmd = 'if [ -f %s ]; then dotnet %s %s; else dotnet run -c Release --project=/project/SURI/superCFGBuilder/superCFGBuilder %s; fi'%(dll, dll, args, args)
+            success = self.run_docker('cfg', cmd) == 0
         else:
             file_path = '%s/%s'%(self.input_dir, self.filename)
             json_path = '%s/%s'%(self.output_dir, self.json)
-            cmd = 'dotnet run -c Release --project=%s/superCFGBuilder/superCFGBuilder %s %s'%(self.suri_dir, file_path, json_path)
-            os.system(cmd)
+            args = [file_path, json_path]
+            if self.asan:
+                args += ['with-asan', '%s/%s'%(self.output_dir, self.asan)]
+            success = self.builder.run(args)
 
-    def asan_suri(self):
-        if self.use_docker:
-            file_path = '/input/%s'%(self.filename)
+        meta_paths = {'cfg':'%s/%s'%(self.output_dir, self.json)}
+        if self.asan:
+            meta_paths['asan'] = '%s/%s'%(self.output_dir, self.asan)
+        for mode, meta_path in meta_paths.items():
+            if success:
+                self.store_cached_meta(mode, meta_path)
+            elif os.path.exists(meta_path):
+                # e.g. a truncated file; never cache or symbolize it
+                os.remove(meta_path)
+
+    def get_symbolize_cmd(self, asm_path, bStack):
+        # the symbolizer command line in the Docker image
+        file_path = '/input/%s'%(self.filename)
+        json_path = '/output/%s'%(self.json)
+        if self.asan:
             asan_path = '/output/%s'%(self.asan)
-            cmd = 'dotnet run -c Release --project=/project/SURI/superCFGBuilder/superCFGBuilder %s %s asan'%(file_path, asan_path)
-            self.run_docker(cmd)
+            cmd = 'python3 /project/SURI/superSymbolizer/SuperAsan.py %s %s %s %s --optimization 3 --jobs %d'%(file_path, json_path , asan_path, asm_path, self.jobs)
+            if bStack:
+                cmd += ' --with-stack-poisoning'
         else:
-            file_path = '%s/%s'%(self.input_dir, self.filename)
-            asan_path = '%s/%s'%(self.output_dir, self.asan)
-            cmd = 'dotnet run -c Relase --project=%s/superCFGBuilder/superCFGBuilder %s %s asan'%(self.suri_dir, file_path, asan_path)
-            os.system(cmd)
+            cmd = 'python3 /project/SURI/superSymbolizer/SuperSymbolizer.py %s %s %s --optimization 3 --jobs %d '%(file_path, json_path , asm_path, self.jobs)
+        if self.stream_meta:
+            cmd += ' --stream-meta'
+        if self.stream_emit:
+            cmd += ' --stream-emit'
+        if self.profile:
+            cmd += ' --profile %d'%(self.profile)
+        if self.lean:
+            cmd += ' --lean'
+        if self.shards > 1:
+            cmd += ' --shards %d'%(self.shards)
+        if self.layout:
+            cmd += ' --layout /output/%s'%(self.layout_file)
+        return cmd
+
+    def get_compile_cmd(self, asm_path):
+        # the compiler command line in the Docker image
+        input_path = '/input/%s'%(self.filename)
+        output_path = '/output/%s'%(self.filename)
+        if self.shards > 1 and asm_path != '-':
+            asm_path = ' '.join(shard_paths(asm_path, self.shards))
+        cmd = 'python3 /project/SURI/superSymbolizer/CustomCompiler.py %s %s %s'%(input_path, asm_path, output_path)
+        if self.asan:
+            cmd += ' --asan'
+        return cmd
+
+    def create_symbolizer(self):
+        file_path = '%s/%s'%(self.input_dir, self.filename)
+        json_path = '%s/%s'%(self.output_dir, self.json)
+        if self.asan:
+            sym = SuperAsan.SuperAsan(file_path, json_path, 3, 'intel', self.stream_meta, self.profile,
+                                      layout=self.layout)
+            sym.read_asan_meta('%s/%s'%(self.output_dir, self.asan))
+        else:
+            sym = SuperSymbolizer.SuperSymbolizer(file_path, json_path, 3, 'intel', self.stream_meta, self.profile,
+                                                  self.lean, self.layout)
+        return sym
 
     def symbol_suri(self):
         if self.use_docker:
-            file_path = '/input/%s'%(self.filename)
-            json_path = '/output/%s'%(self.json)
-            asm_path = '/output/%s'%(self.asm)
-            cmd = 'python3 /project/SURI/superSymbolizer/SuperSymbolizer.py %s %s %s --optimization 3 '%(file_path, json_path , asm_path)
-            self.run_docker(cmd)
+            self.run_docker('symbolize', self.get_symbolize_cmd('/output/%s'%(self.asm), False))
         else:
-            file_path = '%s/%s'%(self.input_dir, self.filename)
-            json_path = '%s/%s'%(self.output_dir, self.json)
             asm_path = '%s/%s'%(self.output_dir, self.asm)
-            sym = SuperSymbolizer.SuperSymbolizer(file_path, json_path, 3, 'intel')
-            sym.symbolize(True)
-            sym.create_reassem_file(asm_path)
+            with self.runner.stage('symbolize'):
+                sym = self.create_symbolizer()
+                sym.symbolize(True, jobs=self.jobs, stream_emit=self.stream_emit)
+                sym.create_reassem_file(asm_path, shards=self.shards)
 
     def compile_suri(self):
         if self.use_docker:
-            input_path = '/input/%s'%(self.filename)
-            asm_path = '/output/%s'%(self.asm)
-            output_path = '/output/%s'%(self.filename)
-
-            if self.asan:
-                cmd = 'python3 /project/SURI/superSymbolizer/CustomCompiler.py %s %s %s --asan'%(input_path, asm_path, output_path)
-            else:
-                cmd = 'python3 /project/SURI/superSymbolizer/CustomCompiler.py %s %s %s'%(input_path, asm_path, output_path)
-
-            if self.verbose:
-                print(cmd)
-
-            self.run_docker(cmd)
+            self.run_docker('compile', self.get_compile_cmd('/output/%s'%(self.asm)))
         else:
             input_path = '%s/%s'%(self.input_dir, self.filename)
             asm_path = '%s/%s'%(self.output_dir, self.asm)
             output_path = '%s/%s'%(self.output_dir, self.filename)
+            if self.shards > 1:
+                asm_path = ['%s/%s'%(self.output_dir, asm) for asm in self.asm_files]
 
             if self.asan:
-                CustomCompiler.emitter(input_path, asm_path, output_path, asan=True)
+                CustomCompiler.emitter(input_path, asm_path, output_path, asan=True, runner=self.runner)
             else:
-                CustomCompiler.emitter(input_path, asm_path, output_path)
+                CustomCompiler.emitter(input_path, asm_path, output_path, runner=self.runner)
 
 
 
     def symbol_asan_suri(self, bStack):
         if self.use_docker:
-            file_path = '/input/%s'%(self.filename)
-            json_path = '/output/%s'%(self.json)
-            asan_path = '/output/%s'%(self.asan)
-            asm_path = '/output/%s'%(self.asm)
-            cmd = 'python3 /project/SURI/superSymbolizer/SuperAsan.py %s %s %s %s'%(file_path, json_path , asan_path, asm_path)
-
-            if bStack:
-                cmd += ' --with-stack-poisoning'
-            self.run_docker(cmd)
+            self.run_docker('symbolize', self.get_symbolize_cmd('/output/%s'%(self.asm), bStack))
         else:
-            file_path = '%s/%s'%(self.input_dir, self.filename)
-            json_path = '%s/%s'%(self.output_dir, self.json)
-            asan_path = '%s/%s'%(self.output_dir, self.asan)
             asm_path = '%s/%s'%(self.output_dir, self.asm)
-            sym = SuperAsan.SuperAsan(file_path, json_path, 3, 'intel')
-            sym.read_asan_meta(asan_path)
-            sym.symbolize(True)
-            if bStack:
-                sym.create_reassem_file(asm_path, True)
-            else:
-                sym.create_reassem_file(asm_path, False)
+            with self.runner.stage('symbolize'):
+                sym = self.create_symbolizer()
+                sym.symbolize(True, jobs=self.jobs, stream_emit=self.stream_emit)
+                if bStack:
+                    sym.create_reassem_file(asm_path, True, self.shards)
+                else:
+                    sym.create_reassem_file(asm_path, False, self.shards)
+
+    def pipe_suri(self, bStack):
+        '''
+        Symbolize and compile without writing the assembly to disk first:
+        gcc reads it from a pipe while it is printed. With keep_asm the
+        assembly file is written as well.
+        '''
+        if self.use_docker:
+            cmd = self.get_symbolize_cmd('-', bStack)
+            if self.keep_asm:
+                cmd += ' | tee /output/%s'%(self.asm)
+            cmd += ' | ' + self.get_compile_cmd('-')
+            self.run_docker('rewrite', cmd)
+            return
 
+        input_path = '%s/%s'%(self.input_dir, self.filename)
+        asm_path = '%s/%s'%(self.output_dir, self.asm)
+        output_path = '%s/%s'%(self.output_dir, self.filename)
+        with self.runner.stage('symbolize'):
+            sym = self.create_symbolizer()
+            sym.symbolize(True, jobs=self.jobs, stream_emit=self.stream_emit)
+        sym.profile_file = os.path.splitext(asm_path)[0] + '.profile.json'
+
+        def write_asm(fd):
+            targets = [fd]
+            if self.keep_asm:
+                targets.append(asm_path)
+            if self.asan:
+                sym.create_reassem_file(targets, bStack)
+            else:
+                sym.create_reassem_file(targets)
 
+        CustomCompiler.emitter(input_path, None, output_path, asan=bool(self.asan), runner=self.runner,
+                               write_asm=write_asm)
 
     def run(self, bCompile, bStack):
+        '''
+        Run the pipeline and return its status: 'ok', or the first stage
+        that did not produce its output. self.runner records every stage.
+        '''
         json_path = '%s/%s'%(self.output_dir, self.json)
-        asm_path = '%s/%s'%(self.output_dir, self.asm)
         my_path = '%s/%s'%(self.output_dir, self.myfile)
 
         self.cfg_suri()
 
         if not os.path.exists(json_path):
-            return
+            return 'cfg'
 
         if self.asan:
-            self.asan_suri()
-
-            self.symbol_asan_suri(bStack)
-            if not os.path.exists(asm_path):
-                return
+            if not os.path.exists('%s/%s'%(self.output_dir, self.asan)):
+                return 'cfg'
 
+        if self.pipe_asm and bCompile:
+            return self.run_pipe(bStack)
 
+        if self.asan:
+            self.symbol_asan_suri(bStack)
         else:
             self.symbol_suri()
-            if not os.path.exists(asm_path):
-                return
 
-        print('[+] Generate assembly file: %s'%(self.asm))
+        for asm in self.asm_files:
+            if not os.path.exists('%s/%s'%(self.output_dir, asm)):
+                return 'symbolize'
+
+        print('[+] Generate assembly file: %s'%(', '.join(self.asm_files)))
 
         if bCompile:
             if os.path.exists(my_path):
@@ -159,13 +295,133 @@ class SURI:
 
             self.compile_suri()
 
-            if os.path.exists(my_path):
-                print('[+] Generate rewritten binary: %s'%(my_path))
+            if not os.path.exists(my_path):
+                return 'compile'
+            print('[+] Generate rewritten binary: %s'%(my_path))
+
+        return 'ok'
+
+    def run_pipe(self, bStack):
+        asm_path = '%s/%s'%(self.output_dir, self.asm)
+        my_path = '%s/%s'%(self.output_dir, self.myfile)
+        if os.path.exists(my_path):
+            os.remove(my_path)
+        # do not mistake an assembly file of an earlier run for this one
+        if os.path.exists(asm_path):
+            os.remove(asm_path)
+
+        self.pipe_suri(bStack)
+
+        if not os.path.exists(my_path):
+            failed = self.runner.failed()
+            if failed and failed[0] in ['symbolize', 'rewrite']:
+                return 'symbolize'
+            return 'compile'
+        if self.keep_asm:
+            print('[+] Generate assembly file: %s'%(self.asm))
+        print('[+] Generate rewritten binary: %s'%(my_path))
+        return 'ok'
+
+
+def read_manifest(manifest):
+    '''
+    One binary per line; blank lines and lines starting with '#' are
+    skipped. Relative paths are relative to the manifest.
+    '''
+    base_dir = os.path.dirname(os.path.abspath(manifest))
+    targets = []
+    with open(manifest) as fd:
+        for line in fd:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            targets.append(os.path.normpath(os.path.join(base_dir, line)))
+    return targets
+
+def get_batch_dirs(targets, out_dir):
+    # binaries of the same name get their own output directories
+    dirs = []
+    used = set()
+    for target in targets:
+        name = os.path.basename(target)
+        path = os.path.join(out_dir, name)
+        idx = 1
+        while path in used:
+            path = os.path.join(out_dir, '%s.%d'%(name, idx))
+            idx += 1
+        used.add(path)
+        dirs.append(path)
+    return dirs
+
+def _batch_worker(task):
+    idx, target, out_dir, options, bCompile, bStack = task
+    result = {'target':target, 'output_dir':out_dir}
+    start = time.perf_counter()
+    try:
+        os.makedirs(out_dir, exist_ok=True)
+        # pool workers cannot fork a symbolization pool of their own
+        suri = SURI(target, out_dir, jobs=1, **options)
+        try:
+            result['status'] = suri.run(bCompile, bStack)
+        finally:
+            result.update(suri.runner.get_report())
+    except Exception as e:
+        result['status'] = 'error'
+        result['error'] = '%s: %s'%(type(e).__name__, e)
+    result['elapsed'] = time.perf_counter() - start
+    return idx, result
+
+def run_batch(manifest, out_dir, jobs, options, bCompile, bStack, report_file):
+    '''
+    Rewrite every binary listed in manifest with a pool of jobs workers.
+    Each worker takes one binary through CFG recovery, symbolization and
+    compilation, so the stages of different binaries overlap. All workers
+    share one superCFGBuilder server, which is started here unless one is
+    already listening and builds the CFGs of the workers concurrently, and
+    the metadata cache.
+    '''
+    targets = read_manifest(manifest)
+    dirs = get_batch_dirs(targets, out_dir)
+
+    builder = CFGBuilder.CFGBuilder(os.path.dirname(os.path.realpath(__file__)), options['builder_socket'])
+    own_server = False
+    if not options['use_docker'] and not builder.is_running():
+        if builder.start_server():
+            own_server = True
+        else:
+            print('[-] Failed to start superCFGBuilder server; running it once per binary')
+
+    tasks = [(idx, target, dirs[idx], options, bCompile, bStack) for idx, target in enumerate(targets)]
+    results = [None] * len(tasks)
+    start = time.perf_counter()
+    try:
+        # a fresh worker per binary returns the memory of the last one
+        with multiprocessing.Pool(max(jobs, 1), maxtasksperchild=1) as pool:
+            for idx, result in pool.imap_unordered(_batch_worker, tasks):
+                results[idx] = result
+                if result['status'] == 'ok':
+                    print('[+] %s: ok (%.1fs)'%(result['target'], result['elapsed']))
+                else:
+                    print('[-] %s: %s'%(result['target'], result.get('error', 'failed at ' + result['status'])))
+    finally:
+        if own_server:
+            builder.stop_server()
+
+    report = {'manifest':os.path.abspath(manifest),
+              'jobs':jobs,
+              'elapsed':time.perf_counter() - start,
+              'succeeded':sum(1 for result in results if result['status'] == 'ok'),
+              'failed':sum(1 for result in results if result['status'] != 'ok'),
+              'binaries':results}
+    with open(report_file, 'w') as fd:
+        json.dump(report, fd, indent=2)
+    print('[+] %d/%d binaries rewritten; report: %s'%(report['succeeded'], len(results), report_file))
+    return report['failed'] == 0
 
 import argparse
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='SURI')
-    parser.add_argument('target', type=str, help='Target Binary')
+    parser.add_argument('target', type=str, nargs='?', help='Target Binary')
     parser.add_argument('--ofolder', type=str, help='Output Dir')
     parser.add_argument('--asan', action='store_true')
     parser.add_argument('--usedocker', action='store_true')
@@ -173,10 +429,61 @@ if __name__ == '__main__':
     parser.add_argument('--metafile', type=str)
     parser.add_argument('--without-compile', action='store_false', dest='bCompile')
     parser.add_argument('--with-stack-poisoning', action='store_true', dest='bStack')
+    parser.add_argument('--jobs', type=int, default=1, help='Number of processes for symbolization, or binaries rewritten at once with --batch')
+    parser.add_argument('--stream-meta', action='store_true', dest='stream_meta', help='Decode the superset CFG one function at a time')
+    parser.add_argument('--stream-emit', action='store_true', dest='stream_emit', help='Symbolize each function while printing it and drop it afterwards')
+    parser.add_argument('--packed-meta', action='store_true', dest='packed_meta', help='Exchange the metadata in the compact MessagePack format')
+    parser.add_argument('--no-cache', action='store_false', dest='cache', help='Always rerun superCFGBuilder')
+    parser.add_argument('--cache-dir', type=str, default=MetaCache.DEFAULT_CACHE_DIR, help='Cache directory for superCFGBuilder results')
+    parser.add_argument('--cache-size', type=int, default=MetaCache.DEFAULT_CACHE_SIZE, help='Cache size limit in MiB')
+    parser.add_argument('--builder-socket', type=str, default=CFGBuilder.DEFAULT_SOCKET, help='Socket of a running superCFGBuilder server')
+    parser.add_argument('--profile', type=int, nargs='?', const=20, default=0, metavar='N',
+                        help='Time the symbolization phases and list the N slowest functions (default 20) in <binary>.profile.json')
+    parser.add_argument('--lean', action='store_true', help='Emit no comments in the reassembly file')
+    parser.add_argument('--pipe-asm', action='store_true', dest='pipe_asm', help='Feed the assembly to gcc through a pipe instead of a file')
+    parser.add_argument('--keep-asm', action='store_true', dest='keep_asm', help='With --pipe-asm, also write the assembly file')
+    parser.add_argument('--shards', type=int, default=1, metavar='N', help='Split the assembly into N files along function boundaries and assemble them in parallel')
+    parser.add_argument('--layout', type=str, metavar='PROFILE', help='Print the hot functions of this execution profile of the target first (lines of "<addr> [count]")')
+    parser.add_argument('--batch', type=str, metavar='MANIFEST', help='Rewrite every binary listed in MANIFEST')
+    parser.add_argument('--report', type=str, help='Write the status, time and memory use of every stage to this JSON file (default with --batch: <ofolder>/batch.json)')
 
     args = parser.parse_args()
 
-    target = os.path.abspath(args.target)
+    if not args.target and not args.batch:
+        parser.error('either target or --batch is required')
+    if args.lean and args.asan:
+        # SuperAsan finds the original instructions by their comments
+        parser.error('--lean is not supported with --asan')
+    if args.shards > 1 and args.pipe_asm:
+        parser.error('--shards is not supported with --pipe-asm')
+    if args.layout and args.batch:
+        # a profile belongs to one binary
+        parser.error('--layout is not supported with --batch')
+
+    cache = None
+    if args.cache:
+        builder_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'superCFGBuilder')
+        # in Docker, the builder is the one of the image, not of this tree
+        builder_image = DOCKER_IMAGE if args.usedocker else None
+        cache = MetaCache.MetaCache(builder_dir, args.cache_dir, args.cache_size << 20, builder_image)
+
+    if args.batch:
+        out_dir = os.path.abspath(args.ofolder or os.getcwd())
+        report_file = args.report or os.path.join(out_dir, 'batch.json')
+        options = {'asan':args.asan, 'use_docker':args.usedocker, 'verbose':args.verbose,
+                   'metafile':None, 'stream_meta':args.stream_meta, 'packed_meta':args.packed_meta,
+                   'cache':cache, 'builder_socket':args.builder_socket, 'profile':args.profile,
+                   'lean':args.lean, 'pipe_asm':args.pipe_asm, 'keep_asm':args.keep_asm, 'shards':args.shards,
+                   'stream_emit':args.stream_emit}
+        os.makedirs(out_dir, exist_ok=True)
+        ok = run_batch(args.batch, out_dir, args.jobs, options, args.bCompile, args.bStack, report_file)
+        sys.exit(0 if ok else 1)
 
-    suri = SURI(target, args.ofolder, args.asan, args.usedocker, args.verbose, args.metafile)
-    suri.run(args.bCompile, args.bStack)
+    target = os.path.abspath(args.target)
+    suri = SURI(target, args.ofolder, args.asan, args.usedocker, args.verbose, args.metafile, args.jobs, args.stream_meta, args.packed_meta, cache, args.builder_socket, args.profile, args.lean, args.pipe_asm, args.keep_asm, args.shards, args.stream_emit, os.path.abspath(args.layout) if args.layout else None)
+    status = 'error'
+    try:
+        status = suri.run(args.bCompile, args.bStack)
+    finally:
+        if args.report:
+            suri.runner.write_report(args.report, target=target, status=status)
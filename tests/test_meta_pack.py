@@ -0,0 +1,68 @@
+'''
+The packed metadata decodes to the same dictionaries as the JSON metadata
+it was converted from. The metadata is that of the generated benchmark
+programs (bench/meta_gen.py), so the test needs gcc-11/g++-11.
+'''
+import json
+import os
+import sys
+
+import pytest
+
+pytest.importorskip('msgpack')
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'bench'))
+
+from cases import CASES
+from superSymbolizer.lib.MetaPack import PackedMetaReader, is_packed_meta, pack_meta
+from superSymbolizer.lib.MetaReader import load_asan_meta, load_meta
+
+# a few dozen functions of every case
+SCALE = 0.02
+
+
+def build_case(name, work_dir):
+    case = [case for case in CASES if case.name == name][0]
+    compiler = '/usr/bin/gcc-11' if case.lang == 'c' else '/usr/bin/g++-11'
+    if not os.path.exists(compiler):
+        pytest.skip('%s is not installed'%(compiler))
+    bin_file, meta_file, _ = case.build(work_dir, SCALE)
+    return meta_file
+
+def make_asan_meta(data):
+    # an access record for every instruction with a memory operand
+    asan = []
+    for fun_addr, fun_info in data['FunDict'].items():
+        inst_list = [{'Addr':inst['Addr'], 'MemAccType':'R', 'MemAccSize':[64, 0]}
+                     for bbl in fun_info['BBLs'].values() for inst in bbl['Code']
+                     if '[' in inst['Disassem']]
+        asan.append({'Addr':fun_addr, 'InstList':inst_list})
+    return asan
+
+
+@pytest.mark.parametrize('name', [case.name for case in CASES])
+def test_cfg_round_trip(name, tmp_path):
+    meta_file = build_case(name, str(tmp_path))
+    packed_file = str(tmp_path / 'meta.msgpack')
+    data = load_meta(meta_file)
+    pack_meta(data, packed_file)
+
+    assert is_packed_meta(packed_file)
+    assert not is_packed_meta(meta_file)
+    assert load_meta(packed_file) == data
+    # the functions are streamed in the order of the JSON file
+    reader = PackedMetaReader(packed_file)
+    assert list(reader.iter_fun_dict()) == list(data['FunDict'].items())
+    assert os.path.getsize(packed_file) < os.path.getsize(meta_file)
+
+def test_asan_round_trip(tmp_path):
+    data = load_meta(build_case('functions', str(tmp_path)))
+    json_file = str(tmp_path / 'asan.json')
+    packed_file = str(tmp_path / 'asan.msgpack')
+    with open(json_file, 'w') as fd:
+        json.dump(make_asan_meta(data), fd)
+    asan = load_asan_meta(json_file)
+    pack_meta(asan, packed_file)
+
+    assert load_asan_meta(packed_file) == asan